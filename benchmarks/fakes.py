@@ -0,0 +1,239 @@
+import io
+import os
+import re
+import json
+import glob
+import time
+import wave
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+# Gemini(GenerativeModel, embed_content, 파일 업로드)와 Google TTS 클라이언트를 대신하는 결정적 가짜 구현.
+# 응답 내용은 output/ 에 남아 있는 실제 산출물(씬 스크립트, 나레이션, OCR 텍스트, MP3)에서 만들고,
+# 호출마다 설정한 지연을 주며 error_rate 확률로 재시도 대상 오류(503)를 낸다.
+
+class ServiceUnavailable(Exception):
+    """rate_limit_utils.is_retryable_api_error가 이름으로 재시도 대상으로 판별하는 오류."""
+
+class FakeLatency:
+    def __init__(self, mean_seconds=0.0, jitter=0.3, error_rate=0.0, seed=0):
+        self.mean_seconds = mean_seconds
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, what):
+        """지연을 흉내 내고, 확률적으로 일시적 오류를 던진다."""
+        with self._lock:
+            delay = max(0.0, self.mean_seconds * (1 + self._random.uniform(-self.jitter, self.jitter)))
+            fail = self._random.random() < self.error_rate
+        time.sleep(delay)
+        if fail:
+            raise ServiceUnavailable(f"503 fake {what} error")
+
+def _stable_index(key, count):
+    return int(hashlib.sha256(key.encode("utf-8", "replace")).hexdigest(), 16) % count
+
+class ArtifactFixtures:
+    """output/ 폴더의 기존 산출물. 상품명은 씬 스크립트 파일명에서 얻는다."""
+
+    def __init__(self, output_dir):
+        texts_dir = os.path.join(output_dir, "extracted_texts")
+        self.scene_scripts = {}
+        self.narrations = {}
+        for script_path in sorted(glob.glob(os.path.join(texts_dir, "*_scene_script.json"))):
+            base_name = os.path.basename(script_path)[:-len("_scene_script.json")].replace("_", " ")
+            with open(script_path, "r", encoding="utf-8") as f:
+                self.scene_scripts[base_name] = json.load(f)
+            narration_path = script_path.replace("_scene_script.json", "_initial_narration.txt")
+            if os.path.exists(narration_path):
+                with open(narration_path, "r", encoding="utf-8") as f:
+                    self.narrations[base_name] = f.read().strip()
+        ocr_path = os.path.join(texts_dir, "ocr_extracted_texts.txt")
+        self.ocr_lines = []
+        if os.path.exists(ocr_path):
+            with open(ocr_path, "r", encoding="utf-8") as f:
+                self.ocr_lines = [line.strip() for line in f if line.strip()]
+        self.audio_clips = []
+        for mp3_path in sorted(glob.glob(os.path.join(output_dir, "audio_clips", "*.mp3"))):
+            with open(mp3_path, "rb") as f:
+                self.audio_clips.append(f.read())
+        self.image_paths = sorted(glob.glob(os.path.join(output_dir, "images_raw", "*.jpg")))
+        if not self.scene_scripts or not self.audio_clips:
+            raise ValueError(f"'{output_dir}'에 씬 스크립트(*_scene_script.json)와 MP3 픽스처가 필요합니다.")
+
+    @property
+    def product_names(self):
+        return list(self.scene_scripts)
+
+    def base_name_for(self, text):
+        """프롬프트에 들어 있는 상품명으로 픽스처를 고른다 ('... 001' 처럼 번호가 붙어 있어도 됨)."""
+        for base_name in self.scene_scripts:
+            if base_name in text:
+                return base_name
+        return self.product_names[_stable_index(text, len(self.product_names))]
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeGenerativeModel:
+    """google.generativeai.GenerativeModel 대체. 프롬프트 모양으로 호출 종류(OCR/캡션/나레이션/씬 스크립트/
+    스토리보드/씬별 이미지 추천)를 구분해 그럴듯한 응답을 만든다."""
+
+    def __init__(self, model_name, fixtures, latency):
+        self.model_name = model_name
+        self._fixtures = fixtures
+        self._latency = latency
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        parts = contents if isinstance(contents, list) else [contents]
+        prompt = "".join(part for part in parts if isinstance(part, str))
+        image_parts = [part for part in parts if not isinstance(part, str)]
+        self._latency.wait("gemini")
+        if "2차원 박스 좌표" in prompt:
+            return _FakeResponse(self._ocr_response(image_parts))
+        if "핵심 태그" in prompt:
+            return _FakeResponse("상품 사진입니다. 음식, 상품, 클로즈업")
+        if "스토리보드" in prompt:
+            return _FakeResponse(self._storyboard_response(prompt))
+        if "한 장면(Scene" in prompt:
+            return _FakeResponse(self._recommend_response(prompt))
+        if "씬별 스크립트" in prompt:
+            return _FakeResponse(self._scene_script_response(prompt))
+        return _FakeResponse(self._fixtures.narrations.get(self._fixtures.base_name_for(prompt), prompt[:200]))
+
+    def _ocr_response(self, image_parts):
+        lines = self._fixtures.ocr_lines or ["상품 상세 정보"]
+        payload = repr(image_parts[0])[:200] if image_parts else ""
+        if image_parts and isinstance(image_parts[0], dict) and "data" in image_parts[0]:
+            payload = hashlib.sha256(image_parts[0]["data"]).hexdigest()
+        start = _stable_index(payload, len(lines))
+        items = [{"box_2d": [100 + 80 * i, 50, 160 + 80 * i, 950], "label": lines[(start + i) % len(lines)]}
+                 for i in range(min(4, len(lines)))]
+        return json.dumps(items, ensure_ascii=False)
+
+    def _scene_script_response(self, prompt):
+        product_name = re.search(r"'([^']+)' 상품", prompt)
+        product_name = product_name.group(1) if product_name else ""
+        scenes = json.loads(json.dumps(self._fixtures.scene_scripts[self._fixtures.base_name_for(prompt)]))
+        for scene in scenes: # 상품마다 나레이션이 달라야 TTS 캐시가 상품 간에 공유되지 않는다
+            scene["narration"] = f"{scene.get('narration', '')} {product_name}".strip()
+        return "```json\n" + json.dumps(scenes, ensure_ascii=False) + "\n```"
+
+    def _storyboard_response(self, prompt):
+        filenames = re.findall(r"이미지 파일명: (\S+)", prompt)
+        scene_numbers = re.findall(r"- Scene (\d+):", prompt)
+        storyboard = [{"scene_number": int(number),
+                       "candidates": [filenames[(idx + k) % len(filenames)] for k in range(min(3, len(filenames)))]}
+                      for idx, number in enumerate(scene_numbers)] if filenames else []
+        return json.dumps(storyboard)
+
+    def _recommend_response(self, prompt):
+        filenames = re.findall(r"이미지 \d+ 파일명: (\S+)", prompt)
+        used = re.search(r"이전에 이미 사용되었습니다: \[([^\]]*)\]", prompt)
+        used = {name.strip() for name in used.group(1).split(",")} if used else set()
+        for filename in filenames:
+            if filename not in used:
+                return filename
+        return filenames[0] if filenames else "없음"
+
+def make_fake_embed_content(latency, dimensions=64):
+    """google.generativeai.embed_content 대체. 텍스트 해시로 정해지는 벡터를 돌려준다."""
+    def fake_embed_content(model, content, task_type=None, **kwargs):
+        latency.wait("embedding")
+        texts = content if isinstance(content, list) else [content]
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).standard_normal(dimensions).tolist())
+        return {"embedding": vectors if isinstance(content, list) else vectors[0]}
+    return fake_embed_content
+
+class FakeTextToSpeechClient:
+    """texttospeech.TextToSpeechClient (v1 / v1beta1) 대체.
+    일반 요청은 텍스트 해시로 고른 픽스처 MP3를, SSML 요청은 글자 수에 비례한 길이의 무음 WAV와 <mark> 시점을 돌려준다."""
+
+    def __init__(self, fixtures, latency, seconds_per_char=0.06, sample_rate=24000):
+        self._fixtures = fixtures
+        self._latency = latency
+        self._seconds_per_char = seconds_per_char
+        self._sample_rate = sample_rate
+
+    def synthesize_speech(self, request=None, **kwargs):
+        request = request if request is not None else kwargs
+        synthesis_input = request["input"] if isinstance(request, dict) else request.input
+        ssml = getattr(synthesis_input, "ssml", "") or ""
+        self._latency.wait("tts")
+        if ssml:
+            return self._synthesize_ssml(ssml)
+        text = getattr(synthesis_input, "text", "") or ""
+        clip = self._fixtures.audio_clips[_stable_index(text, len(self._fixtures.audio_clips))]
+        return SimpleNamespace(audio_content=clip, timepoints=[])
+
+    def _synthesize_ssml(self, ssml):
+        timepoints, elapsed = [], 0.0
+        for chunk in re.split(r"(<mark name=\"[^\"]+\"\s*/>)", ssml):
+            mark = re.match(r"<mark name=\"([^\"]+)\"", chunk)
+            if mark:
+                timepoints.append(SimpleNamespace(mark_name=mark.group(1), time_seconds=elapsed))
+            else:
+                elapsed += len(re.sub(r"<[^>]+>", "", chunk).strip()) * self._seconds_per_char
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self._sample_rate)
+            out.writeframes(b"\0\0" * int(elapsed * self._sample_rate))
+        return SimpleNamespace(audio_content=buffer.getvalue(), timepoints=timepoints)
+
+class FakeFileStore:
+    """genai.upload_file / get_file / delete_file 대체. 업로드 지연만 흉내 내고 파일 핸들을 돌려준다."""
+
+    def __init__(self, latency):
+        self._latency = latency
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def upload_file(self, path, mime_type=None, display_name=None, **kwargs):
+        self._latency.wait("file upload")
+        with self._lock:
+            name = f"files/fake-{len(self._files) + 1}"
+            uploaded = SimpleNamespace(name=name, uri=f"https://fake.invalid/{name}", mime_type=mime_type,
+                                       display_name=display_name, size_bytes=os.path.getsize(path),
+                                       state=SimpleNamespace(name="ACTIVE"), expiration_time=None)
+            self._files[name] = uploaded
+        return uploaded
+
+    def get_file(self, name):
+        with self._lock:
+            return self._files[name]
+
+    def delete_file(self, name):
+        with self._lock:
+            self._files.pop(getattr(name, "name", name), None)
+
+def install_fakes(fixtures_dir, gemini_latency=1.0, tts_latency=0.4, error_rate=0.0, seed=0):
+    """현재 프로세스의 Gemini(생성/임베딩/파일 업로드) / TTS 진입점을 가짜로 바꾼다. 파이프라인 모듈을 import하기 전에 불러도 되고 후에 불러도 된다
+    (모듈들은 호출 시점에 genai.GenerativeModel / texttospeech.TextToSpeechClient를 찾는다)."""
+    import google.generativeai as genai
+    from google.cloud import texttospeech, texttospeech_v1beta1
+
+    fixtures = ArtifactFixtures(fixtures_dir)
+    seed_offset = os.getpid() # 워커 프로세스마다 오류 발생 순서가 겹치지 않도록
+    gemini = FakeLatency(gemini_latency, error_rate=error_rate, seed=seed + seed_offset)
+    tts = FakeLatency(tts_latency, error_rate=error_rate, seed=seed + seed_offset + 1)
+    genai.configure = lambda *args, **kwargs: None
+    genai.GenerativeModel = lambda model_name, *args, **kwargs: FakeGenerativeModel(model_name, fixtures, gemini)
+    genai.embed_content = make_fake_embed_content(gemini)
+    file_store = FakeFileStore(gemini)
+    genai.upload_file, genai.get_file, genai.delete_file = \
+        file_store.upload_file, file_store.get_file, file_store.delete_file
+    texttospeech.TextToSpeechClient = lambda *args, **kwargs: FakeTextToSpeechClient(fixtures, tts)
+    texttospeech_v1beta1.TextToSpeechClient = lambda *args, **kwargs: FakeTextToSpeechClient(fixtures, tts)
+    return fixtures
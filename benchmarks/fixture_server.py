@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from html import escape as html_escape
+
+# 벤치마크용 로컬 쇼핑몰. cafe24 상세 페이지와 같은 구조(.prd_name > span, div#prdDetail)의 정적 HTML과
+# 상세 이미지를 제공하므로 data_collector의 정적 HTML 경로가 그대로 동작한다 (Selenium 불필요).
+# 상품마다 이미지에 상품별 JPEG 주석(COM) 세그먼트를 넣어 내용 해시가 달라지게 한다 (상품 간 캐시 공유 방지, 디코딩 결과는 같음).
+
+_PRODUCT_PATH = re.compile(r"^/product/(\d+)/?$")
+_IMAGE_PATH = re.compile(r"^/images/(\d+)/([\w.\-]+)$")
+
+class FixtureShop:
+    def __init__(self, product_names, image_paths, images_per_product=8, page_latency=0.0, image_latency=0.0):
+        if not image_paths:
+            raise ValueError("벤치마크용 이미지 픽스처가 없습니다.")
+        self.product_names = list(product_names)
+        self.image_paths = sorted(image_paths)
+        self.images_per_product = max(1, min(images_per_product, len(self.image_paths)))
+        self.page_latency = page_latency
+        self.image_latency = image_latency
+        self._image_bytes = {}
+        self._server = None
+        self._thread = None
+
+    def product_images(self, product_idx):
+        """상품마다 픽스처 이미지 목록에서 시작 위치를 돌려가며 images_per_product개를 고른다."""
+        start = product_idx % len(self.image_paths)
+        rotated = self.image_paths[start:] + self.image_paths[:start]
+        return rotated[:self.images_per_product]
+
+    def product_url(self, product_idx):
+        return f"{self.base_url}/product/{product_idx}/"
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _render_page(self, product_idx):
+        image_tags = "".join(f'<img ec-data-src="/images/{product_idx}/{os.path.basename(path)}">'
+                             for path in self.product_images(product_idx))
+        name = html_escape(self.product_names[product_idx % len(self.product_names)])
+        return (f'<html><head><meta charset="utf-8"><title>{name}</title></head><body>'
+                f'<div class="prd_name"><span>{name}</span></div>'
+                f'<div id="prdDetail">{image_tags}</div></body></html>').encode("utf-8")
+
+    def _image_bytes_for(self, product_idx, filename):
+        by_name = {os.path.basename(path): path for path in self.product_images(product_idx)}
+        if filename not in by_name:
+            return None
+        if filename not in self._image_bytes:
+            with open(by_name[filename], "rb") as f:
+                self._image_bytes[filename] = f.read()
+        image_bytes = self._image_bytes[filename]
+        if not image_bytes.startswith(b"\xff\xd8"):
+            return image_bytes
+        comment = f"fixture-product-{product_idx}".encode("ascii")
+        return image_bytes[:2] + b"\xff\xfe" + (len(comment) + 2).to_bytes(2, "big") + comment + image_bytes[2:]
+
+    def _make_handler(self):
+        shop = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                product_match = _PRODUCT_PATH.match(self.path)
+                image_match = _IMAGE_PATH.match(self.path)
+                if product_match:
+                    time.sleep(shop.page_latency)
+                    self._send(200, "text/html; charset=utf-8", shop._render_page(int(product_match.group(1))))
+                    return
+                if image_match:
+                    time.sleep(shop.image_latency)
+                    body = shop._image_bytes_for(int(image_match.group(1)), image_match.group(2))
+                    if body is not None:
+                        self._send(200, "image/jpeg", body)
+                        return
+                self._send(404, "text/plain", b"not found")
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return _Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-shop", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from benchmarks.fixture_server import FixtureShop
+from benchmarks.fakes import ArtifactFixtures
+from utils.logging_utils import spans_outside
+
+# 네트워크/쿼터 없이 전체 파이프라인(run_ai_shorts_generator)의 처리량을 재는 벤치마크.
+#   python -m benchmarks.pipeline_benchmark --products 6 --concurrency 1 2 4 --output bench.json
+# 로컬 HTTP 서버가 상품 페이지/이미지를, benchmarks.fakes가 Gemini와 TTS를 대신한다 (지연/오류율 설정 가능).
+# 동시성 단계마다 새 출력 폴더(AI_SHORTS_OUTPUT_DIR)를 써서 캐시가 없는 상태에서 시작하고,
+# 상품별 작업 폴더의 trace.jsonl에서 단계별 소요 시간 / 최대 메모리 / 카운터를 모아 JSON 보고서로 남긴다.
+# 부모 프로세스는 config/main을 import하지 않는다 (출력 폴더가 import 시점에 정해지므로 워커에서만 import).
+
+PROJECT_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 2: 씬 작업 그래프의 렌더 작업이 stage.render로 집계됨 (1에서는 stage.tts에 섞여 단계별 수치를 비교할 수 없음)
+REPORT_VERSION = 2
+# 단계별 집계가 맞는지 확인할 span: (span 이름, 속해야 할 단계 span)
+_STAGE_ATTRIBUTION_CHECKS = (("render.segment", "stage.render"), ("render.audio_track", "stage.render"))
+_CONFIG_KNOBS = ("PIPELINE_SCHEDULER", "PIPELINE_MAX_WORKERS", "VIDEO_RENDER_ENGINE", "VIDEO_RESOLUTION", "VIDEO_FPS",
+                 "VIDEO_SEGMENT_MAX_WORKERS", "TTS_SYNTHESIS_MODE", "TTS_MAX_CONCURRENCY", "IMAGE_SELECTION_MODE",
+                 "IMAGE_RECOMMENDER_BACKEND", "OCR_MAX_CONCURRENCY", "IMAGE_DOWNLOAD_MAX_WORKERS")
+
+def _init_worker(output_dir, fake_settings):
+    # config는 import 시점에 출력 폴더를 정하므로 환경 변수를 먼저 설정
+    os.environ["AI_SHORTS_OUTPUT_DIR"] = output_dir
+    os.environ["GOOGLE_API_KEY_GEMINI"] = "benchmark-fake-key"
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = fake_settings["credentials_path"]
+    from benchmarks.fakes import install_fakes
+    install_fakes(fake_settings["fixtures_dir"], fake_settings["gemini_latency"], fake_settings["tts_latency"],
+                  fake_settings["error_rate"], fake_settings["seed"])
+    import main
+    main._init_batch_worker()
+
+def _run_product(target_url):
+    """워커에서 상품 하나를 처리하고, 작업 결과와 trace 파일에서 읽은 단계별 기록을 반환한다."""
+    import config
+    import main
+    job_result = main._run_batch_job(target_url)
+    job_root = os.path.dirname(job_result["log_path"])
+    stages, counters, span_records = {}, {}, []
+    trace_path = os.path.join(job_root, "trace.jsonl")
+    if os.path.exists(trace_path):
+        with open(trace_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "counters":
+                    counters = record["counters"]
+                    continue
+                span_records.append(record)
+                if record["name"].startswith("stage."):
+                    stages[record["name"][len("stage."):]] = {
+                        "seconds": record["duration_seconds"], "peak_rss_kb": record["peak_rss_kb"],
+                        "reused": bool(record["attrs"].get("reused")), "counters": record["counters"]}
+    misattributed = [f"{record['name']}#{record['span_id']} (⊄ {stage_name})"
+                     for span_name, stage_name in _STAGE_ATTRIBUTION_CHECKS
+                     for record in spans_outside(span_records, span_name, stage_name)]
+    job_result.update(stages=stages, counters=counters, misattributed_spans=misattributed,
+                      config={name: getattr(config, name, None) for name in _CONFIG_KNOBS})
+    return job_result
+
+def percentile(values, pct):
+    """nearest-rank 백분위수. 값이 없으면 None."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100)) # ceil(n * pct / 100)
+    return round(ordered[int(rank) - 1], 3)
+
+def _summarize_level(concurrency, job_results, wall_seconds):
+    succeeded = [r for r in job_results if r["status"] == "success"]
+    # 단계 귀속이 틀린 작업은 단계별 수치에서 뺀다 (작업 전체 시간/처리량에는 포함)
+    attributed = [r for r in job_results if not r.get("misattributed_spans")]
+    stage_names = []
+    for result in attributed:
+        stage_names.extend(name for name in result["stages"] if name not in stage_names)
+    stages = {}
+    for name in stage_names:
+        records = [r["stages"][name] for r in attributed if name in r["stages"]]
+        seconds = [rec["seconds"] for rec in records if rec["seconds"] is not None]
+        rss = [rec["peak_rss_kb"] for rec in records if rec["peak_rss_kb"]]
+        stages[name] = {"count": len(records), "p50_seconds": percentile(seconds, 50),
+                        "p95_seconds": percentile(seconds, 95), "peak_rss_kb": max(rss) if rss else None}
+    totals = [r["elapsed_seconds"] for r in job_results]
+    counters = {}
+    for result in job_results:
+        for name, value in result["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+    return {
+        "concurrency": concurrency,
+        "products": len(job_results),
+        "succeeded": len(succeeded),
+        "failed": len(job_results) - len(succeeded),
+        "wall_seconds": round(wall_seconds, 2),
+        "products_per_hour": round(len(succeeded) * 3600 / wall_seconds, 1) if wall_seconds > 0 else None,
+        "job_p50_seconds": percentile(totals, 50),
+        "job_p95_seconds": percentile(totals, 95),
+        "peak_rss_kb": max((s["peak_rss_kb"] for s in stages.values() if s["peak_rss_kb"]), default=None),
+        "stages": stages,
+        "stage_excluded_jobs": len(job_results) - len(attributed),
+        "misattributed_spans": [span for r in job_results for span in r.get("misattributed_spans", [])],
+        "counters": counters,
+        "errors": [{"target_url": r["target_url"], "error": r.get("error"), "log_path": r.get("log_path")}
+                   for r in job_results if r["status"] != "success"],
+    }
+
+def run_level(shop, product_count, concurrency, work_dir, fake_settings):
+    """동시성 한 단계를 빈 출력 폴더에서 실행한다. (요약, 워커가 읽은 config 값) 반환."""
+    output_dir = os.path.join(work_dir, f"concurrency_{concurrency}")
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    target_urls = [shop.product_url(idx) for idx in range(product_count)]
+    print(f"\n=== 동시성 {concurrency}: 상품 {product_count}개 ===")
+    job_results = []
+    started_at = time.perf_counter()
+    # fork 대신 spawn: 워커마다 config/main을 새 환경 변수로 import해야 함
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(output_dir, fake_settings)) as executor:
+        futures = {executor.submit(_run_product, url): url for url in target_urls}
+        for future in as_completed(futures):
+            try:
+                job_result = future.result()
+            except Exception as e: # 워커 프로세스 자체가 죽은 경우
+                job_result = {"target_url": futures[future], "status": "failed", "error": f"{type(e).__name__}: {e}",
+                              "elapsed_seconds": 0, "stages": {}, "counters": {}, "config": {}}
+            job_results.append(job_result)
+            status_icon = "✅" if job_result["status"] == "success" else "❌"
+            print(f"  {status_icon} [{len(job_results)}/{product_count}] {job_result['target_url']} "
+                  f"({job_result['elapsed_seconds']:.1f} 초)")
+    wall_seconds = time.perf_counter() - started_at
+    config_values = next((r["config"] for r in job_results if r["config"]), {})
+    return _summarize_level(concurrency, job_results, wall_seconds), config_values
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_ROOT_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def print_report(report):
+    for level in report["levels"]:
+        print(f"\n--- 동시성 {level['concurrency']}: {level['succeeded']}/{level['products']} 성공, "
+              f"{level['wall_seconds']:.1f} 초, 시간당 {level['products_per_hour']} 상품 ---")
+        for name, stage in level["stages"].items():
+            rss = f"{stage['peak_rss_kb'] / 1024:.0f} MB" if stage["peak_rss_kb"] else "-"
+            print(f"  {name:<13} p50 {stage['p50_seconds']:8.2f} 초  p95 {stage['p95_seconds']:8.2f} 초  최대 메모리 {rss}")
+        print(f"  {'(작업 전체)':<13} p50 {level['job_p50_seconds']:8.2f} 초  p95 {level['job_p95_seconds']:8.2f} 초")
+        if level["stage_excluded_jobs"]:
+            print(f"  ⚠️ 작업 {level['stage_excluded_jobs']}개는 단계 집계가 틀려 단계별 수치에서 제외했습니다: "
+                  f"{', '.join(level['misattributed_spans'][:5])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="로컬 스텁(쇼핑몰, Gemini, TTS)으로 파이프라인 처리량을 측정합니다.")
+    parser.add_argument("--products", type=int, default=4, help="동시성 단계마다 처리할 상품 수")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4], help="동시 처리 상품 수 (여러 개 가능)")
+    parser.add_argument("--images-per-product", type=int, default=8)
+    parser.add_argument("--fixtures-dir", default=os.path.join(PROJECT_ROOT_DIR, "output"),
+                        help="씬 스크립트/MP3/이미지 픽스처를 읽을 폴더 (기본값: output/)")
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Gemini 호출당 평균 지연(초)")
+    parser.add_argument("--tts-latency", type=float, default=0.4, help="TTS 호출당 평균 지연(초)")
+    parser.add_argument("--http-latency", type=float, default=0.05, help="페이지/이미지 응답 지연(초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Gemini/TTS 호출의 일시적 오류(503) 비율")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="출력 폴더 위치 (기본값: 임시 폴더, 끝나면 삭제)")
+    parser.add_argument("--output", help="보고서 JSON 경로 (버전 간 비교용)")
+    args = parser.parse_args()
+
+    fixtures = ArtifactFixtures(args.fixtures_dir)
+    if not fixtures.image_paths:
+        parser.error(f"'{args.fixtures_dir}/images_raw'에 이미지 픽스처가 없습니다.")
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ai_shorts_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    credentials_path = os.path.join(work_dir, "fake_credentials.json") # TTS 인증 확인용 빈 파일
+    with open(credentials_path, "w", encoding="utf-8") as f:
+        f.write("{}")
+    fake_settings = {"fixtures_dir": args.fixtures_dir, "credentials_path": credentials_path,
+                     "gemini_latency": args.gemini_latency, "tts_latency": args.tts_latency,
+                     "error_rate": args.error_rate, "seed": args.seed}
+    product_names = [f"{fixtures.product_names[idx % len(fixtures.product_names)]} {idx + 1:03d}"
+                     for idx in range(args.products)]
+    shop = FixtureShop(product_names, fixtures.image_paths, args.images_per_product,
+                       page_latency=args.http_latency, image_latency=args.http_latency).start()
+    report = {"version": REPORT_VERSION, "git_commit": _git_commit(),
+              "created_at": time.strftime("%Y-%m-%d %H:%M:%S"), "python": sys.version.split()[0],
+              "cpu_count": os.cpu_count(),
+              "settings": {key: value for key, value in vars(args).items() if key not in ("work_dir", "output")},
+              "config": {}, "levels": []}
+    try:
+        for concurrency in args.concurrency:
+            level, config_values = run_level(shop, args.products, concurrency, work_dir, fake_settings)
+            report["levels"].append(level)
+            report["config"] = report["config"] or config_values
+    finally:
+        shop.stop()
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n보고서 저장: {args.output}")
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -8,34 +8,97 @@ PROJECT_ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 GOOGLE_API_KEY_GEMINI = os.getenv("GOOGLE_API_KEY_GEMINI")
 GCP_SERVICE_ACCOUNT_KEY_PATH = os.path.join(PROJECT_ROOT_DIR, "credentials", "project-team3-459012-0595dc85efb1.json") # 실제 파일명으로 수정
 
-OUTPUT_DIR = os.path.join(PROJECT_ROOT_DIR, "output")
+OUTPUT_DIR = os.getenv("AI_SHORTS_OUTPUT_DIR") or os.path.join(PROJECT_ROOT_DIR, "output") # 벤치마크 등에서 출력/캐시 폴더를 분리할 때 환경 변수로 지정
 IMAGES_RAW_FOLDER = os.path.join(OUTPUT_DIR, "images_raw")
 EXTRACTED_TEXTS_FOLDER = os.path.join(OUTPUT_DIR, "extracted_texts")
 AUDIO_CLIPS_FOLDER = os.path.join(OUTPUT_DIR, "audio_clips")
 VIDEOS_FOLDER = os.path.join(OUTPUT_DIR, "videos")
+JOBS_DIR = os.path.join(OUTPUT_DIR, "jobs") # 작업(상품)별 독립 작업 폴더
+BATCH_SUMMARY_FOLDER = os.path.join(OUTPUT_DIR, "batch_summaries")
+CACHE_DIR = os.path.join(OUTPUT_DIR, "cache")
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "images") # URL/콘텐츠 해시 기반 이미지 블롭 저장소
+OCR_CACHE_PATH = os.path.join(CACHE_DIR, "ocr_cache.sqlite3") # 이미지 해시/모델/프롬프트 버전별 OCR 결과
+IMAGE_CAPTION_CACHE_PATH = os.path.join(CACHE_DIR, "image_captions.sqlite3") # 이미지 캡션과 임베딩 벡터
+TTS_AUDIO_CACHE_PATH = os.path.join(CACHE_DIR, "tts_audio.sqlite3") # 텍스트/목소리/속도/인코딩별 음성 클립과 길이
+VIDEO_SEGMENT_CACHE_DIR = os.path.join(CACHE_DIR, "segments") # 입력 지문별로 인코딩된 씬 영상 세그먼트
 
 USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
 SELENIUM_WAIT_TIMEOUT = 20
+SELENIUM_POOL_SIZE = 2 # 재사용할 headless Chrome 세션 수
+SELENIUM_RECYCLE_AFTER_PAGES = 20 # 세션 하나가 이만큼 페이지를 처리하면 새로 띄움
+SELENIUM_BLOCKED_URL_PATTERNS = [ # 브라우저 경로에서 차단할 리소스 (폰트, CSS, 미디어)
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.css",
+    "*.mp4", "*.webm", "*.mp3", "*.ogg", "*.m3u8",
+]
+STATIC_HTML_FAST_PATH = True # 정적 HTML로 충분하면 Selenium을 띄우지 않음
 IMAGE_DOWNLOAD_TIMEOUT = 15
+IMAGE_DOWNLOAD_MAX_WORKERS = 8 # 동시에 진행할 이미지 다운로드 수
+IMAGE_DOWNLOAD_PER_HOST_LIMIT = 4 # 같은 호스트에 대한 동시 요청 상한
+IMAGE_CACHE_REVALIDATE_AFTER_SECONDS = 6 * 60 * 60 # 이 시간 내에 확인된 URL은 재검증 없이 캐시 사용
 
 GEMINI_VISION_MODEL_NAME = 'gemini-1.5-flash' # OCR 및 이미지 추천에 사용
 GEMINI_TEXT_MODEL_NAME = 'gemini-1.5-flash'   # 나레이션 및 씬 스크립트 생성에 사용
+GEMINI_EMBEDDING_MODEL_NAME = 'models/text-embedding-004' # 이미지 캡션/씬 설명 임베딩에 사용
+IMAGE_PROXY_MAX_EDGE = 1280 # Gemini 호출용 프록시 이미지의 최대 변 길이 (px)
+IMAGE_PROXY_STRIP_ASPECT = 2.5 # 세로/가로 비율이 이보다 큰 긴 이미지는 글자 판독을 위해 가로 폭에만 최대값 적용
+IMAGE_PROXY_FORMAT = "JPEG" # "JPEG" 또는 "WEBP"
+IMAGE_PROXY_QUALITY = 80
+GEMINI_REQUESTS_PER_MINUTE = 60 # Gemini 호출 분당 상한 (쿼터에 맞춰 조정, 모든 호출 종류가 공유)
+GEMINI_TOKENS_PER_MINUTE = 1_000_000 # Gemini 입력+출력 토큰 분당 상한 (모든 호출 종류가 공유)
+GEMINI_IMAGE_TRANSPORT = "file_api" # "file_api": 이미지를 한 번 업로드하고 프롬프트에는 핸들만 / "inline": 매 요청에 이미지 바이트 포함
+GEMINI_FILE_TTL_SECONDS = 48 * 60 * 60 # 업로드 파일 보관 기간 (응답에 만료 시각이 없을 때 사용)
+API_RETRY_MAX_ATTEMPTS = 4 # 쿼터/일시적 오류 시 최대 시도 횟수
+API_RETRY_BASE_DELAY_SECONDS = 1.0
+API_RETRY_MAX_DELAY_SECONDS = 30.0
+IMAGE_SELECTION_MODE = "storyboard" # "storyboard": 모든 씬을 한 번에 배정, "per_scene": 씬마다 개별 추천
+STORYBOARD_MAX_IMAGES = 16 # 스토리보드 요청 한 번에 보낼 최대 이미지 수
+STORYBOARD_CANDIDATES_PER_SCENE = 3 # 씬마다 받아올 후보 이미지 수 (순위순)
+IMAGE_RECOMMENDER_BACKEND = "gemini" # "local": 캐시된 캡션 임베딩의 코사인 유사도로 먼저 선택, "gemini": 비전 호출로 선택
+IMAGE_RANKER_MIN_SCORE = 0.55 # local 백엔드의 최고 유사도가 이보다 낮으면 Gemini 경로로 대체
+IMAGE_RANKER_REUSE_PENALTY = 0.15 # 이미 사용된 이미지의 유사도에서 뺄 값
+IMAGE_CAPTION_CACHE_MAX_BYTES = 50 * 1024 * 1024
+OCR_MAX_CONCURRENCY = 4 # 동시에 진행할 OCR 요청 수
+OCR_CACHE_MAX_BYTES = 200 * 1024 * 1024 # OCR 캐시 최대 크기 (초과 시 오래된 항목부터 삭제)
+OCR_TILE_TARGET_WIDTH = 860 # 이보다 넓은 이미지는 이 폭으로 축소한 뒤 OCR
+OCR_TILE_HEIGHT = 1400 # 긴 상세 이미지를 이 높이의 타일로 나눠 OCR
+OCR_TILE_OVERLAP = 160 # 타일 경계에 걸친 글자를 놓치지 않도록 겹치는 높이
+OCR_TILE_BLANK_STDDEV = 3.0 # 밝기 표준편차가 이보다 낮은 (단색/빈) 타일은 건너뜀
+OCR_TILE_JPEG_QUALITY = 85
 
 TTS_LANGUAGE_CODE = "ko-KR"
 TTS_VOICE_NAME_NEURAL = "ko-KR-Neural2-B"
 # TTS_VOICE_NAME_NEURAL = "ko-KR-Chirp3-HD-Puck"
 TTS_SPEAKING_RATE = 1.5  # 기본값 1.0, 1.0보다 크면 빨라짐 (예: 1.2는 20% 빠르게)
+TTS_MAX_CONCURRENCY = 4 # 동시에 진행할 TTS 합성 요청 수
+TTS_AUDIO_CACHE_MAX_BYTES = 300 * 1024 * 1024 # TTS 캐시 최대 크기 (초과 시 오래된 항목부터 삭제)
+TTS_SYNTHESIS_MODE = "per_scene" # "per_scene": 씬별 요청 / "ssml_whole": 전체 내레이션을 SSML 한 번으로 합성 후 <mark> 시점으로 분할
+TTS_SSML_MARK_GRANULARITY = "word" # ssml_whole 모드에서 씬 외에 추가로 찍을 마크 단위: "scene" / "sentence" / "word"
+TTS_SSML_MAX_BYTES = 5000 # TTS API 입력 한도. SSML이 이보다 길면 씬별 합성으로 되돌아감
+TTS_LINEAR16_SAMPLE_RATE = 24000 # ssml_whole 모드에서 받는 LINEAR16(WAV) 샘플레이트
+
+BATCH_MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2) # 배치 실행 시 동시에 처리할 상품 수
+PIPELINE_SCHEDULER = "graph" # "graph": 대본 이후 씬별 TTS/이미지 선택/세그먼트 인코딩을 작업 그래프로 겹쳐 실행 (ffmpeg 엔진) / "serial": 단계별 순차 실행
+TRACE_EXPORT_ENABLED = True # 작업 폴더에 trace.jsonl / trace.chrome.json (단계별 span, 카운터, 최대 메모리) 저장
+PIPELINE_MAX_WORKERS = 16 # 작업 그래프의 스레드 수 (TTS/인코딩 동시 실행 수는 각각 TTS_MAX_CONCURRENCY, VIDEO_SEGMENT_MAX_WORKERS로 제한)
 
 VIDEO_FPS = 24
 VIDEO_RESOLUTION = (720, 1280) # 세로형 쇼츠 (가로, 세로)
 DEFAULT_FONT_PATH_WIN = "NanumGothicBold.ttf" # 예: "malgun.ttf" 또는 "NanumGothicBold.ttf"
 DEFAULT_FONT_PATH_MAC = "/Library/Fonts/AppleGothic.ttf"
 DEFAULT_FONT_PATH_LINUX = "/usr/share/fonts/truetype/nanum/NanumGothic.ttf"
+VIDEO_RENDER_ENGINE = "ffmpeg" # "ffmpeg": 씬당 프레임 1장을 합성해 ffmpeg로 직접 인코딩 / "moviepy": 기존 MoviePy 합성
+VIDEO_SEGMENT_MAX_WORKERS = os.cpu_count() or 2 # ffmpeg 엔진: 동시에 인코딩할 씬 세그먼트 수 (씬마다 별도 ffmpeg 프로세스)
+VIDEO_SEGMENT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024 # 세그먼트 캐시 최대 크기 (초과 시 오래 안 쓴 것부터 삭제)
+IMAGE_STORE_MAX_BYTES = 128 * 1024 * 1024 # 작업 중 디코딩한 이미지를 메모리에 보관할 최대 크기 (픽셀 바이트 기준, 초과 시 오래 안 쓴 것부터 해제)
+SUBTITLE_RENDERER = "pillow" # "pillow": Pillow로 직접 그림 / "imagemagick": MoviePy TextClip(ImageMagick) 사용
+SUBTITLE_FONT_SIZE = 50
+SUBTITLE_STROKE_WIDTH = 2 # 자막 외곽선 두께 (px)
+SUBTITLE_MAX_WIDTH_RATIO = 0.9 # 영상 너비 대비 자막 최대 너비
 
 def initialize_project_folders():
     folders_to_create = [
         OUTPUT_DIR, IMAGES_RAW_FOLDER, EXTRACTED_TEXTS_FOLDER,
-        AUDIO_CLIPS_FOLDER, VIDEOS_FOLDER
+        AUDIO_CLIPS_FOLDER, VIDEOS_FOLDER, IMAGE_CACHE_DIR, JOBS_DIR
     ]
     for folder in folders_to_create:
         os.makedirs(folder, exist_ok=True)
@@ -4,41 +4,67 @@ import os
 import shutil
 import time
 import re
-from urllib.parse import urljoin, unquote
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, unquote, urlparse
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import uuid
 
-from config import IMAGES_RAW_FOLDER, USER_AGENT, SELENIUM_WAIT_TIMEOUT, IMAGE_DOWNLOAD_TIMEOUT
+from config import (IMAGES_RAW_FOLDER, USER_AGENT, SELENIUM_WAIT_TIMEOUT, IMAGE_DOWNLOAD_TIMEOUT,
+                    IMAGE_DOWNLOAD_MAX_WORKERS, IMAGE_DOWNLOAD_PER_HOST_LIMIT,
+                    STATIC_HTML_FAST_PATH, SELENIUM_POOL_SIZE, SELENIUM_RECYCLE_AFTER_PAGES,
+                    SELENIUM_BLOCKED_URL_PATTERNS)
 from utils.file_utils import clear_folder_contents, ensure_folder_exists
+from utils import image_cache
+from utils.logging_utils import span, increment, carry_context
 
-def setup_image_collection():
-    if os.path.exists(IMAGES_RAW_FOLDER):
-        print(f"'{IMAGES_RAW_FOLDER}' 폴더 내용 삭제 중...")
-        clear_folder_contents(IMAGES_RAW_FOLDER)
-    ensure_folder_exists(IMAGES_RAW_FOLDER)
-    print(f"이미지 저장 폴더 준비 완료: {IMAGES_RAW_FOLDER}")
+# 다운로드 스레드들이 공유하는 keep-alive 세션과 호스트별 동시 요청 제한
+_download_session = None
+_download_session_lock = threading.Lock()
+_host_semaphores = {}
 
-def collect_product_details(target_url):
-    product_info = {
-        "name": "정보 없음",
-        "price": "정보 없음",
-        "description_summary": "정보 없음",
-        "image_urls": [],
-        "downloaded_image_paths": []
-    }
-    driver = None
-    user_data_dir = None
+def setup_image_collection(images_folder=IMAGES_RAW_FOLDER):
+    if os.path.exists(images_folder):
+        print(f"'{images_folder}' 폴더 내용 삭제 중...")
+        clear_folder_contents(images_folder)
+    ensure_folder_exists(images_folder)
+    print(f"이미지 저장 폴더 준비 완료: {images_folder}")
 
-    try:
+_NAME_SELECTORS = [
+    'div.prod_tit_area h2.tit', 'span.title', 'h1.prod_tit',
+    'div.top_info h3.tit', 'div.item_detail_tit h2', '.prd_name > span',
+    '#prdInfo > .name > span', 'h2.product_title'
+]
+_DETAIL_CONTAINER_SELECTORS = [
+    "div.edibot-product-detail", "div.product-detail-content",
+    "div#prdDetail", "div.detail_cont", "div.product_detail_area"
+]
+
+class _WebDriverPool:
+    """미리 띄워둔 headless Chrome 세션을 재사용하는 풀.
+    세션은 SELENIUM_RECYCLE_AFTER_PAGES 페이지를 처리하면 종료 후 새로 만든다."""
+
+    def __init__(self, max_size, recycle_after_pages):
+        self.max_size = max_size
+        self.recycle_after_pages = recycle_after_pages
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _create_driver(self):
         options = webdriver.ChromeOptions()
         options.add_argument('--headless')
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--disable-gpu')
         options.add_argument(f"user-agent={USER_AGENT}")
+        options.page_load_strategy = 'eager' # DOMContentLoaded 시점에 반환 (이미지 URL은 HTML에서 파싱)
         user_data_dir = f"/tmp/chrome_user_data_{uuid.uuid4()}"
         options.add_argument(f"--user-data-dir={user_data_dir}")
 
@@ -47,7 +73,122 @@ def collect_product_details(target_url):
         # from webdriver_manager.chrome import ChromeDriverManager
         # driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
         driver = webdriver.Chrome(options=options) # PATH에 ChromeDriver 설정 가정
+        try:
+            # 폰트, CSS, 미디어 요청을 차단해 페이지 로딩 시간을 줄임
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': SELENIUM_BLOCKED_URL_PATTERNS})
+        except Exception as e_cdp:
+            print(f"WebDriver 리소스 차단 설정 실패 (계속 진행): {e_cdp}")
+        return {"driver": driver, "user_data_dir": user_data_dir, "pages_served": 0}
+
+    def _destroy(self, session):
+        try:
+            session["driver"].quit()
+        except Exception as e_quit:
+            print(f"WebDriver 종료 중 오류: {e_quit}")
+        user_data_dir = session["user_data_dir"]
+        if user_data_dir and os.path.exists(user_data_dir):
+            try:
+                shutil.rmtree(user_data_dir)
+            except Exception as e_rm:
+                print(f"임시 사용자 데이터 디렉토리 삭제 실패: {user_data_dir}, 오류: {e_rm}")
+
+    @contextmanager
+    def session(self):
+        self._slots.acquire()
+        session = None
+        healthy = False
+        try:
+            with self._lock:
+                session = self._idle.pop() if self._idle else None
+            if session is None:
+                session = self._create_driver()
+            yield session["driver"]
+            healthy = True
+        finally:
+            if session is not None:
+                session["pages_served"] += 1
+                if healthy and session["pages_served"] < self.recycle_after_pages:
+                    with self._lock:
+                        self._idle.append(session)
+                else:
+                    self._destroy(session)
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            sessions, self._idle = self._idle, []
+        for session in sessions:
+            self._destroy(session)
+
+_webdriver_pool = None
+_webdriver_pool_lock = threading.Lock()
+
+def _get_webdriver_pool():
+    global _webdriver_pool
+    with _webdriver_pool_lock:
+        if _webdriver_pool is None:
+            _webdriver_pool = _WebDriverPool(SELENIUM_POOL_SIZE, SELENIUM_RECYCLE_AFTER_PAGES)
+            atexit.register(_webdriver_pool.shutdown)
+        return _webdriver_pool
+
+def shutdown_browser_pool():
+    """풀에 남아있는 Chrome 세션을 모두 종료한다 (atexit이 실행되지 않는 워커 프로세스용)."""
+    if _webdriver_pool is not None:
+        _webdriver_pool.shutdown()
+
+def _find_detail_container(soup):
+    for selector in _DETAIL_CONTAINER_SELECTORS:
+        detail_div = soup.select_one(selector)
+        if detail_div:
+            return selector, detail_div
+    return None, None
+
+def _extract_image_urls(soup, detail_div, target_url):
+    image_urls_temp = []
+    if detail_div:
+        for img in detail_div.find_all('img'):
+            src = img.get('ec-data-src') or img.get('src') or img.get('data-src')
+            if not src or src.strip().startswith('data:'):
+                continue
+            full_url = urljoin(target_url, src.strip())
+            if full_url not in image_urls_temp:
+                image_urls_temp.append(full_url)
+    else:
+        print("지정된 상세 설명 컨테이너를 찾지 못했습니다. 페이지 전체에서 이미지 검색 시도.")
+        for img_tag in soup.find_all('img'):
+            src = img_tag.get('src') or img_tag.get('data-src')
+            if src and not src.startswith('data:'):
+                if any(ext in src.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
+                    full_url = urljoin(target_url, src.strip())
+                    if full_url not in image_urls_temp:
+                        image_urls_temp.append(full_url)
+    return image_urls_temp
+
+def _collect_from_static_html(target_url, product_info):
+    """Selenium 없이 정적 HTML만으로 상품명과 상세 이미지를 얻을 수 있으면 True를 반환한다."""
+    try:
+        resp = _get_download_session().get(target_url, timeout=SELENIUM_WAIT_TIMEOUT)
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e_req:
+        print(f"정적 HTML 요청 실패 ({e_req}). Selenium으로 진행합니다.")
+        return False
+
+    soup = BeautifulSoup(resp.content, 'html.parser') # 인코딩은 meta charset 기준으로 판별
+    name_element = soup.select_one(', '.join(_NAME_SELECTORS))
+    name_text = name_element.get_text(strip=True) if name_element else ""
+    selector, detail_div = _find_detail_container(soup)
+    if not name_text or not detail_div:
+        print("정적 HTML에 상품명 또는 상세 설명 컨테이너가 없습니다. Selenium으로 진행합니다.")
+        return False
+
+    print(f"정적 HTML에서 상품 정보 수집 (상세 설명 컨테이너: '{selector}')")
+    product_info["name"] = name_text
+    product_info["image_urls"] = _extract_image_urls(soup, detail_div, target_url)
+    return True
 
+def _collect_with_selenium(target_url, product_info):
+    with _get_webdriver_pool().session() as driver:
         print(f"'{target_url}' 페이지 로딩 시도...")
         driver.get(target_url)
         WebDriverWait(driver, SELENIUM_WAIT_TIMEOUT).until(
@@ -56,110 +197,161 @@ def collect_product_details(target_url):
         print("페이지 로딩 완료.")
 
         try:
-            name_selectors = [
-                'div.prod_tit_area h2.tit', 'span.title', 'h1.prod_tit',
-                'div.top_info h3.tit', 'div.item_detail_tit h2', '.prd_name > span',
-                '#prdInfo > .name > span', 'h2.product_title'
-            ]
             name_element = WebDriverWait(driver, 10).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, ', '.join(name_selectors)))
+                EC.visibility_of_element_located((By.CSS_SELECTOR, ', '.join(_NAME_SELECTORS)))
             )
             product_info["name"] = name_element.text.strip()
         except Exception:
             print(f"상품명 찾기 실패 (CSS Selector). 페이지 title 태그에서 추출 시도.")
             title_tag_text = driver.title
             product_info["name"] = title_tag_text.split('|')[0].split('-')[0].strip() if title_tag_text else "정보 없음"
-        print(f"상품명: {product_info['name']}")
 
-        image_urls_temp = []
-        detail_container_selectors = [
-            "div.edibot-product-detail", "div.product-detail-content",
-            "div#prdDetail", "div.detail_cont", "div.product_detail_area"
-        ]
-        page_html = driver.page_source
-        soup = BeautifulSoup(page_html, 'html.parser')
-        
-        detail_div = None
-        for selector in detail_container_selectors:
-            detail_div = soup.select_one(selector)
-            if detail_div:
-                print(f"상세 설명 컨테이너 찾음: '{selector}'")
-                break
-        
+        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        selector, detail_div = _find_detail_container(soup)
         if detail_div:
-            for img in detail_div.find_all('img'):
-                src = img.get('ec-data-src') or img.get('src') or img.get('data-src')
-                if not src or src.strip().startswith('data:'):
-                    continue
-                full_url = urljoin(target_url, src.strip())
-                if full_url not in image_urls_temp:
-                    image_urls_temp.append(full_url)
-        else:
-            print("지정된 상세 설명 컨테이너를 찾지 못했습니다. 페이지 전체에서 이미지 검색 시도.")
-            for img_tag in soup.find_all('img'):
-                src = img_tag.get('src') or img_tag.get('data-src')
-                if src and not src.startswith('data:'):
-                    if any(ext in src.lower() for ext in ['.jpg', '.jpeg', '.png', '.webp']):
-                        full_url = urljoin(target_url, src.strip())
-                        if full_url not in image_urls_temp:
-                            image_urls_temp.append(full_url)
-        
-        product_info["image_urls"] = list(set(image_urls_temp))
+            print(f"상세 설명 컨테이너 찾음: '{selector}'")
+        product_info["image_urls"] = _extract_image_urls(soup, detail_div, target_url)
+
+def collect_product_details(target_url):
+    product_info = {
+        "name": "정보 없음",
+        "price": "정보 없음",
+        "description_summary": "정보 없음",
+        "image_urls": [],
+        "downloaded_image_paths": []
+    }
+
+    if STATIC_HTML_FAST_PATH and _collect_from_static_html(target_url, product_info):
+        print(f"상품명: {product_info['name']}")
         print(f"수집된 이미지 URL 개수: {len(product_info['image_urls'])}")
+        return product_info
 
+    try:
+        _collect_with_selenium(target_url, product_info)
+        print(f"상품명: {product_info['name']}")
+        print(f"수집된 이미지 URL 개수: {len(product_info['image_urls'])}")
     except Exception as e:
         print(f"❌ Selenium 처리 중 예기치 않은 오류 발생: {e}")
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except Exception as e_quit:
-                print(f"WebDriver 종료 중 오류: {e_quit}")
-        if user_data_dir and os.path.exists(user_data_dir):
-            try:
-                shutil.rmtree(user_data_dir)
-            except Exception as e_rm:
-                print(f"임시 사용자 데이터 디렉토리 삭제 실패: {user_data_dir}, 오류: {e_rm}")
     return product_info
 
-def download_images_from_urls(image_urls, base_url_for_referer):
+def _get_download_session():
+    global _download_session
+    with _download_session_lock:
+        if _download_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=IMAGE_DOWNLOAD_MAX_WORKERS,
+                                  pool_maxsize=IMAGE_DOWNLOAD_MAX_WORKERS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'User-Agent': USER_AGENT})
+            _download_session = session
+        return _download_session
+
+def _get_host_semaphore(url):
+    host = urlparse(url).netloc
+    with _download_session_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(IMAGE_DOWNLOAD_PER_HOST_LIMIT)
+        return _host_semaphores[host]
+
+def _guess_image_extension(content_type, decoded_img_url):
+    content_type = (content_type or '').lower()
+    if 'jpeg' in content_type or 'jpg' in content_type: return '.jpg'
+    if 'png' in content_type: return '.png'
+    if 'gif' in content_type: return '.gif'
+    if 'webp' in content_type: return '.webp'
+    url_ext_part = os.path.splitext(decoded_img_url.split('?')[0])[1].lower()
+    if url_ext_part in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
+        return url_ext_part
+    return '.jpg'
+
+def _download_single_image(idx, img_url, headers_for_download, target_folder):
+    decoded_img_url = unquote(img_url)
+    started_at = time.perf_counter()
+    try:
+        with image_cache.url_lock(decoded_img_url):
+            cache_entry = image_cache.get_entry(decoded_img_url)
+            source = "download"
+            bytes_transferred = 0
+            if cache_entry and image_cache.is_fresh(cache_entry):
+                source = "cache"
+            else:
+                request_headers = dict(headers_for_download)
+                if cache_entry:
+                    request_headers.update(image_cache.conditional_headers(cache_entry))
+                session = _get_download_session()
+                with _get_host_semaphore(decoded_img_url):
+                    with session.get(decoded_img_url, headers=request_headers, stream=True,
+                                     timeout=IMAGE_DOWNLOAD_TIMEOUT) as img_resp:
+                        if img_resp.status_code == 304 and cache_entry:
+                            image_cache.mark_revalidated(decoded_img_url)
+                            source = "revalidated"
+                        else:
+                            img_resp.raise_for_status()
+                            ext = _guess_image_extension(img_resp.headers.get('Content-Type'), decoded_img_url)
+                            cache_entry = image_cache.store_stream(
+                                decoded_img_url, img_resp.iter_content(65536), ext,
+                                etag=img_resp.headers.get('ETag'),
+                                last_modified=img_resp.headers.get('Last-Modified'))
+                            bytes_transferred = cache_entry["size"]
+        fname = f"product_image_{str(idx).zfill(3)}{cache_entry['ext']}"
+        save_path = image_cache.link_blob_to(cache_entry, os.path.join(target_folder, fname))
+        latency = time.perf_counter() - started_at
+        print(f"    [{idx:03d}] {fname}: {cache_entry['size'] / 1024:.1f} KB ({source}), {latency * 1000:.0f} ms")
+        return {"index": idx, "url": decoded_img_url, "path": save_path, "source": source,
+                "bytes": bytes_transferred, "latency_seconds": latency}
+    except requests.exceptions.Timeout:
+        print(f"    ⚠️ 다운로드 시간 초과: {decoded_img_url}")
+    except requests.exceptions.RequestException as e_req:
+        print(f"    ⚠️ 다운로드 요청 오류 ({e_req}): {decoded_img_url}")
+    except Exception as e_img:
+        print(f"    ⚠️ 이미지 처리/저장 중 알 수 없는 오류 ({e_img}): {decoded_img_url}")
+    return None
+
+def download_images_from_urls(image_urls, base_url_for_referer, images_folder=IMAGES_RAW_FOLDER, on_image_ready=None):
+    """on_image_ready(path)를 주면 이미지 하나가 저장될 때마다 (다운로드 스레드에서) 바로 호출한다.
+    전체 다운로드를 기다리지 않고 OCR 등 다음 작업을 시작할 때 사용."""
     downloaded_image_paths = []
     if not image_urls:
         print("수집된 이미지 URL이 없어 다운로드를 진행하지 않습니다.")
         return downloaded_image_paths
 
-    ensure_folder_exists(IMAGES_RAW_FOLDER)
-    print(f"\n--- 이미지 다운로드 시작 (총 {len(image_urls)}개) ---")
+    ensure_folder_exists(images_folder)
+    max_workers = max(1, min(IMAGE_DOWNLOAD_MAX_WORKERS, len(image_urls)))
+    print(f"\n--- 이미지 다운로드 시작 (총 {len(image_urls)}개, 동시 {max_workers}개) ---")
     headers_for_download = {'User-Agent': USER_AGENT, 'Referer': base_url_for_referer}
-    download_count = 0
-    for idx, img_url in enumerate(image_urls, start=1):
-        try:
-            decoded_img_url = unquote(img_url)
-            img_resp = requests.get(decoded_img_url, headers=headers_for_download, stream=True, timeout=IMAGE_DOWNLOAD_TIMEOUT)
-            img_resp.raise_for_status()
-            content_type = img_resp.headers.get('Content-Type', '').lower()
-            ext = '.jpg'
-            if 'jpeg' in content_type or 'jpg' in content_type: ext = '.jpg'
-            elif 'png' in content_type: ext = '.png'
-            elif 'gif' in content_type: ext = '.gif'
-            elif 'webp' in content_type: ext = '.webp'
-            else:
-                url_ext_part = os.path.splitext(decoded_img_url.split('?')[0])[1].lower()
-                if url_ext_part in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                    ext = url_ext_part
-            fname = f"product_image_{str(idx).zfill(3)}{ext}"
-            save_path = os.path.join(IMAGES_RAW_FOLDER, fname)
-            with open(save_path, 'wb') as f:
-                for chunk in img_resp.iter_content(8192): f.write(chunk)
-            downloaded_image_paths.append(save_path)
-            download_count += 1
-            time.sleep(0.05)
-        except requests.exceptions.Timeout:
-            print(f"    ⚠️ 다운로드 시간 초과: {decoded_img_url}")
-        except requests.exceptions.RequestException as e_req:
-            print(f"    ⚠️ 다운로드 요청 오류 ({e_req}): {decoded_img_url}")
-        except Exception as e_img:
-            print(f"    ⚠️ 이미지 처리/저장 중 알 수 없는 오류 ({e_img}): {decoded_img_url}")
-    if download_count > 0: print(f"총 {download_count}개의 이미지 다운로드 완료.")
+    batch_started_at = time.perf_counter()
+    def _download_and_notify(idx, img_url):
+        with span("download.image", index=idx) as download_span:
+            result = _download_single_image(idx, img_url, headers_for_download, images_folder)
+            if result:
+                download_span.set(source=result["source"], bytes=result["bytes"])
+                increment("bytes_downloaded", result["bytes"])
+                increment("cache_hits" if result["source"] != "download" else "cache_misses")
+                increment("cache_hits.image" if result["source"] != "download" else "cache_misses.image")
+        if result and on_image_ready:
+            on_image_ready(result["path"])
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(carry_context(_download_and_notify), idx, img_url)
+            for idx, img_url in enumerate(image_urls, start=1)
+        ]
+        results = [future.result() for future in futures]
+    image_cache.save_index()
+
+    # 완료 순서와 무관하게 URL 순서(파일 인덱스 순서)대로 결과를 정리
+    successful_results = sorted((r for r in results if r), key=lambda r: r["index"])
+    downloaded_image_paths = [r["path"] for r in successful_results]
+    download_count = len(downloaded_image_paths)
+    if download_count > 0:
+        total_bytes = sum(r["bytes"] for r in successful_results)
+        cache_hits = sum(1 for r in successful_results if r["source"] != "download")
+        latencies = sorted(r["latency_seconds"] for r in successful_results)
+        elapsed = time.perf_counter() - batch_started_at
+        print(f"총 {download_count}개의 이미지 다운로드 완료. "
+              f"(캐시 재사용 {cache_hits}개, 전송 {total_bytes / (1024 * 1024):.2f} MB, 경과 {elapsed:.2f} 초, "
+              f"이미지당 지연 중앙값 {latencies[len(latencies) // 2] * 1000:.0f} ms / 최대 {latencies[-1] * 1000:.0f} ms)")
     else: print("다운로드된 이미지가 없습니다.")
-    return downloaded_image_paths
\ No newline at end of file
+    return downloaded_image_paths
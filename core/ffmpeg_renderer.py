@@ -0,0 +1,276 @@
+import os
+import json
+import shutil
+import hashlib
+import subprocess
+import tempfile
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from config import (VIDEO_RESOLUTION, VIDEO_FPS, VIDEO_SEGMENT_MAX_WORKERS, VIDEO_SEGMENT_CACHE_DIR,
+                    VIDEO_SEGMENT_CACHE_MAX_BYTES, SUBTITLE_FONT_SIZE, SUBTITLE_STROKE_WIDTH,
+                    SUBTITLE_MAX_WIDTH_RATIO)
+from core.subtitle_renderer import render_subtitle
+from core.image_store import get_image_store
+from utils.file_utils import ensure_folder_exists, file_sha256
+from utils.logging_utils import span, increment, carry_context
+
+# 씬마다 정지 이미지 + 고정 자막이므로, 씬당 한 장의 프레임만 합성해서 ffmpeg로 직접 인코딩한다.
+# 씬별 영상(무음) 세그먼트를 각각 별도 ffmpeg 프로세스로 병렬 인코딩하고, concat demuxer의
+# 스트림 복사로 이어 붙인다. 오디오는 전체를 한 트랙으로 이어서 한 번만 AAC로 인코딩한다
+# (세그먼트마다 AAC를 따로 만들면 이음새마다 priming 무음이 끼기 때문).
+# 인코딩된 세그먼트는 입력 지문별로 캐시해서, 자막/이미지 하나만 바뀌면 그 씬만 다시 인코딩한다.
+# 인코딩 설정은 MoviePy 경로(write_videofile)와 같게 맞춘다: libx264 / CRF 23 / preset medium / yuv420p / aac 44.1kHz
+
+AUDIO_SAMPLE_RATE = 44100
+VIDEO_ENCODER_ARGS = ["-c:v", "libx264", "-preset", "medium", "-crf", "23", "-pix_fmt", "yuv420p"]
+# 프레임 합성 방식이 바뀌면 올려서 기존 세그먼트 캐시를 무효화한다
+SEGMENT_FORMAT_VERSION = "v2"
+
+_last_render_stats = {}
+_last_render_stats_lock = threading.Lock()
+
+def get_ffmpeg_binary():
+    """MoviePy가 쓰는 것과 같은 ffmpeg (FFMPEG_BINARY 환경 변수 또는 imageio-ffmpeg 번들)."""
+    from moviepy.config import get_setting
+    return get_setting("FFMPEG_BINARY")
+
+def compose_scene_frame(image_path, subtitle_rgba=None, resolution=VIDEO_RESOLUTION):
+    """이미지를 화면 크기에 맞춰 검은 여백으로 패딩하고, 자막(RGBA 배열)을 가로 가운데·세로 80% 지점에 얹는다."""
+    frame = get_image_store().frame(image_path, resolution).copy() # 저장소의 프레임은 공유되므로 복사본에 그림
+    if subtitle_rgba is not None:
+        subtitle = Image.fromarray(subtitle_rgba, "RGBA")
+        x = (resolution[0] - subtitle.width) // 2
+        y = int(resolution[1] * 0.8)
+        frame.paste(subtitle, (x, y), subtitle)
+    return frame
+
+def scene_frame_count(duration, fps=VIDEO_FPS):
+    """씬 길이(초)를 프레임 수로 바꾼다. 씬마다 독립적으로 반올림하므로 한 씬의 길이가 바뀌어도
+    다른 씬의 세그먼트(와 캐시 지문)는 그대로다. 오디오 트랙도 같은 프레임 경계에 맞춰 자르므로 싱크가 유지된다."""
+    return max(1, round(duration * fps))
+
+def _run_ffmpeg(command, description):
+    increment("ffmpeg_processes")
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"{description} 실패 (exit {result.returncode}): "
+                           f"{result.stderr.decode('utf-8', 'replace')[-2000:]}")
+
+def _escape_concat_path(path):
+    return os.path.abspath(path).replace("'", r"'\''")
+
+def _compose_scene(scene):
+    subtitle_rgba = None
+    if scene.get("subtitle_text"):
+        try:
+            subtitle_rgba = render_subtitle(scene["subtitle_text"], scene["font_path"])
+        except Exception as e:
+            print(f"  Error creating text clip for Scene {scene['scene_number']} ('{scene['subtitle_text']}') "
+                  f"using font '{scene['font_path']}': {e}")
+    try:
+        return compose_scene_frame(scene["image_path"], subtitle_rgba)
+    except Exception as e:
+        if not scene.get("fallback_image_path"):
+            raise
+        print(f"  Error creating image clip for Scene {scene['scene_number']} ({scene['image_path']}): {e}. Using placeholder.")
+        return compose_scene_frame(scene["fallback_image_path"], subtitle_rgba)
+
+def encode_scene_segment(scene, frame_count, segment_path, threads):
+    """씬 프레임 한 장을 frame_count 프레임짜리 무음 H.264 세그먼트로 인코딩한다.
+    세그먼트마다 키프레임으로 시작하므로 스트림 복사로 바로 이어 붙일 수 있다."""
+    frame_path = os.path.splitext(segment_path)[0] + ".png"
+    _compose_scene(scene).save(frame_path, compress_level=1)
+    try:
+        command = [get_ffmpeg_binary(), "-y", "-loglevel", "error",
+                   "-loop", "1", "-framerate", str(VIDEO_FPS), "-i", frame_path,
+                   "-frames:v", str(frame_count), "-an",
+                   *VIDEO_ENCODER_ARGS, "-r", str(VIDEO_FPS), "-threads", str(threads),
+                   segment_path]
+        _run_ffmpeg(command, f"Scene {scene['scene_number']} 세그먼트 인코딩")
+    finally:
+        os.remove(frame_path)
+    return segment_path
+
+@lru_cache(maxsize=8)
+def _font_sha256(font_path, mtime, size):
+    return file_sha256(font_path)
+
+def scene_segment_fingerprint(scene, frame_count):
+    """세그먼트 결과를 결정하는 입력(이미지 내용, 자막/폰트 설정, 프레임 수, 해상도, 인코더 설정)의 지문.
+    세그먼트에는 오디오가 없으므로 오디오는 길이(프레임 수)로만 반영된다."""
+    font_path = scene.get("font_path") or ""
+    fingerprint_source = {
+        "version": SEGMENT_FORMAT_VERSION,
+        "image_sha256": file_sha256(scene["image_path"]),
+        "subtitle": (scene.get("subtitle_text") or "").strip(),
+        "font": font_path,
+        "font_sha256": (_font_sha256(font_path, os.path.getmtime(font_path), os.path.getsize(font_path))
+                        if os.path.isfile(font_path) else None),
+        "subtitle_style": [SUBTITLE_FONT_SIZE, SUBTITLE_STROKE_WIDTH, SUBTITLE_MAX_WIDTH_RATIO],
+        "frame_count": frame_count,
+        "fps": VIDEO_FPS,
+        "resolution": list(VIDEO_RESOLUTION),
+        "encoder": VIDEO_ENCODER_ARGS,
+    }
+    return hashlib.sha256(json.dumps(fingerprint_source, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _cached_segment_path(fingerprint):
+    return os.path.join(VIDEO_SEGMENT_CACHE_DIR, fingerprint[:2], f"{fingerprint}.mp4")
+
+def _get_or_encode_segment(scene, frame_count, tmp_dir, threads):
+    """캐시에 같은 지문의 세그먼트가 있으면 그대로 쓰고, 없으면 인코딩해서 캐시에 넣는다.
+    반환값: (세그먼트 경로, 재사용 여부)"""
+    try:
+        fingerprint = scene_segment_fingerprint(scene, frame_count)
+    except OSError: # 이미지를 읽을 수 없으면 캐시 없이 인코딩 (플레이스홀더로 대체됨)
+        fingerprint = None
+    if fingerprint:
+        cached_path = _cached_segment_path(fingerprint)
+        if os.path.exists(cached_path):
+            os.utime(cached_path) # LRU 정리용 사용 시각 갱신
+            return cached_path, True
+
+    segment_path = os.path.join(tmp_dir, f"scene_{scene['scene_number']}_{frame_count}.mp4")
+    encode_scene_segment(scene, frame_count, segment_path, threads)
+    if not fingerprint:
+        return segment_path, False
+    ensure_folder_exists(os.path.dirname(cached_path))
+    staging_path = f"{cached_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(segment_path, staging_path)
+    os.replace(staging_path, cached_path)
+    return cached_path, False
+
+def prune_segment_cache(keep_paths=()):
+    """세그먼트 캐시가 VIDEO_SEGMENT_CACHE_MAX_BYTES를 넘으면 오래 안 쓴 세그먼트부터 지운다."""
+    if not os.path.isdir(VIDEO_SEGMENT_CACHE_DIR):
+        return 0
+    keep = {os.path.abspath(path) for path in keep_paths}
+    entries = []
+    for root, _, filenames in os.walk(VIDEO_SEGMENT_CACHE_DIR):
+        for filename in filenames:
+            if filename.endswith(".mp4"):
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+    total_bytes = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total_bytes <= VIDEO_SEGMENT_CACHE_MAX_BYTES:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        os.remove(path)
+        total_bytes -= size
+        removed += 1
+    return removed
+
+def get_last_render_stats():
+    """마지막 render_scenes_with_ffmpeg 호출의 세그먼트 통계 (segments, reused, encoded)."""
+    with _last_render_stats_lock:
+        return dict(_last_render_stats)
+
+def _audio_filter_graph(scenes, durations):
+    """씬별 오디오를 씬 길이에 맞춰 무음으로 채우거나 자른 뒤 하나로 이어 붙이는 filter_complex 문자열."""
+    filters = []
+    labels = []
+    input_idx = 0
+    for scene_idx, (scene, duration) in enumerate(zip(scenes, durations)):
+        label = f"a{scene_idx}"
+        if scene.get("audio_path"):
+            filters.append(
+                f"[{input_idx}:a]aformat=sample_rates={AUDIO_SAMPLE_RATE}:channel_layouts=stereo,"
+                f"apad=whole_dur={duration:.6f},atrim=duration={duration:.6f}[{label}]")
+            input_idx += 1
+        else:
+            filters.append(f"aevalsrc=0:c=stereo:s={AUDIO_SAMPLE_RATE}:d={duration:.6f}[{label}]")
+        labels.append(f"[{label}]")
+    filters.append(f"{''.join(labels)}concat=n={len(scenes)}:v=0:a=1[aout]")
+    return ";".join(filters)
+
+def encode_audio_track(scenes, durations, audio_output_path):
+    """모든 씬의 오디오를 (프레임 경계에 맞춘) 씬 길이대로 이어 붙여 AAC 트랙 하나로 인코딩한다."""
+    command = [get_ffmpeg_binary(), "-y", "-loglevel", "error"]
+    for scene in scenes:
+        if scene.get("audio_path"):
+            command += ["-i", scene["audio_path"]]
+    command += ["-filter_complex", _audio_filter_graph(scenes, durations), "-map", "[aout]",
+                "-c:a", "aac", "-ar", str(AUDIO_SAMPLE_RATE), audio_output_path]
+    with span("render.audio_track", scenes=len(scenes)):
+        _run_ffmpeg(command, "오디오 트랙 인코딩")
+    return audio_output_path
+
+def concat_segments(segment_paths, audio_path, output_path, work_folder):
+    """세그먼트들을 concat demuxer + 스트림 복사로 잇고 오디오 트랙과 합친다 (재인코딩 없음)."""
+    concat_list_path = os.path.join(work_folder, "segments.ffconcat")
+    with open(concat_list_path, "w", encoding="utf-8") as f:
+        f.write("ffconcat version 1.0\n")
+        for segment_path in segment_paths:
+            f.write(f"file '{_escape_concat_path(segment_path)}'\n")
+    command = [get_ffmpeg_binary(), "-y", "-loglevel", "error",
+               "-f", "concat", "-safe", "0", "-i", concat_list_path, "-i", audio_path,
+               "-map", "0:v", "-map", "1:a", "-c", "copy", "-shortest", "-movflags", "+faststart",
+               output_path]
+    with span("render.concat", segments=len(segment_paths)):
+        _run_ffmpeg(command, "세그먼트 연결")
+    return output_path
+
+def segment_threads_per_encoder(scene_count):
+    """동시에 도는 인코더 수에 맞춰 인코더 하나가 쓸 스레드 수를 나눈다."""
+    max_workers = max(1, min(VIDEO_SEGMENT_MAX_WORKERS, scene_count))
+    return max(1, (os.cpu_count() or 1) // max_workers)
+
+def render_scene_segment(scene, work_folder, threads=1):
+    """씬 하나의 세그먼트를 (캐시에 있으면 재사용, 없으면 인코딩) 준비한다. 다른 씬과 독립적이다.
+    반환값: {"path", "reused", "frame_count", "duration"}"""
+    frame_count = scene_frame_count(scene["duration"])
+    with span("render.segment", scene=scene["scene_number"], frames=frame_count) as segment_span:
+        path, reused = _get_or_encode_segment(scene, frame_count, work_folder, threads)
+        segment_span.set(reused=reused)
+    increment("cache_hits" if reused else "cache_misses")
+    increment("cache_hits.segment" if reused else "cache_misses.segment")
+    return {"path": path, "reused": reused, "frame_count": frame_count, "duration": frame_count / VIDEO_FPS}
+
+def assemble_video(scenes, segment_results, output_path, work_folder, audio_path=None):
+    """준비된 세그먼트들을 스트림 복사로 잇고 오디오 트랙과 합쳐 최종 mp4를 만든다.
+    audio_path가 없으면 여기서 오디오 트랙을 인코딩한다."""
+    global _last_render_stats
+    if audio_path is None:
+        audio_path = encode_audio_track(scenes, [r["duration"] for r in segment_results],
+                                        os.path.join(work_folder, "audio.m4a"))
+    segment_paths = [r["path"] for r in segment_results]
+    reused = sum(1 for r in segment_results if r["reused"])
+    with _last_render_stats_lock:
+        _last_render_stats = {"segments": len(scenes), "reused": reused, "encoded": len(scenes) - reused}
+    print(f"  씬 세그먼트 {len(scenes)}개 중 {reused}개 캐시 재사용, {len(scenes) - reused}개 인코딩")
+    result_path = concat_segments(segment_paths, audio_path, output_path, work_folder)
+    prune_segment_cache(keep_paths=segment_paths)
+    return result_path
+
+def render_scenes_with_ffmpeg(scenes, output_path, work_folder=None):
+    """scenes: [{"scene_number", "image_path", "fallback_image_path", "subtitle_text", "font_path",
+                 "duration": 초, "audio_path": 경로 또는 None}, ...]
+    입력 지문이 같은 세그먼트는 캐시에서 재사용하고, 바뀐 씬만 병렬 인코딩한 뒤 이어 붙여 최종 mp4를 만든다.
+    성공하면 output_path, 실패하면 None."""
+    if not scenes:
+        return None
+    max_workers = max(1, min(VIDEO_SEGMENT_MAX_WORKERS, len(scenes)))
+    threads_per_encoder = segment_threads_per_encoder(len(scenes))
+    durations = [scene_frame_count(scene["duration"]) / VIDEO_FPS for scene in scenes]
+
+    with tempfile.TemporaryDirectory(dir=work_folder) as tmp_dir:
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers + 1) as executor:
+                # 오디오 트랙도 세그먼트 인코딩과 함께 진행
+                audio_future = executor.submit(carry_context(encode_audio_track), scenes, durations,
+                                               os.path.join(tmp_dir, "audio.m4a"))
+                segment_results = list(executor.map(
+                    carry_context(lambda scene: render_scene_segment(scene, tmp_dir, threads_per_encoder)), scenes))
+                audio_path = audio_future.result()
+            print(f"  세그먼트 동시 인코딩 {max_workers}개, 인코더당 스레드 {threads_per_encoder}")
+            return assemble_video(scenes, segment_results, output_path, tmp_dir, audio_path)
+        except Exception as e:
+            print(f"ffmpeg 렌더링 실패: {e}")
+            return None
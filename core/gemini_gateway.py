@@ -0,0 +1,208 @@
+import time
+import hashlib
+import threading
+import google.generativeai as genai
+from PIL import Image
+
+from config import (GOOGLE_API_KEY_GEMINI, GEMINI_REQUESTS_PER_MINUTE, GEMINI_TOKENS_PER_MINUTE,
+                    API_RETRY_MAX_ATTEMPTS, API_RETRY_BASE_DELAY_SECONDS, API_RETRY_MAX_DELAY_SECONDS)
+from utils.rate_limit_utils import TokenBucket, call_with_retry
+from utils.logging_utils import span, increment
+
+# 모든 Gemini 호출(OCR, 캡션, 임베딩, 나레이션, 씬 스크립트, 이미지 추천, 스토리보드)이 거치는 공용 계층.
+# - API 설정과 GenerativeModel 핸들은 프로세스당 한 번만 만든다.
+# - 분당 요청 수 / 토큰 수를 모든 호출이 같은 토큰 버킷으로 나눠 쓴다. 토큰은 호출 전에 추정치로 차감하고,
+#   응답의 usage_metadata로 실제 사용량과의 차이를 사후 정산한다.
+# - 쿼터(429)/일시적 오류는 call_with_retry로 지수 백오프(+지터) 재시도한다.
+# - 같은 모델/설정/내용의 요청이 이미 진행 중이면 새로 보내지 않고 그 결과를 함께 받는다.
+# - 호출 종류(call_type)별로 요청/중복 병합/재시도/오류 수, 지연, 토큰 사용량을 기록한다.
+
+ESTIMATED_CHARS_PER_TOKEN = 2 # 한국어 위주 프롬프트의 대략적인 비율 (사전 차감용 추정치)
+ESTIMATED_TOKENS_PER_IMAGE = 258
+
+_configure_lock = threading.Lock()
+_configured = False
+_models = {}
+_request_bucket = TokenBucket(GEMINI_REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(GEMINI_TOKENS_PER_MINUTE, capacity=GEMINI_TOKENS_PER_MINUTE)
+_inflight = {}
+_inflight_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+def configure_gemini():
+    global _configured
+    if not GOOGLE_API_KEY_GEMINI:
+        raise ValueError("Gemini API 키가 설정되지 않았습니다. config.py 또는 환경변수를 확인하세요.")
+    with _configure_lock:
+        if not _configured:
+            genai.configure(api_key=GOOGLE_API_KEY_GEMINI)
+            _configured = True
+
+def get_model(model_name):
+    """모델 이름별로 공유되는 GenerativeModel을 반환한다 (처음 요청될 때 생성)."""
+    configure_gemini()
+    with _configure_lock:
+        if model_name not in _models:
+            _models[model_name] = genai.GenerativeModel(model_name)
+        return _models[model_name]
+
+class _InflightCall:
+    __slots__ = ("done", "response", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+def _request_key(*key_parts, contents):
+    """요청 내용의 해시. 해시할 수 없는 파트가 있으면 None (중복 병합 안 함)."""
+    hasher = hashlib.sha256(repr(key_parts).encode("utf-8"))
+    for part in contents if isinstance(contents, list) else [contents]:
+        if isinstance(part, str):
+            hasher.update(b"s" + part.encode("utf-8"))
+        elif isinstance(part, dict) and "data" in part:
+            hasher.update(f"b{part.get('mime_type')}".encode("utf-8") + part["data"])
+        elif isinstance(part, Image.Image):
+            hasher.update(f"i{part.mode}{part.size}".encode("utf-8") + part.tobytes())
+        elif getattr(part, "uri", None): # 업로드된 파일 핸들
+            hasher.update(f"f{part.uri}".encode("utf-8"))
+        else:
+            return None
+    return hasher.hexdigest()
+
+def _estimate_tokens(contents):
+    tokens = 0
+    for part in contents if isinstance(contents, list) else [contents]:
+        if isinstance(part, str):
+            tokens += len(part) // ESTIMATED_CHARS_PER_TOKEN + 1
+        else:
+            tokens += ESTIMATED_TOKENS_PER_IMAGE
+    return tokens
+
+def _uploaded_bytes(contents):
+    return sum(len(part["data"]) for part in (contents if isinstance(contents, list) else [contents])
+               if isinstance(part, dict) and "data" in part)
+
+def _record(call_type, **values):
+    with _stats_lock:
+        stats = _stats.setdefault(call_type, {
+            "requests": 0, "api_calls": 0, "deduplicated": 0, "retries": 0, "errors": 0,
+            "latency_seconds_total": 0.0, "latency_seconds_max": 0.0, "rate_limit_wait_seconds": 0.0,
+            "prompt_tokens": 0, "output_tokens": 0})
+        for name, value in values.items():
+            if name == "latency_seconds":
+                stats["latency_seconds_total"] += value
+                stats["latency_seconds_max"] = max(stats["latency_seconds_max"], value)
+            else:
+                stats[name] += value
+
+def _call_once_per_key(request_key, func):
+    """같은 키의 요청이 진행 중이면 그 결과를 기다려 돌려준다. (결과, 병합 여부) 반환."""
+    if request_key is None:
+        return func(), False
+    with _inflight_lock:
+        call = _inflight.get(request_key)
+        is_leader = call is None
+        if is_leader:
+            call = _inflight[request_key] = _InflightCall()
+    if not is_leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.response, True
+    try:
+        call.response = func()
+        return call.response, False
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(request_key, None)
+        call.done.set()
+
+def _call_api(call_type, api_func, estimated_tokens, on_retry):
+    """속도 제한과 재시도를 적용해 api_func()를 호출하고 토큰 사용량을 정산한다."""
+    # 토큰 추정치는 재시도 횟수와 관계없이 한 번만 차감한다 (아래 정산도 한 번만 하므로)
+    _record(call_type, rate_limit_wait_seconds=_token_bucket.acquire(estimated_tokens))
+
+    def _attempt():
+        _record(call_type, api_calls=1, rate_limit_wait_seconds=_request_bucket.acquire())
+        return api_func()
+
+    def _on_retry(attempt, error, delay):
+        _record(call_type, retries=1)
+        if on_retry:
+            on_retry(attempt, error, delay)
+
+    response = call_with_retry(_attempt, API_RETRY_MAX_ATTEMPTS, API_RETRY_BASE_DELAY_SECONDS,
+                               API_RETRY_MAX_DELAY_SECONDS, on_retry=_on_retry)
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or estimated_tokens
+    output_tokens = getattr(usage, "candidates_token_count", None) or 0
+    _token_bucket.consume(prompt_tokens + output_tokens - estimated_tokens) # 추정치와의 차이 정산
+    _record(call_type, prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+    increment("prompt_tokens", prompt_tokens)
+    increment("output_tokens", output_tokens)
+    return response
+
+def _gateway_call(call_type, request_key, contents, api_func, on_retry, span_attrs):
+    started_at = time.perf_counter()
+    _record(call_type, requests=1)
+    with span(f"gemini.{call_type}", **span_attrs) as call_span:
+        def _send():
+            increment("bytes_uploaded", _uploaded_bytes(contents))
+            return _call_api(call_type, api_func, _estimate_tokens(contents), on_retry)
+        try:
+            response, deduplicated = _call_once_per_key(request_key, _send)
+        except Exception:
+            _record(call_type, errors=1)
+            raise
+        if deduplicated:
+            call_span.set(deduplicated=True)
+            increment("gemini_deduplicated")
+            _record(call_type, deduplicated=1)
+    _record(call_type, latency_seconds=time.perf_counter() - started_at)
+    return response
+
+def generate_content(model, call_type, contents, generation_config=None, on_retry=None, **span_attrs):
+    """model.generate_content(contents)를 게이트웨이를 거쳐 호출한다. span 이름은 "gemini.<call_type>".
+    on_retry(attempt, error, delay)는 재시도 직전에 호출된다. 재시도 후에도 실패하면 예외를 던진다."""
+    model_name = getattr(model, "model_name", None)
+    request_key = _request_key("generate", model_name, repr(generation_config), contents=contents)
+    api_func = ((lambda: model.generate_content(contents)) if generation_config is None
+                else (lambda: model.generate_content(contents, generation_config=generation_config)))
+    return _gateway_call(call_type, request_key, contents, api_func, on_retry, dict(span_attrs, model=model_name))
+
+def embed_content(model_name, content, task_type, call_type="embed", on_retry=None, **span_attrs):
+    """genai.embed_content를 게이트웨이를 거쳐 호출한다."""
+    configure_gemini()
+    request_key = _request_key("embed", model_name, task_type, contents=content)
+    api_func = lambda: genai.embed_content(model=model_name, content=content, task_type=task_type)
+    return _gateway_call(call_type, request_key, content, api_func, on_retry, dict(span_attrs, model=model_name))
+
+def get_gemini_stats():
+    """호출 종류별 통계 {call_type: {...}} (평균 지연 포함)."""
+    with _stats_lock:
+        stats = {call_type: dict(values) for call_type, values in _stats.items()}
+    for values in stats.values():
+        completed = values["requests"] - values["errors"]
+        values["latency_seconds_avg"] = values["latency_seconds_total"] / completed if completed > 0 else 0.0
+    return stats
+
+def reset_gemini_stats():
+    with _stats_lock:
+        _stats.clear()
+
+def print_gemini_stats():
+    stats = get_gemini_stats()
+    if not stats:
+        return
+    print("\n--- Gemini 호출 통계 ---")
+    for call_type, values in sorted(stats.items()):
+        waited = values["rate_limit_wait_seconds"]
+        print(f"  {call_type:<15} 요청 {values['requests']}회 (API {values['api_calls']}회, 중복 병합 {values['deduplicated']}회, "
+              f"재시도 {values['retries']}회, 실패 {values['errors']}회), 지연 평균 {values['latency_seconds_avg']:.2f}초 / "
+              f"최대 {values['latency_seconds_max']:.2f}초, 토큰 입력 {values['prompt_tokens']} / 출력 {values['output_tokens']}"
+              f"{f', 속도 제한 대기 {waited:.1f}초' if waited >= 0.05 else ''}")
@@ -1,28 +1,34 @@
+import io
 import os
 import re
 import json
-from PIL import Image
-import google.generativeai as genai
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageStat
 
-from config import GOOGLE_API_KEY_GEMINI, GEMINI_VISION_MODEL_NAME, EXTRACTED_TEXTS_FOLDER, IMAGES_RAW_FOLDER
+from config import (GEMINI_VISION_MODEL_NAME, EXTRACTED_TEXTS_FOLDER, IMAGES_RAW_FOLDER,
+                    GEMINI_REQUESTS_PER_MINUTE, OCR_MAX_CONCURRENCY, OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES,
+                    OCR_TILE_TARGET_WIDTH, OCR_TILE_HEIGHT, OCR_TILE_OVERLAP, OCR_TILE_BLANK_STDDEV,
+                    OCR_TILE_JPEG_QUALITY)
 from utils.file_utils import ensure_folder_exists, save_text_to_file
+from utils.sqlite_cache import SQLiteCache
+from utils.logging_utils import span, carry_context
+from core.image_proxy import get_proxy_path, proxy_variant, create_image_proxy
+from core import gemini_gateway
+from core.image_upload_registry import get_image_registry
+from core.image_store import get_image_store
 
-_gemini_configured = False
+_last_ocr_stats = {}
+_last_ocr_stats_lock = threading.Lock()
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
 
-def configure_gemini_api():
-    global _gemini_configured
-    if not GOOGLE_API_KEY_GEMINI:
-        raise ValueError("Gemini API 키가 설정되지 않았습니다. config.py 또는 환경변수를 확인하세요.")
-    if not _gemini_configured:
-        genai.configure(api_key=GOOGLE_API_KEY_GEMINI)
-        _gemini_configured = True
-        # print("Gemini API 설정 완료 (image_processor).")
+# OCR_PROMPT 또는 응답 후처리 방식을 바꾸면 올려서 기존 캐시 결과를 무효화한다.
+OCR_PROMPT_VERSION = "v3"
 
-def extract_text_from_single_image_ocr(image_path, model):
-    extracted_labels = []
-    try:
-        img = Image.open(image_path)
-        prompt_ocr = """
+OCR_PROMPT = """
         아래 이미지는 문서 이미지 또는 포스터입니다.
         이미지에 포함된 모든 텍스트를 2차원 박스 좌표와 함께 JSON 형식으로 반환하세요.
         형식은 다음과 같아야 합니다:
@@ -31,41 +37,323 @@ def extract_text_from_single_image_ocr(image_path, model):
           {"box_2d": [x1, y1, x2, y2], "label": "텍스트 내용"},
           ...
         ]
+        좌표는 입력된 이미지의 픽셀 단위(왼쪽 위가 0, 0)로 작성하세요.
 
         절대로 설명하지 말고, 감상하지 말고, 영어로 추론하지 말고,
         OCR로 인식한 한글 텍스트와 좌표만 JSON으로 출력하세요.
         """
-        print(f"  > '{os.path.basename(image_path)}' OCR 처리 중...")
-        response = model.generate_content([prompt_ocr, img])
-        
-        json_text_match = re.search(r'```json\s*([\s\S]*?)\s*```', response.text, re.DOTALL)
-        if json_text_match:
-            json_text = json_text_match.group(1)
-        else:
-            json_text = response.text.strip()
-            if not (json_text.startswith('[') and json_text.endswith(']')) and \
-               not (json_text.startswith('{') and json_text.endswith('}')):
-                print(f"  ⚠️ '{os.path.basename(image_path)}' 에서 OCR 응답이 예상된 JSON 형식이 아닙니다. 응답 일부: {json_text[:100]}...")
-                return []
 
+def _parse_ocr_response(response_text, image_name):
+    json_text_match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text, re.DOTALL)
+    if json_text_match:
+        json_text = json_text_match.group(1)
+    else:
+        json_text = response_text.strip()
+        if not (json_text.startswith('[') and json_text.endswith(']')) and \
+           not (json_text.startswith('{') and json_text.endswith('}')):
+            raise ValueError(f"'{image_name}' 에서 OCR 응답이 예상된 JSON 형식이 아닙니다. 응답 일부: {json_text[:100]}...")
+    try:
         extracted_data = json.loads(json_text)
-        for item in extracted_data:
-            if "label" in item and item["label"]:
-                extracted_labels.append(item["label"].strip())
-        print(f"  > '{os.path.basename(image_path)}' 에서 텍스트 {len(extracted_labels)}개 블록 추출 완료.")
+    except json.JSONDecodeError as e_json:
+        raise ValueError(f"'{image_name}' JSON 파싱 오류: {e_json} / Gemini OCR 응답 일부: {response_text[:200]}...")
+    if isinstance(extracted_data, dict):
+        extracted_data = [extracted_data]
+    return [item for item in extracted_data if isinstance(item, dict)]
+
+def get_ocr_cache():
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = SQLiteCache(OCR_CACHE_PATH, OCR_CACHE_MAX_BYTES)
+        return _ocr_cache
+
+def _ocr_cache_key(image_bytes, model_name, source_variant):
+    # 타일/프록시 설정이 바뀌면 결과(좌표/인식률)도 달라지므로 키에 포함
+    tile_variant = f"w{OCR_TILE_TARGET_WIDTH}h{OCR_TILE_HEIGHT}o{OCR_TILE_OVERLAP}q{OCR_TILE_JPEG_QUALITY}"
+    return f"{hashlib.sha256(image_bytes).hexdigest()}:{model_name}:{OCR_PROMPT_VERSION}:{tile_variant}:{source_variant}"
+
+def _original_width(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as original_img:
+        return original_img.size[0]
+
+def _is_blank_tile(tile_img):
+    return ImageStat.Stat(tile_img.convert("L")).stddev[0] < OCR_TILE_BLANK_STDDEV
+
+def prepare_ocr_tiles(img):
+    """OCR 업로드용 타일 목록을 만든다.
+    목표 폭으로 축소한 뒤 긴 이미지는 겹치는 구간을 두고 세로로 자르며, 단색/빈 타일은 제외한다.
+    각 타일은 원본 좌표로 되돌리기 위한 top/height(원본 px)와 scale(원본 px / 타일 px)을 함께 가진다."""
+    img = img.convert("RGB")
+    width, height = img.size
+    scale = min(1.0, OCR_TILE_TARGET_WIDTH / width)
+    if scale < 1.0:
+        img = img.resize((OCR_TILE_TARGET_WIDTH, max(1, round(height * scale))), Image.Resampling.LANCZOS)
+    scaled_width, scaled_height = img.size
+    inverse_scale = width / scaled_width
+
+    # 타일 하나 높이의 1.2배 이하라면 자르지 않고 한 장으로 보냄
+    if scaled_height <= OCR_TILE_HEIGHT * 1.2:
+        spans = [(0, scaled_height)]
+    else:
+        step = OCR_TILE_HEIGHT - OCR_TILE_OVERLAP
+        spans = []
+        top = 0
+        while True:
+            bottom = min(top + OCR_TILE_HEIGHT, scaled_height)
+            spans.append((top, bottom))
+            if bottom >= scaled_height:
+                break
+            top += step
 
+    tiles = []
+    for top, bottom in spans:
+        tile_img = img.crop((0, top, scaled_width, bottom))
+        if _is_blank_tile(tile_img):
+            continue
+        tiles.append({"index": len(tiles), "image": tile_img,
+                      "top": top * inverse_scale, "height": (bottom - top) * inverse_scale, "scale": inverse_scale})
+    return tiles
+
+def _encode_jpeg_part(img, quality=OCR_TILE_JPEG_QUALITY):
+    """PIL 이미지를 JPEG 인라인 데이터로 변환한다 (genai는 PIL 이미지를 무손실 WebP로 보내 크기가 커짐)."""
+    buffer = io.BytesIO()
+    img.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+    return {"mime_type": "image/jpeg", "data": buffer.getvalue()}
+
+def _remap_tile_items(tile_items, tile):
+    remapped = []
+    for item in tile_items:
+        item = dict(item)
+        box = item.get("box_2d")
+        if isinstance(box, (list, tuple)) and len(box) == 4 and all(isinstance(v, (int, float)) for v in box):
+            x1, y1, x2, y2 = box
+            item["box_2d"] = [round(x1 * tile["scale"]), round(tile["top"] + y1 * tile["scale"]),
+                              round(x2 * tile["scale"]), round(tile["top"] + y2 * tile["scale"])]
+        remapped.append(item)
+    return remapped
+
+def _valid_box(item):
+    box = item.get("box_2d")
+    return box if isinstance(box, list) and len(box) == 4 else None
+
+def _is_overlap_duplicate(item, prev_item, band_top, band_bottom):
+    """두 항목이 같은 글자를 인접한 타일의 겹치는 구간에서 각각 읽은 것인지 판단한다."""
+    box, prev_box = _valid_box(item), _valid_box(prev_item)
+    if box is None or prev_box is None or item.get("label") != prev_item.get("label"):
+        return False
+    in_band = all(band_top <= b[1] and b[3] <= band_bottom for b in (box, prev_box))
+    x_overlaps = min(box[2], prev_box[2]) > max(box[0], prev_box[0])
+    return in_band and x_overlaps
+
+def _merge_tile_items(per_tile_items, tiles):
+    """원본 좌표로 옮긴 타일별 결과를 합친다. 인접한 두 타일이 겹치는 구간에서 같은 글자를 읽었다면 하나만 남긴다.
+    같은 타일 안에서 반복되는 글자(여러 번 적힌 가격 등)는 그대로 둔다."""
+    merged = []
+    prev_tile_items = []
+    for tile_pos, tile_items in enumerate(per_tile_items):
+        candidates = []
+        if tile_pos > 0:
+            prev_tile, tile = tiles[tile_pos - 1], tiles[tile_pos]
+            band_top, band_bottom = tile["top"], prev_tile["top"] + prev_tile["height"]
+            if band_bottom > band_top:
+                candidates = list(prev_tile_items)
+        kept = []
+        for item in tile_items:
+            match = next((prev for prev in candidates if _is_overlap_duplicate(item, prev, band_top, band_bottom)), None)
+            if match is not None:
+                candidates.remove(match) # 이전 타일의 항목 하나는 한 번만 짝지음
+                continue
+            kept.append(item)
+        merged.extend(kept)
+        prev_tile_items = kept
+    return merged
+
+def _request_tile_items(tile, image_name, model, on_retry):
+    if tile.get("upload_path"):
+        registry = get_image_registry()
+        image_part, sent_bytes = registry.acquire(tile["upload_path"])
+        response = registry.call_with_parts({tile["upload_path"]: image_part}, lambda parts: gemini_gateway.generate_content(
+            model, "ocr_tile", [OCR_PROMPT, parts[tile["upload_path"]]], on_retry=on_retry,
+            file=image_name, tile=tile["index"] + 1, upload_bytes=sent_bytes))
+    else:
+        image_part = _encode_jpeg_part(tile["image"])
+        sent_bytes = len(image_part["data"])
+        response = gemini_gateway.generate_content(model, "ocr_tile", [OCR_PROMPT, image_part], on_retry=on_retry,
+                                                   file=image_name, tile=tile["index"] + 1, upload_bytes=sent_bytes)
+    tile_items = _parse_ocr_response(response.text, f"{image_name}#tile{tile['index'] + 1}")
+    return _remap_tile_items(tile_items, tile), sent_bytes
+
+def request_ocr_items(image_path, model, on_retry=None, tile_executor=None, upload_stats=None):
+    """이미지 하나를 OCR하여 box_2d/label 항목 리스트를 (원본 이미지 좌표 기준으로) 반환한다.
+    같은 이미지 내용/모델/프롬프트 버전의 결과가 캐시에 있으면 API를 호출하지 않는다.
+    긴 이미지는 타일로 나눠 요청하며, tile_executor가 주어지면 타일을 병렬로 처리한다.
+    분당 요청 상한을 지키고, 쿼터/일시적 오류는 지수 백오프로 재시도한다. 실패 시 예외를 던진다."""
+    image_name = os.path.basename(image_path)
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    # 캐시 키는 원본 내용으로 만들고, 실제 업로드는 프록시(있으면)에서 타일을 잘라 보낸다
+    source_path = get_proxy_path(image_path)
+    source_variant = proxy_variant() if source_path != image_path else "original"
+    cache = get_ocr_cache()
+    cache_key = _ocr_cache_key(image_bytes, getattr(model, "model_name", GEMINI_VISION_MODEL_NAME), source_variant)
+    cached_items = cache.get_json(cache_key)
+    if cached_items is not None:
+        print(f"  > '{image_name}' OCR 캐시 사용")
+        return cached_items
+
+    # 목표 폭 이상이 되는 범위에서 축소 디코딩 (OCR 결과가 캐시되므로 디코딩한 이미지는 보관하지 않음)
+    img = get_image_store().get(source_path, fit=(OCR_TILE_TARGET_WIDTH, None), cache=False)
+    source_scale = _original_width(image_bytes) / img.size[0]
+    tiles = prepare_ocr_tiles(img)
+    for tile in tiles: # 디코딩한 (프록시) 이미지 좌표 -> 원본 좌표
+        tile["top"] *= source_scale
+        tile["height"] *= source_scale
+        tile["scale"] *= source_scale
+    if len(tiles) == 1 and get_image_registry().shares_uploads:
+        # 한 장으로 보내는 이미지는 타일 대신 (프록시) 업로드 핸들을 보내, 이후 캡션/추천 프롬프트와 업로드를 공유
+        # (타일은 축소 디코딩한 크기 기준이므로 배율은 업로드되는 파일의 폭으로 다시 계산)
+        with Image.open(source_path) as upload_img:
+            upload_scale = _original_width(image_bytes) / upload_img.size[0]
+        tiles[0].update(upload_path=image_path, top=0.0, scale=upload_scale)
+    if len(tiles) > 1:
+        print(f"  > '{image_name}' 타일 {len(tiles)}개로 분할하여 OCR")
+
+    run_tile = carry_context(lambda tile: _request_tile_items(tile, image_name, model, on_retry))
+    tile_results = list(tile_executor.map(run_tile, tiles)) if tile_executor else [run_tile(t) for t in tiles]
+    if upload_stats is not None:
+        upload_stats["tiles"] = len(tiles)
+        upload_stats["upload_bytes"] = sum(sent_bytes for _, sent_bytes in tile_results)
+        upload_stats["source_bytes"] = len(image_bytes)
+
+    ocr_items = _merge_tile_items([items for items, _ in tile_results], tiles)
+    cache.put_json(cache_key, ocr_items)
+    return ocr_items
+
+def _labels_from_items(ocr_items):
+    return [item["label"].strip() for item in ocr_items
+            if isinstance(item.get("label"), str) and item["label"].strip()]
+
+def extract_text_from_single_image_ocr(image_path, model):
+    extracted_labels = []
+    try:
+        print(f"  > '{os.path.basename(image_path)}' OCR 처리 중...")
+        extracted_labels = _labels_from_items(request_ocr_items(image_path, model))
+        print(f"  > '{os.path.basename(image_path)}' 에서 텍스트 {len(extracted_labels)}개 블록 추출 완료.")
     except FileNotFoundError:
         print(f"  ⚠️ 파일을 찾을 수 없습니다: {image_path}")
-    except json.JSONDecodeError as e_json:
-        print(f"  ⚠️ '{os.path.basename(image_path)}' JSON 파싱 오류: {e_json}")
-        print(f"  Gemini OCR 응답 일부: {response.text[:200]}...")
+    except ValueError as e_parse:
+        print(f"  ⚠️ {e_parse}")
     except Exception as e:
         print(f"  ⚠️ '{os.path.basename(image_path)}' OCR 처리 중 오류 발생: {e}")
     return extracted_labels
 
-def extract_texts_from_images_in_folder(image_folder_path=IMAGES_RAW_FOLDER):
-    configure_gemini_api()
-    model = genai.GenerativeModel(GEMINI_VISION_MODEL_NAME)
+def _run_ocr_task(image_path, model, tile_executor=None):
+    image_name = os.path.basename(image_path)
+    result = {"file": image_name, "items": [], "labels": [], "retries": 0, "error": None,
+              "tiles": 0, "upload_bytes": 0, "source_bytes": 0}
+
+    def _on_retry(attempt, error, delay):
+        result["retries"] += 1
+        print(f"  ↻ '{image_name}' OCR 재시도 {attempt}회차 ({delay:.1f}초 후): {error}")
+
+    started_at = time.perf_counter()
+    with span("ocr.image", file=image_name) as ocr_span:
+        try:
+            upload_stats = {}
+            result["items"] = request_ocr_items(image_path, model, on_retry=_on_retry,
+                                                tile_executor=tile_executor, upload_stats=upload_stats)
+            result.update(upload_stats)
+            result["labels"] = _labels_from_items(result["items"])
+            print(f"  > '{image_name}' 에서 텍스트 {len(result['labels'])}개 블록 추출 완료.")
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            print(f"  ⚠️ '{image_name}' OCR 처리 중 오류 발생: {e}")
+        ocr_span.set(tiles=result["tiles"], labels=len(result["labels"]), error=result["error"])
+    result["latency_seconds"] = time.perf_counter() - started_at
+    return result
+
+def get_last_ocr_stats():
+    """가장 최근 extract_texts_from_images_in_folder 실행의 이미지별 지연/실패 통계."""
+    with _last_ocr_stats_lock:
+        return dict(_last_ocr_stats)
+
+def _record_ocr_stats(ocr_results, elapsed_seconds, cache_hits, cache_misses):
+    global _last_ocr_stats
+    latencies = sorted(r["latency_seconds"] for r in ocr_results)
+    stats = {
+        "images": len(ocr_results),
+        "failures": sum(1 for r in ocr_results if r["error"]),
+        "retries": sum(r["retries"] for r in ocr_results),
+        "cache_hits": cache_hits,
+        "cache_misses": cache_misses,
+        "tiles": sum(r["tiles"] for r in ocr_results),
+        "upload_bytes": sum(r["upload_bytes"] for r in ocr_results),
+        "source_bytes": sum(r["source_bytes"] for r in ocr_results),
+        "elapsed_seconds": elapsed_seconds,
+        "latency_p50_seconds": latencies[len(latencies) // 2] if latencies else 0.0,
+        "latency_max_seconds": latencies[-1] if latencies else 0.0,
+        "per_image": [{k: r[k] for k in ("file", "latency_seconds", "retries", "error", "tiles", "upload_bytes")}
+                      for r in ocr_results],
+    }
+    with _last_ocr_stats_lock:
+        _last_ocr_stats = stats
+    print(f"OCR 통계: 이미지 {stats['images']}개, 실패 {stats['failures']}개, 재시도 {stats['retries']}회, "
+          f"캐시 적중 {cache_hits}개 / 미적중 {cache_misses}개, 타일 {stats['tiles']}개 "
+          f"(업로드 {stats['upload_bytes'] / 1024:.0f} KB, 원본 {stats['source_bytes'] / 1024:.0f} KB), "
+          f"지연 중앙값 {stats['latency_p50_seconds']:.2f}초 / 최대 {stats['latency_max_seconds']:.2f}초, "
+          f"경과 {elapsed_seconds:.2f}초")
+
+def _finish_ocr_results(ocr_results, output_folder):
+    all_extracted_texts = []
+    for ocr_result in ocr_results:
+        all_extracted_texts.extend(ocr_result["labels"])
+
+    print(f"\n총 {len(all_extracted_texts)}개의 텍스트 조각을 모든 이미지에서 OCR로 추출했습니다.")
+    if all_extracted_texts:
+        ensure_folder_exists(output_folder)
+        extracted_texts_file_path = os.path.join(output_folder, "ocr_extracted_texts.txt")
+        save_text_to_file("\n".join(all_extracted_texts), extracted_texts_file_path)
+    else:
+        print("\nOCR로 추출된 텍스트가 없어 파일을 저장하지 않습니다.")
+    return all_extracted_texts
+
+class StreamingOCR:
+    """다운로드가 끝난 이미지부터 바로 (프록시 생성 ->) OCR을 시작한다.
+    finish()는 폴더 단위 OCR과 같은 순서(파일명 순)로 텍스트를 합쳐 같은 파일에 저장한다."""
+
+    def __init__(self, output_folder=EXTRACTED_TEXTS_FOLDER):
+        self.output_folder = output_folder
+        self._model = gemini_gateway.get_model(GEMINI_VISION_MODEL_NAME)
+        self._tile_executor = ThreadPoolExecutor(max_workers=OCR_MAX_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(max_workers=OCR_MAX_CONCURRENCY)
+        self._futures = []
+        self._process_in_context = carry_context(self._process) # 다운로드 스레드가 아니라 생성한 쪽 span 아래에 기록
+        self._cache = get_ocr_cache()
+        self._hits_before, self._misses_before = self._cache.hits, self._cache.misses
+        self._started_at = time.perf_counter()
+        print(f"Gemini Vision 모델 ({GEMINI_VISION_MODEL_NAME}) 로드 완료 (for OCR, 다운로드와 동시 진행).")
+
+    def _process(self, image_path):
+        create_image_proxy(image_path)
+        return _run_ocr_task(image_path, self._model, self._tile_executor)
+
+    def submit(self, image_path):
+        """다운로드 완료 콜백에서 호출된다 (스레드 안전)."""
+        if image_path.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            self._futures.append(self._executor.submit(self._process_in_context, image_path))
+
+    def finish(self):
+        try:
+            ocr_results = sorted((future.result() for future in list(self._futures)), key=lambda r: r["file"])
+        finally:
+            self._executor.shutdown(wait=True)
+            self._tile_executor.shutdown(wait=True)
+        _record_ocr_stats(ocr_results, time.perf_counter() - self._started_at,
+                          self._cache.hits - self._hits_before, self._cache.misses - self._misses_before)
+        return _finish_ocr_results(ocr_results, self.output_folder)
+
+def extract_texts_from_images_in_folder(image_folder_path=IMAGES_RAW_FOLDER, output_folder=EXTRACTED_TEXTS_FOLDER):
+    model = gemini_gateway.get_model(GEMINI_VISION_MODEL_NAME)
     print(f"Gemini Vision 모델 ({GEMINI_VISION_MODEL_NAME}) 로드 완료 (for OCR).")
 
     all_extracted_texts = []
@@ -74,21 +362,25 @@ def extract_texts_from_images_in_folder(image_folder_path=IMAGES_RAW_FOLDER):
         print(f"'{image_folder_path}' 폴더가 비어있거나 존재하지 않습니다. 텍스트 추출을 건너<0xEB><0x9B><0x84>니다.")
         return all_extracted_texts
 
-    image_files = [f for f in os.listdir(image_folder_path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp'))]
+    image_files = sorted(f for f in os.listdir(image_folder_path) if f.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))
     if not image_files:
         print("OCR을 수행할 유효한 이미지 파일이 없습니다.")
         return all_extracted_texts
 
-    for fname in image_files:
-        img_path = os.path.join(image_folder_path, fname)
-        texts_from_img = extract_text_from_single_image_ocr(img_path, model)
-        all_extracted_texts.extend(texts_from_img)
+    max_workers = max(1, min(OCR_MAX_CONCURRENCY, len(image_files)))
+    print(f"OCR 대상 이미지 {len(image_files)}개 (동시 요청 {OCR_MAX_CONCURRENCY}개, 분당 최대 {GEMINI_REQUESTS_PER_MINUTE}회)")
+    cache = get_ocr_cache()
+    hits_before, misses_before = cache.hits, cache.misses
+    started_at = time.perf_counter()
+    # 이미지 단위 작업(디코딩/타일 분할)과 타일 단위 API 요청을 별도 풀로 나눠,
+    # 동시에 나가는 요청 수는 타일 풀 크기(OCR_MAX_CONCURRENCY)로 제한된다.
+    with ThreadPoolExecutor(max_workers=OCR_MAX_CONCURRENCY) as tile_executor, \
+         ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map은 제출 순서대로 결과를 돌려주므로 완료 순서와 무관하게 이미지 순서가 유지됨
+        ocr_results = list(executor.map(
+            carry_context(lambda fname: _run_ocr_task(os.path.join(image_folder_path, fname), model, tile_executor)),
+            image_files))
+    _record_ocr_stats(ocr_results, time.perf_counter() - started_at,
+                      cache.hits - hits_before, cache.misses - misses_before)
 
-    print(f"\n총 {len(all_extracted_texts)}개의 텍스트 조각을 모든 이미지에서 OCR로 추출했습니다.")
-    if all_extracted_texts:
-        ensure_folder_exists(EXTRACTED_TEXTS_FOLDER)
-        extracted_texts_file_path = os.path.join(EXTRACTED_TEXTS_FOLDER, "ocr_extracted_texts.txt")
-        save_text_to_file("\n".join(all_extracted_texts), extracted_texts_file_path)
-    else:
-        print("\nOCR로 추출된 텍스트가 없어 파일을 저장하지 않습니다.")
-    return all_extracted_texts
\ No newline at end of file
+    return _finish_ocr_results(ocr_results, output_folder)
@@ -0,0 +1,92 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from config import (IMAGE_PROXY_MAX_EDGE, IMAGE_PROXY_STRIP_ASPECT, IMAGE_PROXY_FORMAT,
+                    IMAGE_PROXY_QUALITY, OCR_MAX_CONCURRENCY)
+from utils.file_utils import ensure_folder_exists
+from utils.logging_utils import span, carry_context
+
+# Gemini 호출에는 원본 대신 작업별로 한 번 만든 저용량 프록시 이미지를 사용한다.
+# 프록시는 원본 폴더 아래 _proxies/ 에 저장되므로 원본 목록(확장자 필터)에는 섞이지 않는다.
+PROXY_FOLDER_NAME = "_proxies"
+
+def _proxy_extension():
+    return ".webp" if IMAGE_PROXY_FORMAT.upper() == "WEBP" else ".jpg"
+
+def proxy_path_for(image_path):
+    folder, filename = os.path.split(image_path)
+    return os.path.join(folder, PROXY_FOLDER_NAME, os.path.splitext(filename)[0] + _proxy_extension())
+
+def get_proxy_path(image_path):
+    """프록시가 만들어져 있으면 프록시 경로, 없으면 원본 경로를 반환한다."""
+    proxy_path = proxy_path_for(image_path)
+    return proxy_path if os.path.exists(proxy_path) else image_path
+
+def proxy_variant():
+    """프록시 설정을 나타내는 문자열 (프록시 기반 결과를 캐시할 때 키에 포함)."""
+    return f"{IMAGE_PROXY_FORMAT}{IMAGE_PROXY_MAX_EDGE}q{IMAGE_PROXY_QUALITY}a{IMAGE_PROXY_STRIP_ASPECT}"
+
+def _proxy_size(width, height):
+    if height / width > IMAGE_PROXY_STRIP_ASPECT:
+        scale = min(1.0, IMAGE_PROXY_MAX_EDGE / width)
+    else:
+        scale = min(1.0, IMAGE_PROXY_MAX_EDGE / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def _create_proxy(image_path):
+    proxy_path = proxy_path_for(image_path)
+    if os.path.exists(proxy_path) and os.path.getmtime(proxy_path) >= os.path.getmtime(image_path):
+        return proxy_path
+    with Image.open(image_path) as img:
+        target_size = _proxy_size(*img.size)
+        img.draft("RGB", target_size) # JPEG은 디코딩 단계에서 바로 축소
+        proxy_img = img.convert("RGB")
+        if proxy_img.size != target_size:
+            proxy_img = proxy_img.resize(target_size, Image.Resampling.LANCZOS)
+    ensure_folder_exists(os.path.dirname(proxy_path))
+    # 스트리밍 OCR과 프록시 단계가 같은 이미지를 동시에 다룰 수 있으므로, 다 쓴 파일만 보이도록 임시 파일에 저장 후 교체
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(proxy_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            proxy_img.save(f, format=IMAGE_PROXY_FORMAT, quality=IMAGE_PROXY_QUALITY)
+        os.replace(tmp_path, proxy_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return proxy_path
+
+def create_image_proxy(image_path):
+    """이미지 하나의 프록시를 만든다 (이미 최신이면 그대로). 실패하면 None을 반환하고 원본이 쓰인다."""
+    try:
+        with span("proxy.image", file=os.path.basename(image_path)):
+            return _create_proxy(image_path)
+    except Exception as e:
+        print(f"    ⚠️ 프록시 생성 실패, 원본을 사용합니다: {image_path}, 오류: {e}")
+        return None
+
+def generate_image_proxies(image_paths):
+    """이미지마다 프록시를 (없거나 원본보다 오래된 경우에만) 생성하고 용량 보고를 반환한다.
+    반환값: {"proxies": {원본 경로: 프록시 경로}, "original_bytes": int, "proxy_bytes": int}"""
+    report = {"proxies": {}, "original_bytes": 0, "proxy_bytes": 0}
+    image_paths = [path for path in image_paths if os.path.exists(path)]
+    if not image_paths:
+        return report
+
+    with ThreadPoolExecutor(max_workers=max(1, min(OCR_MAX_CONCURRENCY, len(image_paths)))) as executor:
+        proxy_paths = list(executor.map(carry_context(create_image_proxy), image_paths))
+
+    for image_path, proxy_path in zip(image_paths, proxy_paths):
+        if not proxy_path:
+            continue
+        report["proxies"][image_path] = proxy_path
+        report["original_bytes"] += os.path.getsize(image_path)
+        report["proxy_bytes"] += os.path.getsize(proxy_path)
+    if report["original_bytes"]:
+        saved_ratio = 1 - report["proxy_bytes"] / report["original_bytes"]
+        print(f"프록시 이미지 {len(report['proxies'])}개 준비 완료: "
+              f"원본 {report['original_bytes'] / (1024 * 1024):.2f} MB -> 프록시 {report['proxy_bytes'] / (1024 * 1024):.2f} MB "
+              f"({saved_ratio * 100:.0f}% 절감)")
+    return report
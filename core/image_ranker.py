@@ -0,0 +1,115 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from config import (GEMINI_VISION_MODEL_NAME, GEMINI_EMBEDDING_MODEL_NAME, OCR_MAX_CONCURRENCY, IMAGE_CAPTION_CACHE_PATH, IMAGE_CAPTION_CACHE_MAX_BYTES,
+                    IMAGE_RANKER_REUSE_PENALTY)
+from core.image_proxy import get_proxy_path, proxy_variant
+from core import gemini_gateway
+from core.image_upload_registry import get_image_registry
+from utils.sqlite_cache import SQLiteCache
+from utils.file_utils import file_sha256
+from utils.logging_utils import carry_context
+
+# 이미지마다 캡션을 한 번만 만들고(콘텐츠 해시로 캐시), 캡션과 씬 설명을 임베딩하여
+# NumPy 코사인 유사도로 씬-이미지를 한 번에 매칭한다.
+
+CAPTION_PROMPT_VERSION = "v1"
+CAPTION_PROMPT = """
+이 이미지는 온라인 쇼핑몰 상품 상세 페이지의 일부입니다.
+이미지에 보이는 장면을 한국어 1~2문장으로 설명하고, 이어서 핵심 태그를 쉼표로 나열하세요.
+글자/표/스펙 위주의 이미지라면 반드시 "텍스트 위주" 태그를, 배송/반품/고객센터 안내 이미지라면 "안내문" 태그를 넣으세요.
+다른 말은 덧붙이지 마세요.
+"""
+EMBEDDING_BATCH_SIZE = 100
+
+_caption_cache = None
+_caption_cache_lock = threading.Lock()
+
+def _get_caption_cache():
+    global _caption_cache
+    with _caption_cache_lock:
+        if _caption_cache is None:
+            _caption_cache = SQLiteCache(IMAGE_CAPTION_CACHE_PATH, IMAGE_CAPTION_CACHE_MAX_BYTES)
+        return _caption_cache
+
+def caption_image(image_path, model=None):
+    """이미지 캡션을 반환한다. 같은 내용의 이미지는 캐시에서 바로 가져온다."""
+    cache = _get_caption_cache()
+    source_path = get_proxy_path(image_path)
+    source_variant = proxy_variant() if source_path != image_path else "original"
+    cache_key = f"caption:{file_sha256(image_path)}:{GEMINI_VISION_MODEL_NAME}:{CAPTION_PROMPT_VERSION}:{source_variant}"
+    cached = cache.get_json(cache_key)
+    if cached is not None:
+        return cached["caption"]
+    model = model or gemini_gateway.get_model(GEMINI_VISION_MODEL_NAME)
+    registry = get_image_registry()
+    image_part = {image_path: registry.acquire(image_path)[0]} # 업로드 실패는 예외로 전달
+    response = registry.call_with_parts(image_part, lambda parts: gemini_gateway.generate_content(
+        model, "caption", [CAPTION_PROMPT, parts[image_path]], file=os.path.basename(image_path)))
+    caption = response.text.strip()
+    cache.put_json(cache_key, {"caption": caption})
+    print(f"    [Image Ranker] 캡션 생성: {os.path.basename(image_path)} -> {caption[:40]}...")
+    return caption
+
+def embed_texts(texts, task_type):
+    """텍스트 목록을 임베딩 행렬(float32, 행 단위 L2 정규화)로 반환한다. 캐시에 없는 것만 배치로 요청한다."""
+    cache = _get_caption_cache()
+    keys = [f"embedding:{task_type}:{GEMINI_EMBEDDING_MODEL_NAME}:{hashlib.sha256(t.encode('utf-8')).hexdigest()}"
+            for t in texts]
+    vectors = [None] * len(texts)
+    missing = []
+    for idx, key in enumerate(keys):
+        cached = cache.get(key)
+        if cached is not None:
+            vectors[idx] = np.frombuffer(cached[0], dtype=np.float32)
+        else:
+            missing.append(idx)
+
+    if missing:
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+            result = gemini_gateway.embed_content(GEMINI_EMBEDDING_MODEL_NAME, [texts[i] for i in batch], task_type,
+                                                  texts=len(batch))
+            for idx, embedding in zip(batch, result["embedding"]):
+                vector = np.asarray(embedding, dtype=np.float32)
+                vectors[idx] = vector
+                cache.put(keys[idx], vector.tobytes())
+
+    matrix = np.vstack(vectors)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def build_image_index(image_paths):
+    """이미지 경로 목록에 대한 (캡션 목록, 정규화된 임베딩 행렬)을 만든다. 캡션은 병렬로 생성한다."""
+    model = gemini_gateway.get_model(GEMINI_VISION_MODEL_NAME)
+    with ThreadPoolExecutor(max_workers=max(1, min(OCR_MAX_CONCURRENCY, len(image_paths)))) as executor:
+        captions = list(executor.map(carry_context(lambda path: caption_image(path, model)), image_paths))
+    return captions, embed_texts(captions, "retrieval_document")
+
+def _scene_query_text(scene_description, scene_narration):
+    return f"{scene_description or ''}\n{scene_narration or ''}".strip()
+
+def score_scenes_against_images(scenes, image_paths):
+    """씬 목록 x 이미지 목록의 코사인 유사도 행렬을 한 번의 행렬곱으로 계산한다."""
+    _, image_matrix = build_image_index(image_paths)
+    queries = [_scene_query_text(s.get("recommended_image_description"), s.get("narration")) or "상품 사진"
+               for s in scenes]
+    query_matrix = embed_texts(queries, "retrieval_query")
+    return query_matrix @ image_matrix.T
+
+def rank_images_for_scene(scene_description, scene_narration, available_image_paths,
+                          previously_used_filenames=None):
+    """씬 하나에 대해 (이미지 경로, 점수)를 점수 내림차순으로 반환한다.
+    이미 사용된 이미지는 IMAGE_RANKER_REUSE_PENALTY 만큼 점수를 낮춘다."""
+    scene = {"recommended_image_description": scene_description, "narration": scene_narration}
+    scores = score_scenes_against_images([scene], available_image_paths)[0].copy()
+    if previously_used_filenames:
+        used = set(previously_used_filenames)
+        for idx, path in enumerate(available_image_paths):
+            if os.path.basename(path) in used:
+                scores[idx] -= IMAGE_RANKER_REUSE_PENALTY
+    order = np.argsort(-scores)
+    return [(available_image_paths[idx], float(scores[idx])) for idx in order]
@@ -0,0 +1,139 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+from config import IMAGE_STORE_MAX_BYTES
+from utils.logging_utils import increment
+
+# 작업 하나에서 이미지를 디코딩하는 곳(OCR 타일 준비, 씬 프레임 합성)이 모두 거치는 저장소.
+# - 필요한 크기가 원본보다 작으면 JPEG는 draft()로 DCT 단계에서 1/2~1/8 크기로 바로 디코딩하고,
+#   그 밖의 형식은 reduce()로 정수배 축소한 뒤 호출한 쪽에서 최종 크기로 리샘플링한다.
+# - 파일 핸들은 디코딩이 끝나는 즉시 닫는다 (지연 로딩된 Image를 밖으로 내보내지 않음).
+# - 디코딩한 이미지는 (경로, 수정 시각, 요청 크기)별로 픽셀 바이트 합계 상한이 있는 LRU에 보관한다.
+#   반환한 이미지는 여러 호출이 공유하므로 수정하지 말고, 그릴 때는 copy()해서 쓴다.
+
+def _fit_size(size, box):
+    """size를 box(가로, 세로; None이면 제한 없음) 안에 비율을 유지하며 넣었을 때의 크기."""
+    width, height = size
+    scale = min(box[0] / width if box[0] else 1.0, box[1] / height if box[1] else 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+def decode_image(path, fit=None, mode="RGB"):
+    """path를 mode로 디코딩한다. fit(가로, 세로)이 주어지면 그 안에 들어갈 크기 이상이 되는 범위에서
+    가능한 한 작게 디코딩한다 (최종 크기 맞춤은 호출한 쪽에서)."""
+    with Image.open(path) as img:
+        if fit is None:
+            return img.convert(mode)
+        target = _fit_size(img.size, fit)
+        if target[0] >= img.width and target[1] >= img.height:
+            return img.convert(mode)
+        img.draft(mode, target) # JPEG가 아니면 아무 일도 하지 않음
+        decoded = img.convert(mode)
+    factor = min(decoded.width // target[0], decoded.height // target[1])
+    if factor >= 2:
+        decoded = decoded.reduce(factor)
+    return decoded
+
+class ImageStore:
+    def __init__(self, max_bytes=IMAGE_STORE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # 키 -> 디코딩된 Image (오래 안 쓴 것이 앞)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.decodes = 0
+        self.hits = 0
+        self.evictions = 0
+        self.peak_bytes = 0
+
+    def _lookup(self, key):
+        with self._lock:
+            img = self._entries.get(key)
+            if img is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if img is not None:
+            increment("cache_hits")
+            increment("cache_hits.image_store")
+        return img
+
+    def _store(self, key, img):
+        size = _image_bytes(img)
+        with self._lock:
+            self.decodes += 1
+            if size > self.max_bytes or key in self._entries:
+                return
+            self._entries[key] = img
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                # 이미 받아 간 호출이 쓰고 있을 수 있으므로 close()하지 않고 참조만 놓는다
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _image_bytes(evicted)
+                self.evictions += 1
+            self.peak_bytes = max(self.peak_bytes, self._bytes)
+        increment("cache_misses")
+        increment("cache_misses.image_store")
+
+    @staticmethod
+    def _key(kind, path, size_spec, mode):
+        stat = os.stat(path)
+        return kind, os.path.abspath(path), stat.st_mtime_ns, stat.st_size, size_spec, mode
+
+    def get(self, path, fit=None, mode="RGB", cache=True):
+        """path를 디코딩한 이미지 (fit은 decode_image 참고). cache=False면 한 번만 쓰는 이미지로 보고 보관하지 않는다."""
+        if not cache:
+            with self._lock:
+                self.decodes += 1
+            return decode_image(path, fit, mode)
+        key = self._key("image", path, fit, mode)
+        img = self._lookup(key)
+        if img is None:
+            img = decode_image(path, fit, mode)
+            self._store(key, img)
+        return img
+
+    def frame(self, path, resolution):
+        """path를 resolution(가로, 세로) 화면에 맞춰 검은 여백으로 패딩한 RGB 이미지."""
+        key = self._key("frame", path, tuple(resolution), "RGB")
+        frame = self._lookup(key)
+        if frame is None:
+            decoded = decode_image(path, fit=resolution)
+            frame = ImageOps.pad(decoded, resolution, method=Image.Resampling.LANCZOS, color=(0, 0, 0))
+            self._store(key, frame)
+        return frame
+
+    def close(self):
+        """보관한 이미지를 모두 놓는다 (작업 종료 시)."""
+        with self._lock:
+            entries, self._entries, self._bytes = self._entries, OrderedDict(), 0
+            stats = (self.decodes, self.hits, self.evictions, self.peak_bytes)
+            self.decodes = self.hits = self.evictions = self.peak_bytes = 0
+        entries.clear()
+        if stats[0]:
+            print(f"이미지 저장소 정리 완료 (디코딩 {stats[0]}회, 재사용 {stats[1]}회, 밀려남 {stats[2]}회, "
+                  f"최대 {stats[3] / (1024 * 1024):.1f} MB).")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_image_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore()
+        return _store
+
+def release_image_store():
+    with _store_lock:
+        store = _store
+    if store is not None:
+        store.close()
@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+import google.generativeai as genai
+
+from config import (GEMINI_IMAGE_TRANSPORT, GEMINI_FILE_TTL_SECONDS, API_RETRY_MAX_ATTEMPTS,
+                    API_RETRY_BASE_DELAY_SECONDS, API_RETRY_MAX_DELAY_SECONDS)
+from core import gemini_gateway
+from core.image_proxy import get_proxy_path
+from utils.file_utils import file_sha256
+from utils.rate_limit_utils import call_with_retry
+from utils.logging_utils import span, increment
+
+# 여러 Gemini 프롬프트(OCR, 캡션, 씬별 추천, 스토리보드)에 같은 상품 이미지가 반복해서 들어가므로,
+# 이미지(프록시가 있으면 프록시)마다 한 번만 올리고 프롬프트에는 그 핸들을 넣는다.
+# 업로드 방식은 백엔드로 교체할 수 있다:
+#   "file_api": Gemini 파일 업로드 API. 프롬프트에는 파일 참조만 들어가므로 여러 이미지 요청도 수 KB.
+#   "inline": 업로드 없이 이미지 파일 바이트를 인라인 파트로 한 번만 읽어 재사용 (오프라인/테스트용 대체 구현).
+# 핸들은 내용 해시로 찾고 만료 시각을 기록해 만료가 가까우면 다시 올린다. 요청이 "파일 없음"으로 실패해도
+# 해당 핸들을 버리고 다시 올린 뒤 한 번 더 시도한다.
+
+_MISSING_UPLOAD_ERROR_NAMES = {"NotFound", "PermissionDenied", "FailedPrecondition"}
+EXPIRY_MARGIN_SECONDS = 10 * 60 # 만료까지 이만큼도 안 남았으면 새로 올림
+PROCESSING_POLL_SECONDS = 0.5
+PROCESSING_TIMEOUT_SECONDS = 30
+
+_MIME_TYPES = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+def _mime_type_for(path):
+    return _MIME_TYPES.get(os.path.splitext(path)[1].lower(), "image/jpeg")
+
+class InlineImageBackend:
+    """업로드 없이 파일 바이트를 인라인 데이터로 넣는다. 인코딩/읽기는 이미지당 한 번."""
+    name = "inline"
+    shares_uploads = False # 매 요청에 바이트가 실리므로 요청 크기는 줄지 않음
+
+    def upload(self, path, mime_type):
+        with open(path, "rb") as f:
+            data = f.read()
+        return {"mime_type": mime_type, "data": data}, None, 0
+
+    def delete(self, part):
+        pass
+
+    def is_missing_upload_error(self, error):
+        return False
+
+class GeminiFileBackend:
+    """Gemini 파일 업로드 API. 업로드한 파일은 서버에서 일정 시간(기본 48시간) 뒤 삭제된다."""
+    name = "file_api"
+    shares_uploads = True
+
+    def upload(self, path, mime_type):
+        gemini_gateway.configure_gemini()
+        uploaded = call_with_retry(
+            lambda: genai.upload_file(path, mime_type=mime_type, display_name=os.path.basename(path)),
+            API_RETRY_MAX_ATTEMPTS, API_RETRY_BASE_DELAY_SECONDS, API_RETRY_MAX_DELAY_SECONDS)
+        deadline = time.monotonic() + PROCESSING_TIMEOUT_SECONDS
+        while getattr(getattr(uploaded, "state", None), "name", "ACTIVE") == "PROCESSING":
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"업로드한 파일이 처리 중 상태에서 넘어가지 않습니다: {uploaded.name}")
+            time.sleep(PROCESSING_POLL_SECONDS)
+            uploaded = genai.get_file(uploaded.name)
+        if getattr(getattr(uploaded, "state", None), "name", "ACTIVE") == "FAILED":
+            raise ValueError(f"파일 업로드 처리 실패: {uploaded.name}")
+        expiration_time = getattr(uploaded, "expiration_time", None)
+        expires_at = expiration_time.timestamp() if expiration_time else time.time() + GEMINI_FILE_TTL_SECONDS
+        return uploaded, expires_at, os.path.getsize(path)
+
+    def delete(self, part):
+        try:
+            genai.delete_file(part.name)
+        except Exception as e:
+            print(f"    ⚠️ 업로드 파일 삭제 실패 ({part.name}): {e}")
+
+    def is_missing_upload_error(self, error):
+        return type(error).__name__ in _MISSING_UPLOAD_ERROR_NAMES and "file" in str(error).lower()
+
+class _Upload:
+    __slots__ = ("part", "expires_at")
+
+    def __init__(self, part, expires_at):
+        self.part = part
+        self.expires_at = expires_at
+
+    def is_fresh(self):
+        return self.expires_at is None or self.expires_at - time.time() > EXPIRY_MARGIN_SECONDS
+
+class ImageUploadRegistry:
+    def __init__(self, backend):
+        self.backend = backend
+        self._uploads = {} # 내용 해시 -> _Upload
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self.uploads = 0
+        self.reuses = 0
+
+    @property
+    def shares_uploads(self):
+        return self.backend.shares_uploads
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def acquire(self, image_path):
+        """image_path(프록시가 있으면 프록시)의 프롬프트 파트를 반환한다. (파트, 이번에 업로드한 바이트 수)"""
+        source_path = get_proxy_path(image_path)
+        key = file_sha256(source_path)
+        with self._key_lock(key): # 같은 이미지를 여러 스레드가 동시에 올리지 않도록
+            upload = self._uploads.get(key)
+            if upload is not None and upload.is_fresh():
+                with self._lock:
+                    self.reuses += 1
+                return upload.part, 0
+            with span("gemini.upload_image", file=os.path.basename(image_path), backend=self.backend.name):
+                part, expires_at, uploaded_bytes = self.backend.upload(source_path, _mime_type_for(source_path))
+                increment("bytes_uploaded", uploaded_bytes)
+                increment("image_uploads")
+            self._uploads[key] = _Upload(part, expires_at)
+            with self._lock:
+                self.uploads += 1
+            return part, uploaded_bytes
+
+    def parts_for(self, image_paths, limit=None, on_error=None):
+        """이미지 경로 목록 -> {경로: 프롬프트 파트} (입력 순서 유지, 최대 limit개).
+        실패한 이미지는 빠지고 on_error(path, error)가 호출된다."""
+        parts = {}
+        for image_path in image_paths:
+            if limit is not None and len(parts) >= limit:
+                break
+            try:
+                parts[image_path] = self.acquire(image_path)[0]
+            except Exception as e:
+                if on_error:
+                    on_error(image_path, e)
+        return parts
+
+    def invalidate(self, image_paths):
+        for image_path in image_paths:
+            try:
+                key = file_sha256(get_proxy_path(image_path))
+            except OSError:
+                continue
+            with self._key_lock(key):
+                self._uploads.pop(key, None)
+
+    def call_with_parts(self, parts, request_func):
+        """request_func(parts)를 호출한다 (parts는 parts_for의 결과).
+        업로드가 만료/삭제되어 실패하면 그 이미지들을 다시 올려 한 번 더 시도한다."""
+        try:
+            return request_func(parts)
+        except Exception as e:
+            if not self.backend.is_missing_upload_error(e):
+                raise
+            print(f"  ↻ 업로드된 이미지를 찾을 수 없어 다시 업로드합니다: {e}")
+            self.invalidate(parts)
+            return request_func(self.parts_for(list(parts)))
+
+    def release(self):
+        """업로드한 파일을 모두 삭제하고 목록을 비운다 (작업 종료 시)."""
+        with self._lock:
+            uploads, self._uploads = list(self._uploads.values()), {}
+            self._key_locks = {}
+        for upload in uploads:
+            self.backend.delete(upload.part)
+        if uploads and self.backend.shares_uploads:
+            print(f"업로드한 이미지 {len(uploads)}개 정리 완료 (업로드 {self.uploads}회, 재사용 {self.reuses}회).")
+        self.uploads = self.reuses = 0
+
+_BACKENDS = {"file_api": GeminiFileBackend, "inline": InlineImageBackend}
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_image_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            if GEMINI_IMAGE_TRANSPORT not in _BACKENDS:
+                raise ValueError(f"알 수 없는 GEMINI_IMAGE_TRANSPORT: {GEMINI_IMAGE_TRANSPORT}")
+            _registry = ImageUploadRegistry(_BACKENDS[GEMINI_IMAGE_TRANSPORT]())
+        return _registry
+
+def release_image_uploads():
+    with _registry_lock:
+        registry = _registry
+    if registry is not None:
+        registry.release()
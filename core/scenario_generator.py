@@ -2,26 +2,17 @@ import os
 import re
 import json
 import google.generativeai as genai
-from PIL import Image
 
-from config import (GOOGLE_API_KEY_GEMINI, GEMINI_TEXT_MODEL_NAME,
+from config import (GEMINI_TEXT_MODEL_NAME,
                     EXTRACTED_TEXTS_FOLDER, GEMINI_VISION_MODEL_NAME,
-                    TTS_SPEAKING_RATE)
+                    TTS_SPEAKING_RATE, STORYBOARD_MAX_IMAGES, STORYBOARD_CANDIDATES_PER_SCENE,
+                    IMAGE_RECOMMENDER_BACKEND, IMAGE_RANKER_MIN_SCORE)
 from utils.file_utils import ensure_folder_exists, save_text_to_file
+from core import image_ranker, gemini_gateway
+from core.image_upload_registry import get_image_registry
 
-_gemini_configured_scenario = False
-
-def _ensure_gemini_configured_scenario():
-    global _gemini_configured_scenario
-    if not GOOGLE_API_KEY_GEMINI:
-        raise ValueError("Gemini API 키가 설정되지 않았습니다. config.py 또는 환경변수를 확인하세요.")
-    if not _gemini_configured_scenario:
-        genai.configure(api_key=GOOGLE_API_KEY_GEMINI)
-        _gemini_configured_scenario = True
-
-def generate_initial_narration(product_name, ocr_texts):
-    _ensure_gemini_configured_scenario()
-    model = genai.GenerativeModel(GEMINI_TEXT_MODEL_NAME)
+def generate_initial_narration(product_name, ocr_texts, output_folder=EXTRACTED_TEXTS_FOLDER):
+    model = gemini_gateway.get_model(GEMINI_TEXT_MODEL_NAME)
     print(f"Gemini Text 모델 ({GEMINI_TEXT_MODEL_NAME}) 로드 완료 (for initial narration).")
 
     if not ocr_texts:
@@ -60,12 +51,12 @@ def generate_initial_narration(product_name, ocr_texts):
     """
     print("\n=== Gemini API로 초기 전체 나레이션 생성 요청 (40-50초 목표) ===")
     try:
-        response = model.generate_content(prompt_for_initial_narration)
+        response = gemini_gateway.generate_content(model, "narration", prompt_for_initial_narration)
         initial_narration_script = response.text.strip()
         print("--- 생성된 초기 전체 나레이션 ---")
         print(initial_narration_script)
-        ensure_folder_exists(EXTRACTED_TEXTS_FOLDER)
-        narration_file_path = os.path.join(EXTRACTED_TEXTS_FOLDER, f"{product_name.replace(' ', '_')}_initial_narration.txt")
+        ensure_folder_exists(output_folder)
+        narration_file_path = os.path.join(output_folder, f"{product_name.replace(' ', '_')}_initial_narration.txt")
         save_text_to_file(initial_narration_script, narration_file_path)
         return initial_narration_script
     except Exception as e:
@@ -73,12 +64,11 @@ def generate_initial_narration(product_name, ocr_texts):
         return None
 
 
-def generate_scene_by_scene_script(product_name, initial_narration):
+def generate_scene_by_scene_script(product_name, initial_narration, output_folder=EXTRACTED_TEXTS_FOLDER):
     if not initial_narration:
         print("초기 나레이션이 없어 씬별 스크립트 생성을 건너<0xEB><0x9B><0x84>니다.")
         return None
-    _ensure_gemini_configured_scenario()
-    model = genai.GenerativeModel(GEMINI_TEXT_MODEL_NAME)
+    model = gemini_gateway.get_model(GEMINI_TEXT_MODEL_NAME)
     print(f"Gemini Text 모델 ({GEMINI_TEXT_MODEL_NAME}) 로드 완료 (for scene script).")
     prompt_for_scene_script = f"""
     당신은 쇼츠 영상 편집 전문가입니다.
@@ -112,7 +102,7 @@ def generate_scene_by_scene_script(product_name, initial_narration):
     """
     print("\n=== Gemini API로 씬별 JSON 스크립트 생성 요청 (총 40-50초 목표) ===")
     try:
-        response = model.generate_content(prompt_for_scene_script)
+        response = gemini_gateway.generate_content(model, "scene_script", prompt_for_scene_script)
         raw_response_text = response.text
         json_str = ""
         match = re.search(r'```json\s*([\s\S]*?)\s*```', raw_response_text, re.DOTALL)
@@ -136,8 +126,8 @@ def generate_scene_by_scene_script(product_name, initial_narration):
         if not (40 <= total_duration_from_json <= 55): 
              print(f"⚠️ 경고: JSON 스크립트의 총 길이가 목표(40-50초)를 벗어났습니다: {total_duration_from_json}초. 프롬프트 조정 또는 후처리 필요 가능성.")
 
-        ensure_folder_exists(EXTRACTED_TEXTS_FOLDER)
-        scenario_file_path = os.path.join(EXTRACTED_TEXTS_FOLDER, f"{product_name.replace(' ', '_')}_scene_script.json")
+        ensure_folder_exists(output_folder)
+        scenario_file_path = os.path.join(output_folder, f"{product_name.replace(' ', '_')}_scene_script.json")
         save_text_to_file(json.dumps(scene_script_data, indent=2, ensure_ascii=False), scenario_file_path)
         return scene_script_data
     except json.JSONDecodeError as e:
@@ -165,9 +155,19 @@ def recommend_image_for_scene(scene_description, scene_narration, scene_subtitle
         print(f"    Fallback: 사용 가능한 첫 번째 이미지 선택 - {os.path.basename(available_image_paths[0])}")
         return available_image_paths[0]
 
+    if IMAGE_RECOMMENDER_BACKEND == "local":
+        try:
+            ranked_images = image_ranker.rank_images_for_scene(
+                scene_description, scene_narration, available_image_paths, previously_used_filenames)
+            best_path, best_score = ranked_images[0]
+            if best_score >= IMAGE_RANKER_MIN_SCORE:
+                print(f"  [Scene {scene_number} Image Recommender] 로컬 랭커 선택: {os.path.basename(best_path)} (유사도 {best_score:.3f})")
+                return best_path
+            print(f"  [Scene {scene_number} Image Recommender] 로컬 랭커 최고 유사도 {best_score:.3f} < {IMAGE_RANKER_MIN_SCORE}. Gemini 추천으로 진행.")
+        except Exception as e_local:
+            print(f"  ⚠️ [Scene {scene_number} Image Recommender] 로컬 랭커 오류 ({e_local}). Gemini 추천으로 진행.")
 
-    _ensure_gemini_configured_scenario()
-    model = genai.GenerativeModel(GEMINI_VISION_MODEL_NAME)
+    model = gemini_gateway.get_model(GEMINI_VISION_MODEL_NAME)
     
     prompt_parts = [
         f"'{product_name}' 상품의 쇼츠 영상의 한 장면(Scene {scene_number})에 사용할 이미지를 추천해야 합니다.\n",
@@ -201,17 +201,13 @@ def recommend_image_for_scene(scene_description, scene_narration, scene_subtitle
         "--- 사용 가능한 이미지 목록 시작 ---"
     ])
     
-    loaded_images_info = []
-    for img_path in available_image_paths:
-        try:
-            img = Image.open(img_path)
-            filename = os.path.basename(img_path)
-            loaded_images_info.append((img, filename))
-        except Exception as e:
-            print(f"    ⚠️ [Scene {scene_number} Image Recommender] 이미지 로드 실패: {img_path}, 오류: {e}")
-            continue
+    MAX_IMAGES_PER_REQUEST = 10 
+    registry = get_image_registry()
+    image_parts = registry.parts_for(
+        available_image_paths, limit=MAX_IMAGES_PER_REQUEST,
+        on_error=lambda img_path, e: print(f"    ⚠️ [Scene {scene_number} Image Recommender] 이미지 로드 실패: {img_path}, 오류: {e}"))
     
-    if not loaded_images_info:
+    if not image_parts:
         print(f"  [Scene {scene_number} Image Recommender] 로드 가능한 이미지가 없습니다.")
         # Fallback 로직 강화
         if previously_used_filenames:
@@ -220,21 +216,22 @@ def recommend_image_for_scene(scene_description, scene_narration, scene_subtitle
                     return img_path_fallback
         return available_image_paths[0] if available_image_paths else None
 
-    MAX_IMAGES_PER_REQUEST = 10 
-    current_images_to_send_info = loaded_images_info[:MAX_IMAGES_PER_REQUEST]
-
-    for i, (img, filename) in enumerate(current_images_to_send_info):
-        prompt_parts.append(f"\n이미지 {i+1} 파일명: {filename}")
-        prompt_parts.append(img) 
-    
-    prompt_parts.append("\n--- 사용 가능한 이미지 목록 끝 ---")
-    prompt_parts.append("\n\n가장 적합한 이미지의 파일명 (위 지침을 반드시 따르세요): ")
+    def _request_recommendation(image_parts):
+        # 이미지는 업로드 핸들(또는 인라인 파트)로 넣으므로 씬마다 픽셀을 다시 보내지 않는다
+        request_parts = list(prompt_parts)
+        for i, (img_path, image_part) in enumerate(image_parts.items()):
+            request_parts.append(f"\n이미지 {i+1} 파일명: {os.path.basename(img_path)}")
+            request_parts.append(image_part)
+        request_parts.append("\n--- 사용 가능한 이미지 목록 끝 ---")
+        request_parts.append("\n\n가장 적합한 이미지의 파일명 (위 지침을 반드시 따르세요): ")
+        return gemini_gateway.generate_content(model, "recommend_image", request_parts,
+                                               generation_config=generation_config, scene=scene_number)
     
     try:
         generation_config = genai.types.GenerationConfig(
             temperature=0.3 
         )
-        response = model.generate_content(prompt_parts, generation_config=generation_config)
+        response = registry.call_with_parts(image_parts, _request_recommendation)
         
         recommended_filename_raw = response.text.strip()
 
@@ -268,12 +265,178 @@ def recommend_image_for_scene(scene_description, scene_narration, scene_subtitle
 
     except Exception as e:
         print(f"  🛑 [Scene {scene_number} Image Recommender] 이미지 추천 중 오류 발생: {e}")
-        text_prompt_for_debug = [str(p) for p in prompt_parts if not isinstance(p, Image.Image)]
-        print(f"     Gemini 요청 프롬프트 일부 (이미지 제외): {' '.join(text_prompt_for_debug)[:500]}")
+        print(f"     Gemini 요청 프롬프트 일부 (이미지 제외): {' '.join(prompt_parts)[:500]}")
         if previously_used_filenames:
             for img_path in available_image_paths:
                 if os.path.basename(img_path) not in previously_used_filenames:
                     print(f"    Fallback (오류 발생): 이전에 사용되지 않은 이미지 선택 - {os.path.basename(img_path)}")
                     return img_path
         print(f"    Fallback (오류 발생): 사용 가능한 첫 번째 이미지 선택 - {os.path.basename(available_image_paths[0]) if available_image_paths else '없음'}")
-        return available_image_paths[0] if available_image_paths else None
\ No newline at end of file
+        return available_image_paths[0] if available_image_paths else None
+
+def _min_cost_assignment(cost_matrix):
+    """행(씬) 수 <= 열(이미지) 수인 비용 행렬에 대해 총 비용이 최소인 배정을 구한다 (헝가리안 알고리즘).
+    각 행에 배정된 열 인덱스 리스트를 반환한다."""
+    n_rows, n_cols = len(cost_matrix), len(cost_matrix[0])
+    INF = float("inf")
+    u, v = [0.0] * (n_rows + 1), [0.0] * (n_cols + 1)
+    p, way = [0] * (n_cols + 1), [0] * (n_cols + 1)
+    for i in range(1, n_rows + 1):
+        p[0] = i
+        j0 = 0
+        min_v = [INF] * (n_cols + 1)
+        used = [False] * (n_cols + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], INF, 0
+            for j in range(1, n_cols + 1):
+                if not used[j]:
+                    cur = cost_matrix[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < min_v[j]:
+                        min_v[j], way[j] = cur, j0
+                    if min_v[j] < delta:
+                        delta, j1 = min_v[j], j
+            for j in range(n_cols + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    assignment = [0] * n_rows
+    for j in range(1, n_cols + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+def solve_storyboard_assignment(scene_numbers, ranked_candidates, available_filenames):
+    """씬별 후보 순위를 바탕으로 씬마다 이미지 하나를 배정한다.
+    '사용되지 않은 이미지가 남아 있으면 같은 이미지를 다시 쓰지 않는다'를 강제 조건으로 두고,
+    그 안에서 후보 순위 합이 가장 좋은 배정을 고른다. 씬이 이미지보다 많을 때만 재사용한다."""
+    if not scene_numbers or not available_filenames:
+        return {}
+    not_candidate_cost = STORYBOARD_CANDIDATES_PER_SCENE + 1
+    # 이미지 열을 필요한 만큼 복제하고, n번째 사용에는 어떤 순위 차이보다 큰 비용을 더해 재사용을 최후로 미룸
+    reuse_rounds = -(-len(scene_numbers) // len(available_filenames))
+    reuse_penalty = (not_candidate_cost + 1) * len(scene_numbers)
+    columns = [(round_idx, filename) for round_idx in range(reuse_rounds) for filename in available_filenames]
+    cost_matrix = []
+    for scene_number in scene_numbers:
+        ranks = {name: rank for rank, name in enumerate(ranked_candidates.get(scene_number, []))}
+        # 후보가 아닌 이미지끼리는 원래 순서(앞쪽 이미지)를 약하게 선호
+        cost_matrix.append([
+            round_idx * reuse_penalty + ranks.get(filename, not_candidate_cost + col_idx / (10.0 * len(columns)))
+            for col_idx, (round_idx, filename) in enumerate(columns)
+        ])
+    assignment = _min_cost_assignment(cost_matrix)
+    return {scene_number: columns[col][1] for scene_number, col in zip(scene_numbers, assignment)}
+
+def _parse_storyboard_response(response_text, available_filenames):
+    match = re.search(r'```json\s*([\s\S]*?)\s*```', response_text, re.DOTALL)
+    json_str = match.group(1) if match else response_text.strip()
+    storyboard = json.loads(json_str)
+    ranked_candidates = {}
+    for entry in storyboard:
+        if not isinstance(entry, dict) or "scene_number" not in entry:
+            continue
+        candidates = entry.get("candidates") or []
+        if isinstance(candidates, str):
+            candidates = [candidates]
+        ranked_candidates[str(entry["scene_number"])] = [
+            name.strip() for name in candidates if isinstance(name, str) and name.strip() in available_filenames
+        ][:STORYBOARD_CANDIDATES_PER_SCENE]
+    return ranked_candidates
+
+def _recommend_storyboard_locally(scenes, scene_numbers, available_image_paths):
+    """로컬 랭커로 모든 씬의 후보를 한 번에 계산한다. 어느 한 씬이라도 최고 유사도가 기준보다 낮으면 None."""
+    try:
+        score_matrix = image_ranker.score_scenes_against_images(scenes, available_image_paths)
+    except Exception as e_local:
+        print(f"  ⚠️ [Storyboard] 로컬 랭커 오류 ({e_local}). Gemini 스토리보드 요청으로 진행.")
+        return None
+    if score_matrix.max(axis=1).min() < IMAGE_RANKER_MIN_SCORE:
+        print(f"  [Storyboard] 로컬 랭커 유사도가 기준({IMAGE_RANKER_MIN_SCORE}) 미만인 씬이 있어 Gemini 스토리보드 요청으로 진행.")
+        return None
+    filenames = [os.path.basename(path) for path in available_image_paths]
+    ranked_candidates = {
+        scene_number: [filenames[idx] for idx in (-scores).argsort()[:STORYBOARD_CANDIDATES_PER_SCENE]]
+        for scene_number, scores in zip(scene_numbers, score_matrix)
+    }
+    assignment = solve_storyboard_assignment(scene_numbers, ranked_candidates, filenames)
+    path_by_filename = dict(zip(filenames, available_image_paths))
+    print(f"  [Storyboard] 로컬 랭커로 씬 {len(scenes)}개 배정 완료: {assignment}")
+    return {scene_number: path_by_filename[filename] for scene_number, filename in assignment.items()}
+
+def recommend_images_for_storyboard(scenes, available_image_paths, product_name=""):
+    """모든 씬 정보와 이미지 세트를 한 번의 Gemini 요청으로 보내 씬별 후보 순위를 받고,
+    이미지 중복 사용 금지 조건을 로컬에서 풀어 {scene_number(str): 이미지 경로}를 반환한다.
+    실패하면 None을 반환하므로 호출 측에서 씬별 추천으로 대체하면 된다."""
+    if not scenes or not available_image_paths:
+        return None
+
+    scene_numbers = [str(scene.get("scene_number", idx + 1)) for idx, scene in enumerate(scenes)]
+    if IMAGE_RECOMMENDER_BACKEND == "local":
+        local_assignment = _recommend_storyboard_locally(scenes, scene_numbers, available_image_paths)
+        if local_assignment:
+            return local_assignment
+
+    images_to_send = available_image_paths[:STORYBOARD_MAX_IMAGES]
+    path_by_filename = {} # 실제로 요청에 들어간 이미지만 (업로드/로드에 실패한 이미지는 후보/채움용에서 제외)
+
+    prompt_parts = [
+        f"'{product_name}' 상품의 쇼츠 영상 스토리보드를 만들고 있습니다. 각 장면(Scene)에 어울리는 이미지를 골라야 합니다.\n",
+        "장면 목록:\n"
+    ]
+    for scene_number, scene in zip(scene_numbers, scenes):
+        prompt_parts.append(
+            f"- Scene {scene_number}: 추천 이미지 설명=\"{scene.get('recommended_image_description', '')}\", "
+            f"나레이션=\"{scene.get('narration', '')}\", 자막=\"{scene.get('subtitle', '')}\"\n")
+    prompt_parts.extend([
+        "\n**중요 지침:**\n",
+        "1. 이미지 내에 글자가 너무 많거나, 복잡한 표, 상세 스펙 설명 위주의 이미지는 피해주세요.\n",
+        "2. 상품 자체의 모습, 사용 예시, 먹음직스러운 음식 사진, 제품의 특징을 잘 보여주는 시각적 이미지를 선호합니다.\n",
+        "3. 배송 정보, 반품 정책, 회사 연락처, 고객센터 안내, 결제창 스크린샷 등 광고의 부가 정보 이미지는 후보에 넣지 마세요.\n",
+        f"4. 각 장면마다 잘 어울리는 이미지 파일명을 최대 {STORYBOARD_CANDIDATES_PER_SCENE}개, 가장 잘 어울리는 순서대로 적어주세요.\n",
+        "5. 같은 이미지가 여러 장면의 후보가 되어도 괜찮습니다. 최종 배정은 별도로 중복 없이 결정합니다.\n",
+        "결과는 반드시 아래 JSON 리스트 형식으로만 응답하고 다른 설명은 추가하지 마세요:\n",
+        '[{"scene_number": 1, "candidates": ["product_image_003.jpg", "product_image_001.jpg"]}, ...]\n\n',
+        "--- 사용 가능한 이미지 목록 시작 ---"
+    ])
+
+    def _request_storyboard(image_parts):
+        path_by_filename.clear()
+        path_by_filename.update((os.path.basename(img_path), img_path) for img_path in image_parts)
+        request_parts = list(prompt_parts)
+        for img_path, image_part in image_parts.items():
+            request_parts.append(f"\n이미지 파일명: {os.path.basename(img_path)}")
+            request_parts.append(image_part)
+        request_parts.append("\n--- 사용 가능한 이미지 목록 끝 ---")
+        return gemini_gateway.generate_content(model, "storyboard", request_parts,
+                                               generation_config=genai.types.GenerationConfig(temperature=0.3),
+                                               scenes=len(scenes), images=len(image_parts))
+
+    try:
+        registry = get_image_registry()
+        image_parts = registry.parts_for(
+            images_to_send, on_error=lambda img_path, e: print(f"    ⚠️ [Storyboard] 이미지 로드 실패: {img_path}, 오류: {e}"))
+        if not image_parts:
+            return None
+        model = gemini_gateway.get_model(GEMINI_VISION_MODEL_NAME)
+        print(f"  [Storyboard] 씬 {len(scenes)}개 / 이미지 {len(image_parts)}개로 이미지 배정 요청 (1회)")
+        response = registry.call_with_parts(image_parts, _request_storyboard)
+        ranked_candidates = _parse_storyboard_response(response.text, path_by_filename)
+    except Exception as e:
+        print(f"  🛑 [Storyboard] 스토리보드 이미지 배정 중 오류 발생: {e}. 씬별 추천으로 대체합니다.")
+        return None
+
+    assignment = solve_storyboard_assignment(scene_numbers, ranked_candidates, list(path_by_filename))
+    for scene_number in scene_numbers:
+        candidates = ranked_candidates.get(scene_number, [])
+        print(f"  [Storyboard] Scene {scene_number}: 후보 {candidates} -> 배정 '{assignment.get(scene_number)}'")
+    return {scene_number: path_by_filename[filename] for scene_number, filename in assignment.items()}
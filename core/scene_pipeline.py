@@ -0,0 +1,210 @@
+import os
+import time
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (AUDIO_CLIPS_FOLDER, VIDEOS_FOLDER, IMAGES_RAW_FOLDER, TTS_MAX_CONCURRENCY,
+                    TTS_SYNTHESIS_MODE, VIDEO_SEGMENT_MAX_WORKERS, IMAGE_SELECTION_MODE,
+                    PIPELINE_MAX_WORKERS, VIDEO_FPS)
+from core.voice_generator import (begin_audio_generation, prepare_scene_copies, apply_audio_result,
+                                  synthesize_scene_audio, synthesize_whole_narration)
+from core.video_editor import (get_system_font, resolve_scene_duration, ensure_placeholder_image,
+                               select_scene_image, build_ffmpeg_scene, output_video_path_for)
+from core.ffmpeg_renderer import (scene_frame_count, segment_threads_per_encoder, render_scene_segment,
+                                  encode_audio_track, assemble_video)
+from core.scenario_generator import recommend_images_for_storyboard
+from utils.file_utils import ensure_folder_exists
+from utils.task_graph import TaskGraph
+from utils.logging_utils import carry_context
+
+# 씬 대본이 나온 뒤의 작업(음성 합성 -> 이미지 선택 -> 세그먼트 인코딩 -> 연결)을 씬 단위 작업 그래프로 실행한다.
+# 씬 하나의 음성과 이미지가 준비되면 다른 씬을 기다리지 않고 바로 그 씬의 세그먼트를 인코딩하므로,
+# 전체 시간이 단계별 합이 아니라 가장 긴 의존 경로에 가까워진다. (ffmpeg 렌더 엔진 전용)
+#
+#   tts:i ──> duration:i ──> segment:i ──┐
+#   storyboard ──> image:i ──┘            ├──> (finish_video에서 연결)
+#   duration:* ──> audio_track ───────────┘
+# image:i는 앞 씬에서 쓴 이미지를 피하도록 image:i-1 뒤에 실행된다.
+
+class ScenePipeline:
+    def __init__(self, scenario_data, product_name, downloaded_image_paths, synthesize_audio=True,
+                 audio_folder=AUDIO_CLIPS_FOLDER, videos_folder=VIDEOS_FOLDER, images_folder=IMAGES_RAW_FOLDER,
+                 render_span=None):
+        """synthesize_audio=False면 scenario_data가 이미 음성 단계를 거친 것으로 보고 TTS 작업을 만들지 않는다.
+        render_span을 주면 렌더 쪽 작업(스토리보드, 이미지 선택, 세그먼트/오디오 인코딩)은 음성 단계와 겹쳐 실행되더라도
+        그 span 아래에 기록된다 (단계별 시간/카운터 집계용)."""
+        self.product_name = product_name
+        self.audio_folder = audio_folder
+        self.videos_folder = videos_folder
+        self.images_folder = images_folder
+        self.available_images = [path for path in downloaded_image_paths if os.path.exists(path)]
+        self.synthesize_audio = synthesize_audio and begin_audio_generation(audio_folder)
+        if synthesize_audio:
+            self.scene_copies, self.synthesis_jobs = prepare_scene_copies(scenario_data, product_name)
+        else:
+            self.scene_copies, self.synthesis_jobs = [scene.copy() for scene in scenario_data], []
+        self._script_snapshot = [scene.copy() for scene in self.scene_copies] # 음성 작업이 씬 dict를 채우는 동안 읽기용
+        self.font_for_subtitle = get_system_font()
+        self.placeholder_path = None
+        self.work_folder = None
+        self.graph = None
+        self.render_span = render_span
+
+    def _build_graph(self):
+        graph = TaskGraph(PIPELINE_MAX_WORKERS,
+                          {"tts": TTS_MAX_CONCURRENCY, "encode": max(1, VIDEO_SEGMENT_MAX_WORKERS)})
+        scene_count = len(self.scene_copies)
+        threads_per_encoder = segment_threads_per_encoder(scene_count)
+        jobs_by_index = {job[0]: job for job in self.synthesis_jobs} if self.synthesize_audio else {}
+
+        # 음성 합성: 씬별 요청, 또는 전체 SSML 한 번 (실패하면 같은 작업 안에서 씬별로 되돌아감)
+        tts_task_by_index = {}
+        if jobs_by_index and TTS_SYNTHESIS_MODE == "ssml_whole":
+            graph.add("tts", lambda deps: self._synthesize_all(), resource="tts")
+            tts_task_by_index = {idx: "tts" for idx in jobs_by_index}
+        else:
+            for idx, job in jobs_by_index.items():
+                graph.add(f"tts:{idx}", lambda deps, job=job: self._synthesize_scene(job), resource="tts")
+                tts_task_by_index[idx] = f"tts:{idx}"
+
+        for idx in range(scene_count):
+            tts_task = tts_task_by_index.get(idx)
+            graph.add(f"duration:{idx}",
+                      lambda deps, idx=idx, tts_task=tts_task: self._resolve_duration(idx, deps.get(tts_task)),
+                      deps=[tts_task] if tts_task else [])
+
+        # 이미지 선택: 스토리보드 한 번 + 씬 순서대로 (사용한 이미지 목록을 이어 받음)
+        used_image_filenames = []
+        render_span = self.render_span
+        graph.add("storyboard", lambda deps: self._storyboard_assignment(), parent_span=render_span)
+        for idx in range(scene_count):
+            deps = ["storyboard"] + ([f"image:{idx - 1}"] if idx > 0 else [])
+            graph.add(f"image:{idx}", lambda deps, idx=idx: select_scene_image(
+                self._script_snapshot[idx], deps["storyboard"], self.available_images, self.product_name,
+                used_image_filenames, self.placeholder_path), deps=deps, parent_span=render_span)
+
+        for idx in range(scene_count):
+            graph.add(f"segment:{idx}", lambda deps, idx=idx: self._render_segment(
+                idx, deps[f"duration:{idx}"], deps[f"image:{idx}"], threads_per_encoder),
+                deps=[f"duration:{idx}", f"image:{idx}"], resource="encode", parent_span=render_span)
+
+        graph.add("audio_track", lambda deps: self._encode_audio_track(
+            [deps[f"duration:{idx}"] for idx in range(scene_count)]),
+            deps=[f"duration:{idx}" for idx in range(scene_count)], resource="encode", parent_span=render_span)
+        return graph
+
+    def start(self):
+        if not self.scene_copies:
+            return self
+        ensure_folder_exists(self.videos_folder)
+        self.placeholder_path = ensure_placeholder_image(self.images_folder)
+        self.work_folder = tempfile.mkdtemp(dir=self.videos_folder)
+        self._started_at = time.perf_counter()
+        self.graph = self._build_graph().start()
+        print(f"\n=== 씬 작업 그래프 시작 (씬 {len(self.scene_copies)}개, "
+              f"음성 합성 {'포함' if self.synthesize_audio else '생략'}) ===")
+        return self
+
+    def _synthesize_scene(self, job):
+        audio_path, audio_duration = synthesize_scene_audio(job[1], job[2], job[3], self.audio_folder)
+        return audio_path, audio_duration, None
+
+    def _synthesize_all(self):
+        whole_results = synthesize_whole_narration(self.synthesis_jobs, self.audio_folder)
+        if whole_results is not None:
+            return whole_results
+        with ThreadPoolExecutor(max_workers=max(1, min(TTS_MAX_CONCURRENCY, len(self.synthesis_jobs)))) as executor:
+            audio_results = executor.map(carry_context(self._synthesize_scene), self.synthesis_jobs)
+            return {job[0]: result for job, result in zip(self.synthesis_jobs, audio_results)}
+
+    def _resolve_duration(self, idx, tts_result):
+        scene_copy = self.scene_copies[idx]
+        if self.synthesize_audio:
+            if isinstance(tts_result, dict): # 전체 SSML 합성 결과
+                tts_result = tts_result.get(idx)
+            audio_path, audio_duration, timepoints = tts_result or (None, None, None)
+            apply_audio_result(scene_copy, audio_path, audio_duration, timepoints)
+        return resolve_scene_duration(scene_copy)
+
+    def _storyboard_assignment(self):
+        if IMAGE_SELECTION_MODE == "storyboard" and self.available_images:
+            return recommend_images_for_storyboard(self._script_snapshot, self.available_images, self.product_name) or {}
+        return {}
+
+    def _render_segment(self, idx, duration_result, selected_image_path, threads):
+        scene_duration, audio_file_path = duration_result
+        scene = build_ffmpeg_scene(self.scene_copies[idx], selected_image_path, self.placeholder_path,
+                                   self.font_for_subtitle, scene_duration, audio_file_path)
+        print(f"  Scene {scene['scene_number']}: 최종 선택 이미지 '{os.path.basename(selected_image_path)}', "
+              f"길이: {scene_duration:.2f}s")
+        return scene, render_scene_segment(scene, self.work_folder, threads)
+
+    def _encode_audio_track(self, duration_results):
+        scenes = [{"audio_path": audio_file_path} for _, audio_file_path in duration_results]
+        durations = [scene_frame_count(scene_duration) / VIDEO_FPS for scene_duration, _ in duration_results]
+        return encode_audio_track(scenes, durations, os.path.join(self.work_folder, "audio.m4a"))
+
+    def scenario_with_audio(self):
+        """모든 씬의 음성 합성이 끝나면 음성 정보가 채워진 시나리오를 반환한다 (이미지/인코딩은 계속 진행)."""
+        if self.graph is None:
+            return self.scene_copies
+        total_audio_duration = 0
+        for idx, scene_copy in enumerate(self.scene_copies):
+            try:
+                self.graph.result(f"duration:{idx}")
+            except Exception as e:
+                print(f"  Scene {scene_copy.get('scene_number')}: 음성 처리 실패: {e}")
+            if scene_copy.get("audio_file_path"):
+                total_audio_duration += scene_copy.get("actual_audio_duration_seconds") or 0
+        if self.synthesize_audio:
+            if total_audio_duration > 0:
+                print(f"음성 클립 생성 완료. 생성된 총 오디오 길이 (오디오 헤더 기준): {total_audio_duration:.2f} 초")
+            else:
+                print("생성된 음성 클립이 없거나 길이를 측정할 수 없었습니다.")
+        return self.scene_copies
+
+    def finish_video(self):
+        """남은 세그먼트 인코딩을 기다렸다가 이어 붙여 최종 영상을 만든다. 성공하면 경로, 실패하면 None."""
+        if self.graph is None:
+            print("시나리오 데이터가 없어 영상 생성을 건너<0xEB><0x9B><0x84>니다.")
+            return None
+        output_video_path = output_video_path_for(self.videos_folder, self.product_name)
+        try:
+            errors = self.graph.wait()
+            if errors:
+                for name, error in errors.items():
+                    print(f"  작업 '{name}' 실패: {error}")
+                print("생성된 씬이 없거나 ffmpeg 렌더링에 실패해 영상을 만들 수 없습니다.")
+                return None
+            segment_outputs = [self.graph.result(f"segment:{idx}") for idx in range(len(self.scene_copies))]
+            scenes = [scene for scene, _ in segment_outputs]
+            total_duration = sum(result["duration"] for _, result in segment_outputs)
+            print(f"\n조합된 영상의 총 길이 (씬 기반 계산): {total_duration:.2f} 초")
+            print(f"\n최종 영상 저장 중 (ffmpeg 직접 인코딩)... ({output_video_path})")
+            result_path = assemble_video(scenes, [result for _, result in segment_outputs], output_video_path,
+                                         self.work_folder, self.graph.result("audio_track"))
+        except Exception as e:
+            print(f"ffmpeg 렌더링 실패: {e}")
+            return None
+        finally:
+            self._cleanup()
+        timings = self.graph.timings()
+        print(f"🎉 최종 영상 저장 완료: {result_path} "
+              f"(작업 그래프 {time.perf_counter() - self._started_at:.1f}초, 가장 늦은 작업 종료 {timings['elapsed_seconds']:.1f}초)")
+        return result_path
+
+    def discard(self):
+        """영상이 필요 없어졌을 때 (예: 렌더 단계 결과 재사용) 진행 중인 작업을 마치고 임시 파일을 정리한다.
+        인코딩된 세그먼트는 캐시에 남으므로 다음 실행에서 재사용된다."""
+        if self.graph is not None:
+            self.graph.wait()
+            self._cleanup()
+
+    def _cleanup(self):
+        if self.work_folder:
+            shutil.rmtree(self.work_folder, ignore_errors=True)
+            self.work_folder = None
+        if self.placeholder_path and os.path.exists(self.placeholder_path):
+            try: os.remove(self.placeholder_path)
+            except OSError: pass
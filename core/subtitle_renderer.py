@@ -0,0 +1,108 @@
+import os
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from config import (VIDEO_RESOLUTION, SUBTITLE_FONT_SIZE, SUBTITLE_MAX_WIDTH_RATIO,
+                    SUBTITLE_STROKE_WIDTH)
+
+# ImageMagick(TextClip) 대신 Pillow로 자막을 직접 그린다.
+# 폰트는 (경로, 크기)별로 한 번만 읽고, 줄바꿈 결과와 외곽선까지 그린 비트맵은 LRU 캐시에 보관한다.
+
+# 줄 맨 앞에 오면 어색한 문장부호 (앞 줄 끝에 붙인다)
+_NO_LINE_START = set(".,!?:;)]}%…~·、。，！？）」』")
+_LINE_SPACING_RATIO = 0.25
+
+@lru_cache(maxsize=32)
+def load_font(font_path, font_size):
+    """폰트를 한 번만 읽는다. 파일 경로가 아니라 이름이면 Pillow가 시스템 폰트 폴더에서 찾는다."""
+    try:
+        return ImageFont.truetype(font_path, font_size)
+    except OSError:
+        print(f"  Warning: 자막 폰트 '{font_path}'를 열 수 없어 Pillow 기본 폰트를 사용합니다.")
+        try:
+            return ImageFont.load_default(size=font_size)
+        except TypeError: # Pillow < 10.1
+            return ImageFont.load_default()
+
+def _text_width(font, text):
+    return font.getlength(text) if text else 0
+
+def _break_long_word(font, word, max_width):
+    """한 단어가 한 줄보다 길면 글자(한글은 음절) 단위로 끊는다."""
+    pieces, current = [], ""
+    for char in word:
+        if current and _text_width(font, current + char) > max_width and char not in _NO_LINE_START:
+            pieces.append(current)
+            current = char
+        else:
+            current += char
+    if current:
+        pieces.append(current)
+    return pieces
+
+@lru_cache(maxsize=512)
+def wrap_subtitle_lines(text, font_path, font_size, max_width):
+    """자막을 max_width(px) 안에 들어가도록 줄바꿈한다.
+    띄어쓰기 단위로 먼저 나누고, 그래도 긴 어절은 음절 단위로 끊는다. 사용자가 넣은 줄바꿈은 유지한다."""
+    font = load_font(font_path, font_size)
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        current = ""
+        for word in paragraph.split():
+            candidate = f"{current} {word}" if current else word
+            if _text_width(font, candidate) <= max_width:
+                current = candidate
+                continue
+            if current:
+                lines.append(current)
+            pieces = _break_long_word(font, word, max_width)
+            lines.extend(pieces[:-1])
+            current = pieces[-1] if pieces else ""
+        if current:
+            lines.append(current)
+    return tuple(lines)
+
+@lru_cache(maxsize=256)
+def _render_subtitle_cached(text, font_path, font_size, max_width, stroke_width, fill, stroke_fill):
+    font = load_font(font_path, font_size)
+    lines = wrap_subtitle_lines(text, font_path, font_size, max_width)
+    if not lines:
+        return None
+
+    ascent, descent = font.getmetrics()
+    line_height = ascent + descent
+    line_gap = int(font_size * _LINE_SPACING_RATIO)
+    padding = stroke_width + 2
+    line_widths = [int(np.ceil(_text_width(font, line))) for line in lines]
+    width = max(line_widths) + padding * 2
+    height = line_height * len(lines) + line_gap * (len(lines) - 1) + padding * 2
+
+    canvas = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(canvas)
+    y = padding
+    for line, line_width in zip(lines, line_widths):
+        x = (width - line_width) // 2 # 줄마다 가운데 정렬
+        draw.text((x, y), line, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
+        y += line_height + line_gap
+
+    array = np.asarray(canvas)
+    array.setflags(write=False) # 캐시된 비트맵이 호출자 쪽에서 수정되지 않도록
+    return array
+
+def render_subtitle(text, font_path, font_size=SUBTITLE_FONT_SIZE, frame_width=None,
+                    max_width_ratio=SUBTITLE_MAX_WIDTH_RATIO, stroke_width=SUBTITLE_STROKE_WIDTH,
+                    fill=(255, 255, 255, 255), stroke_fill=(0, 0, 0, 255)):
+    """자막 텍스트를 외곽선이 있는 RGBA 배열(높이 x 너비 x 4, uint8, 읽기 전용)로 그린다.
+    영상 너비의 max_width_ratio 안에서 줄바꿈하며, 내용이 없으면 None을 반환한다."""
+    if not text or not text.strip():
+        return None
+    frame_width = frame_width or VIDEO_RESOLUTION[0]
+    max_width = int(frame_width * max_width_ratio)
+    return _render_subtitle_cached(text.strip(), os.fspath(font_path), font_size, max_width,
+                                   stroke_width, tuple(fill), tuple(stroke_fill))
+
+def render_cache_info():
+    """(폰트, 줄바꿈, 비트맵) 캐시 적중 정보."""
+    return {"fonts": load_font.cache_info(), "lines": wrap_subtitle_lines.cache_info(),
+            "bitmaps": _render_subtitle_cached.cache_info()}
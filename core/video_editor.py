@@ -1,26 +1,40 @@
 import os
+import time
+from functools import lru_cache
 import numpy as np
 from moviepy.editor import (ImageClip, AudioFileClip, TextClip, CompositeVideoClip,
                             concatenate_videoclips, vfx)
-from PIL import Image, ImageOps
+from PIL import Image
 
 from config import (VIDEOS_FOLDER, IMAGES_RAW_FOLDER, DEFAULT_FONT_PATH_WIN,
                     DEFAULT_FONT_PATH_MAC, DEFAULT_FONT_PATH_LINUX,
-                    VIDEO_RESOLUTION, VIDEO_FPS)
+                    VIDEO_RESOLUTION, VIDEO_FPS, IMAGE_SELECTION_MODE, SUBTITLE_RENDERER,
+                    VIDEO_RENDER_ENGINE)
+from utils.audio_utils import audio_duration_seconds
 from utils.file_utils import ensure_folder_exists
-from core.scenario_generator import recommend_image_for_scene
+from utils.logging_utils import span
+from core.subtitle_renderer import render_subtitle
+from core.ffmpeg_renderer import render_scenes_with_ffmpeg
+from core.image_store import get_image_store
+from core.scenario_generator import recommend_image_for_scene, recommend_images_for_storyboard
 
-# --- ImageMagick 경로 설정 (파일 상단에 위치) ---
+# --- ImageMagick 경로 설정 (SUBTITLE_RENDERER가 "imagemagick"일 때만 필요) ---
 imagemagick_binary_path = r"C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe" 
 
-if os.path.isfile(imagemagick_binary_path):
-    if "IMAGEMAGICK_BINARY" not in os.environ:
-         os.environ["IMAGEMAGICK_BINARY"] = imagemagick_binary_path
-    print(f"ImageMagick 바이너리 경로 확인/설정됨: {os.environ.get('IMAGEMAGICK_BINARY')}")
-else:
-    print(f"Warning: ImageMagick 바이너리 파일을 찾을 수 없습니다: {imagemagick_binary_path}")
-    print("자막 생성에 문제가 발생할 수 있습니다. ImageMagick을 설치하고 경로를 정확히 지정하거나, 시스템 PATH에 추가해주세요.")
+@lru_cache(maxsize=None)
+def configure_imagemagick():
+    if os.path.isfile(imagemagick_binary_path):
+        if "IMAGEMAGICK_BINARY" not in os.environ:
+             os.environ["IMAGEMAGICK_BINARY"] = imagemagick_binary_path
+        # moviepy는 import 시점에 설정을 읽으므로 이후 변경은 change_settings로 반영
+        from moviepy.config import change_settings
+        change_settings({"IMAGEMAGICK_BINARY": os.environ["IMAGEMAGICK_BINARY"]})
+        print(f"ImageMagick 바이너리 경로 확인/설정됨: {os.environ.get('IMAGEMAGICK_BINARY')}")
+    else:
+        print(f"Warning: ImageMagick 바이너리 파일을 찾을 수 없습니다: {imagemagick_binary_path}")
+        print("자막 생성에 문제가 발생할 수 있습니다. ImageMagick을 설치하고 경로를 정확히 지정하거나, 시스템 PATH에 추가해주세요.")
 
+@lru_cache(maxsize=None) # 폰트 탐색은 프로세스당 한 번만
 def get_system_font():
     if os.name == 'nt': 
         nanum_gothic_bold_path = r"C:/Windows/Fonts/NanumGothicBold.ttf"
@@ -65,21 +79,92 @@ def get_system_font():
             return "NanumGothic"
 
 
-def create_video_from_scenario(scenario_data_with_audio, product_name, downloaded_image_paths):
+def resolve_scene_duration(scene_info):
+    """씬 재생 길이(초)와 사용할 오디오 경로(없으면 None)를 정한다."""
+    scene_num = scene_info.get("scene_number", "N/A")
+    audio_file_path = scene_info.get("audio_file_path")
+    if audio_file_path and os.path.exists(audio_file_path):
+        # 길이는 음성 단계에서 계산해 둔 값을 쓰고, 없을 때만 파일 헤더를 읽는다 (ffmpeg로 다시 측정하지 않음)
+        scene_duration = scene_info.get("actual_audio_duration_seconds") or 0
+        if scene_duration <= 0:
+            scene_duration = audio_duration_seconds(audio_file_path) or scene_info.get("duration_seconds", 3)
+        json_duration = scene_info.get("duration_seconds", scene_duration)
+        if abs(scene_duration - json_duration) > 1.5 : 
+            print(f"  Warning: Scene {scene_num} - 실제 오디오 길이({scene_duration:.2f}s)와 JSON 명시 길이({json_duration}s) 차이 발생.")
+    else:
+        print(f"  Scene {scene_num}: 오디오 파일 경로가 없거나 파일이 존재하지 않음. JSON의 duration_seconds 사용.")
+        audio_file_path = None
+        scene_duration = scene_info.get("duration_seconds", 3) 
+    
+    if scene_duration <= 0.1: 
+        print(f"  Warning: Scene {scene_num}의 유효한 재생 시간이 너무 짧습니다({scene_duration:.2f}s). 0.5초로 강제 설정.")
+        scene_duration = 0.5
+    return scene_duration, audio_file_path
+
+def ensure_placeholder_image(images_folder=IMAGES_RAW_FOLDER, color='grey'):
+    placeholder_path_temp = os.path.join(images_folder, "placeholder_temp.png")
+    if not os.path.exists(placeholder_path_temp):
+        Image.new('RGB', VIDEO_RESOLUTION, color=color).save(placeholder_path_temp)
+    return placeholder_path_temp
+
+def select_scene_image(scene_info, storyboard_assignment, available_images, product_name,
+                       used_image_filenames, placeholder_path_temp):
+    """스토리보드 배정 -> 씬 단위 추천 -> 플레이스홀더 순으로 씬 이미지를 고른다. 사용한 파일명은 used_image_filenames에 추가."""
+    scene_num = scene_info.get("scene_number", "N/A")
+    selected_image_path = storyboard_assignment.get(str(scene_num))
+    if not selected_image_path:
+        with span("image.recommend_scene", scene=scene_num):
+            selected_image_path = recommend_image_for_scene(
+                scene_description=scene_info.get("recommended_image_description", ""),
+                scene_narration=scene_info.get("narration", ""),
+                scene_subtitle=scene_info.get("subtitle", ""),
+                available_image_paths=available_images,
+                product_name=product_name,
+                scene_number=str(scene_num),
+                previously_used_filenames=used_image_filenames 
+            )
+
+    if not selected_image_path or not os.path.exists(selected_image_path):
+        print(f"  Scene {scene_num}: 적합한 이미지 찾지 못함/경로 유효하지 않음. 플레이스홀더 사용.")
+        if not os.path.exists(placeholder_path_temp):
+             Image.new('RGB', VIDEO_RESOLUTION, color='grey').save(placeholder_path_temp)
+        selected_image_path = placeholder_path_temp
+    else:
+        used_image_filenames.append(os.path.basename(selected_image_path))
+    return selected_image_path
+
+def build_ffmpeg_scene(scene_info, selected_image_path, placeholder_path_temp, font_for_subtitle,
+                       scene_duration, audio_file_path):
+    """ffmpeg 엔진용 씬 입력. 프레임 합성은 세그먼트 인코딩 워커에서 하며, 자막은 항상 Pillow로 그린다."""
+    if not os.path.exists(placeholder_path_temp): Image.new('RGB', VIDEO_RESOLUTION, color='darkgrey').save(placeholder_path_temp)
+    return {"scene_number": scene_info.get("scene_number", "N/A"), "image_path": selected_image_path,
+            "fallback_image_path": placeholder_path_temp,
+            "subtitle_text": scene_info.get("subtitle", ""), "font_path": font_for_subtitle,
+            "duration": scene_duration, "audio_path": audio_file_path}
+
+def output_video_path_for(videos_folder, product_name):
+    safe_product_name = "".join(c if c.isalnum() else "_" for c in product_name[:30])
+    return os.path.join(videos_folder, f"{safe_product_name}_shorts_video.mp4")
+
+def create_video_from_scenario(scenario_data_with_audio, product_name, downloaded_image_paths,
+                               videos_folder=VIDEOS_FOLDER, images_folder=IMAGES_RAW_FOLDER):
     if not scenario_data_with_audio:
         print("시나리오 데이터가 없어 영상 생성을 건너<0xEB><0x9B><0x84>니다.")
         return None
     
     font_for_subtitle = get_system_font()
+    if SUBTITLE_RENDERER == "imagemagick":
+        configure_imagemagick()
     print(f"자막 생성에 사용될 폰트: {font_for_subtitle}")
 
-    print("\n=== MoviePy 영상 조합 시작 ===")
-    ensure_folder_exists(VIDEOS_FOLDER)
+    print(f"\n=== 영상 조합 시작 (렌더 엔진: {VIDEO_RENDER_ENGINE}) ===")
+    ensure_folder_exists(videos_folder)
     
     scene_clips = []
+    ffmpeg_scenes = [] # VIDEO_RENDER_ENGINE == "ffmpeg"일 때 씬별 입력 (프레임 합성은 세그먼트 인코딩 워커에서)
     available_images = [img_path for img_path in downloaded_image_paths if os.path.exists(img_path)]
     
-    placeholder_path_temp = os.path.join(IMAGES_RAW_FOLDER, "placeholder_temp.png")
+    placeholder_path_temp = os.path.join(images_folder, "placeholder_temp.png")
     if not available_images:
         print("사용 가능한 이미지가 없습니다. 플레이스홀더 이미지를 사용합니다.")
         if not os.path.exists(placeholder_path_temp):
@@ -92,68 +177,37 @@ def create_video_from_scenario(scenario_data_with_audio, product_name, downloade
     total_video_duration_calculated = 0
     used_image_filenames_in_video = [] # 이미 사용된 이미지 파일명 목록
 
+    # 스토리보드 모드: 렌더 루프 전에 한 번의 요청으로 모든 씬의 이미지를 배정
+    storyboard_assignment = {}
+    if IMAGE_SELECTION_MODE == "storyboard" and available_images:
+        with span("image.storyboard", scenes=len(scenario_data_with_audio)):
+            storyboard_assignment = recommend_images_for_storyboard(
+                scenario_data_with_audio, available_images, product_name) or {}
+
     for scene_info in scenario_data_with_audio:
         scene_num = scene_info.get("scene_number", "N/A")
-        narration = scene_info.get("narration", "")
         subtitle_text = scene_info.get("subtitle", "")
-        audio_file_path = scene_info.get("audio_file_path")
-        
-        scene_duration = 0
+        scene_duration, audio_file_path = resolve_scene_duration(scene_info)
         audio_clip_moviepy = None
-
-        if audio_file_path and os.path.exists(audio_file_path):
+        if audio_file_path and VIDEO_RENDER_ENGINE != "ffmpeg": # ffmpeg 엔진은 오디오 파일을 직접 입력으로 사용
             try:
                 audio_clip_moviepy = AudioFileClip(audio_file_path)
-                scene_duration = audio_clip_moviepy.duration
-                if "actual_audio_duration_seconds" in scene_info and scene_info["actual_audio_duration_seconds"] > 0:
-                    scene_duration = scene_info["actual_audio_duration_seconds"]
-                
-                json_duration = scene_info.get("duration_seconds", scene_duration)
-                if abs(scene_duration - json_duration) > 1.5 : 
-                    print(f"  Warning: Scene {scene_num} - 실제 오디오 길이({scene_duration:.2f}s)와 JSON 명시 길이({json_duration}s) 차이 발생.")
-
             except Exception as e:
                 print(f"  Warning: Scene {scene_num} 오디오 파일 로드 실패 ({audio_file_path}): {e}.")
-                scene_duration = scene_info.get("duration_seconds", 3)
-        else:
-            print(f"  Scene {scene_num}: 오디오 파일 경로가 없거나 파일이 존재하지 않음. JSON의 duration_seconds 사용.")
-            scene_duration = scene_info.get("duration_seconds", 3) 
-        
-        if scene_duration <= 0.1: 
-            print(f"  Warning: Scene {scene_num}의 유효한 재생 시간이 너무 짧습니다({scene_duration:.2f}s). 0.5초로 강제 설정.")
-            scene_duration = 0.5
         
         total_video_duration_calculated += scene_duration
         
-        scene_image_description = scene_info.get("recommended_image_description", "")
-        
-        selected_image_path = recommend_image_for_scene(
-            scene_description=scene_image_description,
-            scene_narration=narration,
-            scene_subtitle=subtitle_text,
-            available_image_paths=available_images,
-            product_name=product_name,
-            scene_number=str(scene_num),
-            previously_used_filenames=used_image_filenames_in_video 
-        )
-
-        if not selected_image_path or not os.path.exists(selected_image_path):
-            print(f"  Scene {scene_num}: 적합한 이미지 찾지 못함/경로 유효하지 않음. 플레이스홀더 사용.")
-            if not os.path.exists(placeholder_path_temp):
-                 Image.new('RGB', VIDEO_RESOLUTION, color='grey').save(placeholder_path_temp)
-            selected_image_path = placeholder_path_temp
-        else:
-            used_image_filenames_in_video.append(os.path.basename(selected_image_path))
-
+        selected_image_path = select_scene_image(scene_info, storyboard_assignment, available_images, product_name,
+                                                 used_image_filenames_in_video, placeholder_path_temp)
         print(f"  Scene {scene_num}: 최종 선택 이미지 '{os.path.basename(selected_image_path)}', 길이: {scene_duration:.2f}s")
+
+        if VIDEO_RENDER_ENGINE == "ffmpeg":
+            ffmpeg_scenes.append(build_ffmpeg_scene(scene_info, selected_image_path, placeholder_path_temp,
+                                                    font_for_subtitle, scene_duration, audio_file_path))
+            continue
         
         try:
-            pil_image = Image.open(selected_image_path)
-            pil_image = pil_image.convert("RGB") 
-
-            resized_pil_image = ImageOps.pad(pil_image, VIDEO_RESOLUTION, method=Image.Resampling.LANCZOS, color=(0,0,0))
-            
-            numpy_image = np.array(resized_pil_image)
+            numpy_image = np.array(get_image_store().frame(selected_image_path, VIDEO_RESOLUTION))
             img_clip = ImageClip(numpy_image)
             img_clip = img_clip.set_duration(scene_duration)
 
@@ -161,19 +215,20 @@ def create_video_from_scenario(scenario_data_with_audio, product_name, downloade
             print(f"  Error creating image clip for Scene {scene_num} ({selected_image_path}): {e}. Using placeholder.")
             if not os.path.exists(placeholder_path_temp): Image.new('RGB', VIDEO_RESOLUTION, color='darkgrey').save(placeholder_path_temp)
             
-            pil_placeholder = Image.open(placeholder_path_temp).convert("RGB")
-            resized_placeholder = ImageOps.pad(pil_placeholder, VIDEO_RESOLUTION, method=Image.Resampling.LANCZOS, color=(0,0,0))
-            
-            numpy_placeholder = np.array(resized_placeholder)
+            numpy_placeholder = np.array(get_image_store().frame(placeholder_path_temp, VIDEO_RESOLUTION))
             img_clip = ImageClip(numpy_placeholder).set_duration(scene_duration)
 
 
         txt_clip = None
         if subtitle_text:
             try:
-                txt_clip = TextClip(subtitle_text, fontsize=50, color='white', font=font_for_subtitle,
-                                    stroke_color='black', stroke_width=2.5, method='caption', 
-                                    size=(VIDEO_RESOLUTION[0]*0.9, None), align='South', kerning=-1)
+                if SUBTITLE_RENDERER == "imagemagick":
+                    txt_clip = TextClip(subtitle_text, fontsize=50, color='white', font=font_for_subtitle,
+                                        stroke_color='black', stroke_width=2.5, method='caption', 
+                                        size=(VIDEO_RESOLUTION[0]*0.9, None), align='South', kerning=-1)
+                else:
+                    # RGBA 배열의 알파 채널이 마스크로 쓰인다 (서브프로세스 없음)
+                    txt_clip = ImageClip(render_subtitle(subtitle_text, font_for_subtitle))
                 txt_clip = txt_clip.set_position(('center', VIDEO_RESOLUTION[1] * 0.8)).set_duration(scene_duration)
             except Exception as e:
                 print(f"  Error creating text clip for Scene {scene_num} ('{subtitle_text}') using font '{font_for_subtitle}': {e}")
@@ -187,6 +242,27 @@ def create_video_from_scenario(scenario_data_with_audio, product_name, downloade
         
         scene_clips.append(scene_video_clip)
 
+    output_video_path = output_video_path_for(videos_folder, product_name)
+    MAX_VIDEO_LENGTH = 55 
+
+    if VIDEO_RENDER_ENGINE == "ffmpeg":
+        print(f"\n조합된 영상의 총 길이 (씬 기반 계산): {total_video_duration_calculated:.2f} 초")
+        if total_video_duration_calculated > MAX_VIDEO_LENGTH:
+            print(f"⚠️ 경고: 최종 영상 길이({total_video_duration_calculated:.2f}초)가 목표({MAX_VIDEO_LENGTH}초)를 초과했습니다.")
+        print(f"\n최종 영상 저장 중 (ffmpeg 직접 인코딩)... ({output_video_path})")
+        render_started_at = time.perf_counter()
+        try:
+            result_path = render_scenes_with_ffmpeg(ffmpeg_scenes, output_video_path, work_folder=videos_folder)
+        finally:
+            if os.path.exists(placeholder_path_temp):
+                try: os.remove(placeholder_path_temp)
+                except: pass
+        if result_path:
+            print(f"🎉 최종 영상 저장 완료: {output_video_path} (렌더링 {time.perf_counter() - render_started_at:.1f}초)")
+        else:
+            print("생성된 씬이 없거나 ffmpeg 렌더링에 실패해 영상을 만들 수 없습니다.")
+        return result_path
+
     if not scene_clips:
         print("생성된 씬 클립이 없어 영상을 만들 수 없습니다.")
         if os.path.exists(placeholder_path_temp):
@@ -199,25 +275,22 @@ def create_video_from_scenario(scenario_data_with_audio, product_name, downloade
     print(f"\n조합된 영상의 총 길이 (씬 기반 계산): {total_video_duration_calculated:.2f} 초")
     print(f"MoviePy 최종 클립 길이: {final_clip.duration:.2f} 초")
 
-    MAX_VIDEO_LENGTH = 55 
     if final_clip.duration > MAX_VIDEO_LENGTH:
         print(f"⚠️ 경고: 최종 영상 길이({final_clip.duration:.2f}초)가 목표({MAX_VIDEO_LENGTH}초)를 초과했습니다.")
     
-    safe_product_name = "".join(c if c.isalnum() else "_" for c in product_name[:30])
-    output_video_filename = f"{safe_product_name}_shorts_video.mp4"
-    output_video_path = os.path.join(VIDEOS_FOLDER, output_video_filename)
-    
     try:
         print(f"\n최종 영상 저장 중... ({output_video_path})")
-        final_clip.write_videofile(output_video_path, 
-                                   fps=VIDEO_FPS, 
-                                   codec="libx264", 
-                                   audio_codec="aac", 
-                                   threads=os.cpu_count(), 
-                                   preset="medium",
-                                   ffmpeg_params=['-crf', '23']
-                                  )
-        print(f"🎉 최종 영상 저장 완료: {output_video_path}")
+        render_started_at = time.perf_counter()
+        with span("render.moviepy_write", scenes=len(scene_clips)):
+            final_clip.write_videofile(output_video_path, 
+                                       fps=VIDEO_FPS, 
+                                       codec="libx264", 
+                                       audio_codec="aac", 
+                                       threads=os.cpu_count(), 
+                                       preset="medium",
+                                       ffmpeg_params=['-crf', '23']
+                                      )
+        print(f"🎉 최종 영상 저장 완료: {output_video_path} (렌더링 {time.perf_counter() - render_started_at:.1f}초)")
         return output_video_path
     except Exception as e:
         print(f"최종 영상 저장 중 오류 발생: {e}")
@@ -1,14 +1,50 @@
 import os
+import re
+import json
+import hashlib
+import threading
+from xml.sax.saxutils import escape as xml_escape
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import texttospeech
 # from config import GCP_SERVICE_ACCOUNT_KEY_PATH # 이 import는 주석 처리하거나 삭제 가능
 from config import (AUDIO_CLIPS_FOLDER, TTS_LANGUAGE_CODE,
-                    TTS_VOICE_NAME_NEURAL, TTS_SPEAKING_RATE)
+                    TTS_VOICE_NAME_NEURAL, TTS_SPEAKING_RATE, TTS_MAX_CONCURRENCY,
+                    API_RETRY_MAX_ATTEMPTS, API_RETRY_BASE_DELAY_SECONDS, API_RETRY_MAX_DELAY_SECONDS,
+                    TTS_AUDIO_CACHE_PATH, TTS_AUDIO_CACHE_MAX_BYTES, TTS_SYNTHESIS_MODE,
+                    TTS_SSML_MARK_GRANULARITY, TTS_SSML_MAX_BYTES, TTS_LINEAR16_SAMPLE_RATE)
 from utils.file_utils import ensure_folder_exists, clear_folder_contents
+from utils.rate_limit_utils import call_with_retry
+from utils.sqlite_cache import SQLiteCache
+from utils.audio_utils import mp3_duration_from_bytes, split_wav_bytes
+from utils.logging_utils import span, increment, carry_context
 
 # _gcp_credentials_set 변수는 더 이상 필요 없을 수 있습니다.
 # 또는 로깅 플래그로 사용할 수 있습니다.
 _gcp_auth_logged = False
 
+# gRPC 채널/인증 핸드셰이크를 매번 새로 하지 않도록 프로세스당 하나의 클라이언트를 재사용 (스레드 안전)
+_tts_client = None
+_tts_client_lock = threading.Lock()
+_tts_audio_cache = None
+_tts_timepoint_client = None
+
+def get_tts_client():
+    global _tts_client
+    with _tts_client_lock:
+        if _tts_client is None:
+            # TextToSpeechClient는 초기화 시 GOOGLE_APPLICATION_CREDENTIALS를 자동으로 사용합니다.
+            _tts_client = texttospeech.TextToSpeechClient()
+        return _tts_client
+
+def get_tts_timepoint_client():
+    """SSML <mark> 시점(timepoint)을 돌려주는 v1beta1 클라이언트 (ssml_whole 모드 전용)."""
+    global _tts_timepoint_client
+    with _tts_client_lock:
+        if _tts_timepoint_client is None:
+            from google.cloud import texttospeech_v1beta1
+            _tts_timepoint_client = texttospeech_v1beta1.TextToSpeechClient()
+        return _tts_timepoint_client
+
 def check_gcp_authentication():
     """
     Checks if GCP authentication is likely set up (via GOOGLE_APPLICATION_CREDENTIALS)
@@ -31,13 +67,38 @@ def check_gcp_authentication():
             print("   Ensure 'GCP_CREDENTIALS_SECRET' is set in GitHub Codespaces secrets and devcontainer.json is configured correctly.")
         _gcp_auth_logged = True
 
-def synthesize_text_to_speech(text_to_synthesize, output_filename, scene_number):
+def get_tts_audio_cache():
+    global _tts_audio_cache
+    with _tts_client_lock:
+        if _tts_audio_cache is None:
+            _tts_audio_cache = SQLiteCache(TTS_AUDIO_CACHE_PATH, TTS_AUDIO_CACHE_MAX_BYTES)
+        return _tts_audio_cache
+
+def _tts_cache_key(text_to_synthesize, audio_encoding_name):
+    key_source = json.dumps([text_to_synthesize, TTS_LANGUAGE_CODE, TTS_VOICE_NAME_NEURAL,
+                             TTS_SPEAKING_RATE, audio_encoding_name], ensure_ascii=False)
+    return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+def synthesize_scene_audio(text_to_synthesize, output_filename, scene_number, audio_folder=AUDIO_CLIPS_FOLDER):
+    """씬 음성을 파일로 저장하고 (파일 경로, 길이(초) 또는 None)을 반환한다. 실패 시 (None, None).
+    같은 텍스트/목소리/속도/인코딩의 음성은 캐시에서 바로 쓰며, 이때 Google 호출과 길이 측정을 모두 건너뛴다."""
     # 함수 호출 시마다 인증 상태를 확인하거나, generate_audio_clips_from_scenario 시작 시 한 번만 호출
     # 여기서는 generate_audio_clips_from_scenario에서 호출한다고 가정하고 생략 가능
 
     try:
-        # TextToSpeechClient는 초기화 시 GOOGLE_APPLICATION_CREDENTIALS를 자동으로 사용합니다.
-        client = texttospeech.TextToSpeechClient()
+        ensure_folder_exists(audio_folder)
+        output_filepath = os.path.join(audio_folder, output_filename)
+        cache = get_tts_audio_cache()
+        cache_key = _tts_cache_key(text_to_synthesize, texttospeech.AudioEncoding.MP3.name)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            audio_content, meta = cached
+            with open(output_filepath, "wb") as out:
+                out.write(audio_content)
+            print(f"  Scene {scene_number}: TTS 캐시 사용 -> {output_filepath}")
+            return output_filepath, meta.get("duration_seconds")
+
+        client = get_tts_client()
         input_text = texttospeech.SynthesisInput(text=text_to_synthesize)
         voice = texttospeech.VoiceSelectionParams(
             language_code=TTS_LANGUAGE_CODE, name=TTS_VOICE_NAME_NEURAL
@@ -47,27 +108,134 @@ def synthesize_text_to_speech(text_to_synthesize, output_filename, scene_number)
             speaking_rate=TTS_SPEAKING_RATE  # 말하기 속도 설정
         )
         print(f"  Synthesizing speech for scene {scene_number} (Rate: {TTS_SPEAKING_RATE}): '{text_to_synthesize[:30]}...'")
-        response = client.synthesize_speech(
-            request={"input": input_text, "voice": voice, "audio_config": audio_config}
-        )
-        ensure_folder_exists(AUDIO_CLIPS_FOLDER)
-        output_filepath = os.path.join(AUDIO_CLIPS_FOLDER, output_filename)
+        def _on_retry(attempt, error, delay):
+            print(f"  ↻ Scene {scene_number} TTS 재시도 {attempt}회차 ({delay:.1f}초 후): {error}")
+
+        with span("tts.synthesize", scene=scene_number, chars=len(text_to_synthesize)):
+            response = call_with_retry(
+                lambda: client.synthesize_speech(
+                    request={"input": input_text, "voice": voice, "audio_config": audio_config}
+                ),
+                API_RETRY_MAX_ATTEMPTS, API_RETRY_BASE_DELAY_SECONDS, API_RETRY_MAX_DELAY_SECONDS, on_retry=_on_retry)
+        increment("bytes_downloaded", len(response.audio_content))
         with open(output_filepath, "wb") as out:
             out.write(response.audio_content)
             print(f"  Audio content written to file: {output_filepath}")
-        return output_filepath
     except Exception as e:
         # 오류 발생 시 인증 문제일 가능성을 로깅에 추가할 수 있습니다.
         gcp_auth_env_val = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         auth_hint = f"(GOOGLE_APPLICATION_CREDENTIALS: {gcp_auth_env_val if gcp_auth_env_val else 'Not set'})"
         print(f"Error during TTS for scene {scene_number} ('{text_to_synthesize[:30]}...'): {e} {auth_hint}")
+        return None, None
+
+    # 응답 바이트의 MP3 프레임 헤더로 길이를 계산 (파일을 다시 열거나 ffmpeg를 띄우지 않음)
+    duration_seconds = mp3_duration_from_bytes(response.audio_content)
+    if duration_seconds is None:
+        print(f"  Warning: Scene {scene_number} 오디오 길이 측정 실패 ({output_filepath}): MP3 프레임을 찾지 못했습니다.")
+        return output_filepath, None
+    cache.put(cache_key, response.audio_content, {"duration_seconds": duration_seconds})
+    return output_filepath, duration_seconds
+
+def synthesize_text_to_speech(text_to_synthesize, output_filename, scene_number, audio_folder=AUDIO_CLIPS_FOLDER):
+    return synthesize_scene_audio(text_to_synthesize, output_filename, scene_number, audio_folder)[0]
+
+def _split_narration_units(narration):
+    if TTS_SSML_MARK_GRANULARITY == "word":
+        return narration.split()
+    if TTS_SSML_MARK_GRANULARITY == "sentence":
+        return [unit for unit in re.split(r"(?<=[.!?])\s+", narration.strip()) if unit]
+    return [narration.strip()]
+
+def build_narration_ssml(synthesis_jobs):
+    """씬마다 <mark name="scene_N"/>를, 그 안의 단위(문장/단어)마다 <mark name="scene_N_K"/>를 넣은 SSML을 만든다.
+    반환값: (ssml 문자열, {씬 마크: [(단위 마크, 단위 텍스트), ...]})"""
+    parts = ["<speak>"]
+    units_by_scene_mark = {}
+    for scene_idx, narration, _, _ in synthesis_jobs:
+        scene_mark = f"scene_{scene_idx}"
+        parts.append(f'<mark name="{scene_mark}"/>')
+        units = []
+        for unit_idx, unit in enumerate(_split_narration_units(narration)):
+            unit_mark = f"{scene_mark}_{unit_idx}"
+            if TTS_SSML_MARK_GRANULARITY != "scene":
+                parts.append(f'<mark name="{unit_mark}"/>')
+            parts.append(xml_escape(unit) + " ")
+            units.append((unit_mark, unit))
+        units_by_scene_mark[scene_mark] = units
+    parts.append("</speak>")
+    return "".join(parts), units_by_scene_mark
+
+def synthesize_whole_narration(synthesis_jobs, audio_folder=AUDIO_CLIPS_FOLDER):
+    """모든 씬의 내레이션을 SSML 한 번으로 합성하고 씬 마크 시점으로 잘라 씬별 WAV로 저장한다.
+    반환값: {씬 인덱스: (파일 경로, 길이(초), 타임포인트 목록)}. 이 모드를 쓸 수 없으면 None (씬별 합성으로 대체)."""
+    ssml, units_by_scene_mark = build_narration_ssml(synthesis_jobs)
+    if len(ssml.encode("utf-8")) > TTS_SSML_MAX_BYTES:
+        print(f"  SSML 길이({len(ssml.encode('utf-8'))} bytes)가 한도({TTS_SSML_MAX_BYTES})를 넘어 씬별 합성으로 진행합니다.")
         return None
 
-def generate_audio_clips_from_scenario(scenario_data, product_name):
-    if not scenario_data:
-        print("시나리오 데이터가 없어 음성 생성을 건너<0xEB><0x9B><0x84>니다.")
-        return scenario_data # 원본 데이터 반환 유지
+    cache = get_tts_audio_cache()
+    cache_key = _tts_cache_key(ssml, f"LINEAR16:{TTS_LINEAR16_SAMPLE_RATE}:ssml")
+    cached = cache.get(cache_key)
+    if cached is not None:
+        wav_bytes, meta = cached
+        mark_times = meta["timepoints"]
+        print(f"  전체 내레이션 TTS 캐시 사용 (씬 {len(synthesis_jobs)}개)")
+    else:
+        try:
+            from google.cloud import texttospeech_v1beta1
+            client = get_tts_timepoint_client()
+            request = texttospeech_v1beta1.SynthesizeSpeechRequest(
+                input=texttospeech_v1beta1.SynthesisInput(ssml=ssml),
+                voice=texttospeech_v1beta1.VoiceSelectionParams(
+                    language_code=TTS_LANGUAGE_CODE, name=TTS_VOICE_NAME_NEURAL),
+                audio_config=texttospeech_v1beta1.AudioConfig(
+                    audio_encoding=texttospeech_v1beta1.AudioEncoding.LINEAR16,
+                    speaking_rate=TTS_SPEAKING_RATE,
+                    sample_rate_hertz=TTS_LINEAR16_SAMPLE_RATE),
+                enable_time_pointing=[texttospeech_v1beta1.SynthesizeSpeechRequest.TimepointType.SSML_MARK],
+            )
+            print(f"  전체 내레이션 SSML 합성 요청 (씬 {len(synthesis_jobs)}개, {len(ssml.encode('utf-8'))} bytes)")
+            def _on_retry(attempt, error, delay):
+                print(f"  ↻ 전체 내레이션 TTS 재시도 {attempt}회차 ({delay:.1f}초 후): {error}")
+
+            with span("tts.synthesize_ssml", scenes=len(synthesis_jobs), ssml_bytes=len(ssml.encode("utf-8"))):
+                response = call_with_retry(
+                    lambda: client.synthesize_speech(request=request),
+                    API_RETRY_MAX_ATTEMPTS, API_RETRY_BASE_DELAY_SECONDS, API_RETRY_MAX_DELAY_SECONDS, on_retry=_on_retry)
+            increment("bytes_downloaded", len(response.audio_content))
+        except Exception as e:
+            print(f"  전체 내레이션 SSML 합성 실패, 씬별 합성으로 진행합니다: {e}")
+            return None
+        wav_bytes = response.audio_content
+        mark_times = {tp.mark_name: tp.time_seconds for tp in response.timepoints}
+
+    scene_marks = [f"scene_{job[0]}" for job in synthesis_jobs]
+    missing_marks = [mark for mark in scene_marks if mark not in mark_times]
+    if missing_marks:
+        print(f"  응답에 씬 마크가 없어 씬별 합성으로 진행합니다: {missing_marks}")
+        return None
+    if cached is None:
+        cache.put(cache_key, wav_bytes, {"timepoints": mark_times})
 
+    # 각 씬은 자기 마크부터 다음 씬 마크까지 (마지막 씬은 끝까지)
+    boundaries = [(mark_times[mark], mark_times[scene_marks[i + 1]] if i + 1 < len(scene_marks) else None)
+                  for i, mark in enumerate(scene_marks)]
+    segments = split_wav_bytes(wav_bytes, boundaries)
+
+    results = {}
+    for (scene_idx, _, output_filename, scene_num), scene_mark, (start_seconds, _), (segment_bytes, duration) in zip(
+            synthesis_jobs, scene_marks, boundaries, segments):
+        output_filepath = os.path.join(audio_folder, os.path.splitext(output_filename)[0] + ".wav")
+        with open(output_filepath, "wb") as out:
+            out.write(segment_bytes)
+        timepoints = [{"text": unit, "start_seconds": round(mark_times[unit_mark] - start_seconds, 3)}
+                      for unit_mark, unit in units_by_scene_mark[scene_mark] if unit_mark in mark_times]
+        results[scene_idx] = (output_filepath, duration, timepoints)
+        print(f"  Scene {scene_num}: {duration:.2f}s 구간 저장 -> {output_filepath}")
+    return results
+
+def begin_audio_generation(audio_folder=AUDIO_CLIPS_FOLDER):
+    """GCP 인증 상태를 확인하고 음성 폴더를 비운다. TTS를 진행할 수 없으면 False."""
     # 프로그램 시작 부분 또는 주요 기능 실행 전에 GCP 인증 상태를 한 번 확인합니다.
     check_gcp_authentication()
 
@@ -78,16 +246,17 @@ def generate_audio_clips_from_scenario(scenario_data, product_name):
         # scene_data에 audio_file_path 등을 None으로 채워서 반환하거나,
         # 오류 플래그를 설정하여 video_editor 등에서 음성 없이 진행하도록 할 수 있습니다.
         # 여기서는 일단 원본 데이터를 반환하고, 로그를 통해 문제를 파악하도록 합니다.
-        return scenario_data
-
+        return False
 
     print("\n=== 시나리오 기반 음성 클립 생성 시작 ===")
-    if os.path.exists(AUDIO_CLIPS_FOLDER): clear_folder_contents(AUDIO_CLIPS_FOLDER)
-    ensure_folder_exists(AUDIO_CLIPS_FOLDER)
-
-    updated_scenario_data = []
-    total_audio_duration = 0
+    if os.path.exists(audio_folder): clear_folder_contents(audio_folder)
+    ensure_folder_exists(audio_folder)
+    return True
 
+def prepare_scene_copies(scenario_data, product_name):
+    """씬 dict 복사본과 합성 작업 목록 [(씬 인덱스, narration, 출력 파일명, 씬 번호), ...]을 만든다."""
+    scene_copies = []
+    synthesis_jobs = [] # (scene_copies 인덱스, narration, output_filename, scene_num)
     for scene_idx, scene in enumerate(scenario_data): # enumerate 사용 권장
         scene_copy = scene.copy()
         # scene_num = scene_copy.get("scene_number", f"unknown_{scene_idx+1}") # scene_number가 없을 경우 대비
@@ -96,41 +265,73 @@ def generate_audio_clips_from_scenario(scenario_data, product_name):
             scene_num = scene_idx + 1
             scene_copy["scene_number"] = scene_num
             print(f"  Warning: Scene {scene_num} (index {scene_idx}) is missing 'scene_number' in input data. Assigning sequential number.")
+        scene_copies.append(scene_copy)
+        if scene_copy.get("narration"):
+            safe_product_name = "".join(c if c.isalnum() else "_" for c in product_name[:20])
+            output_filename = f"{safe_product_name}_scene_{str(scene_num).zfill(2)}.mp3"
+            synthesis_jobs.append((scene_idx, scene_copy["narration"], output_filename, scene_num))
+    return scene_copies, synthesis_jobs
 
+def apply_audio_result(scene_copy, audio_path=None, audio_duration=None, timepoints=None):
+    """합성 결과를 씬 dict에 기록한다 (audio_file_path, actual_audio_duration_seconds 등).
+    실제로 측정된 오디오 길이(없으면 0)를 반환한다."""
+    scene_num = scene_copy["scene_number"]
+    if not scene_copy.get("narration"):
+        scene_copy["audio_file_path"] = None
+        scene_copy["actual_audio_duration_seconds"] = scene_copy.get("duration_seconds", 0)
+        print(f"  Scene {scene_num}: 내레이션이 없어 음성 생성을 건너<0xEB><0x9B><0x84>니다.")
+        return 0
 
-        narration = scene_copy.get("narration")
+    scene_copy["audio_file_path"] = audio_path
+    if timepoints is not None: # 자막 단계에서 단어/문장 단위 싱크에 사용 (씬 시작 기준 초)
+        scene_copy["narration_timepoints"] = timepoints
+    if audio_path and os.path.exists(audio_path): # audio_path가 None이 아니고, 파일도 실제로 존재하는지 확인
+        if audio_duration is not None: # 합성 시 측정했거나 캐시에 저장된 길이
+            scene_copy["actual_audio_duration_seconds"] = audio_duration
+            return audio_duration
+        # 길이 측정에 실패한 경우 JSON의 duration_seconds를 사용
+        scene_copy["actual_audio_duration_seconds"] = scene_copy.get("duration_seconds", 0)
+    else: # audio_path가 None이거나 파일이 없는 경우
+        scene_copy["actual_audio_duration_seconds"] = scene_copy.get("duration_seconds", 0)
+        if audio_path is None: # synthesize_text_to_speech에서 None이 반환된 경우
+             print(f"  Info: Scene {scene_num} - 음성 파일 생성 실패. 'actual_audio_duration_seconds'는 JSON 값을 따릅니다.")
+    return 0
 
-        if narration:
-            safe_product_name = "".join(c if c.isalnum() else "_" for c in product_name[:20])
-            output_filename = f"{safe_product_name}_scene_{str(scene_num).zfill(2)}.mp3"
-            audio_path = synthesize_text_to_speech(narration, output_filename, scene_num)
-            scene_copy["audio_file_path"] = audio_path
-            if audio_path and os.path.exists(audio_path): # audio_path가 None이 아니고, 파일도 실제로 존재하는지 확인
-                try:
-                    from moviepy.editor import AudioFileClip
-                    temp_audio_clip = AudioFileClip(audio_path)
-                    scene_copy["actual_audio_duration_seconds"] = temp_audio_clip.duration
-                    total_audio_duration += temp_audio_clip.duration
-                    temp_audio_clip.close()
-                except Exception as e_audio_dur:
-                    print(f"  Warning: Scene {scene_num} 오디오 길이 측정 실패 ({audio_path}): {e_audio_dur}")
-                    # fallback으로 JSON의 duration_seconds를 사용하거나, 0 또는 다른 기본값을 설정
-                    scene_copy["actual_audio_duration_seconds"] = scene_copy.get("duration_seconds", 0)
-            else: # audio_path가 None이거나 파일이 없는 경우
-                scene_copy["actual_audio_duration_seconds"] = scene_copy.get("duration_seconds", 0)
-                if audio_path is None: # synthesize_text_to_speech에서 None이 반환된 경우
-                     print(f"  Info: Scene {scene_num} - 음성 파일 생성 실패. 'actual_audio_duration_seconds'는 JSON 값을 따릅니다.")
+def generate_audio_clips_from_scenario(scenario_data, product_name, audio_folder=AUDIO_CLIPS_FOLDER):
+    if not scenario_data:
+        print("시나리오 데이터가 없어 음성 생성을 건너<0xEB><0x9B><0x84>니다.")
+        return scenario_data # 원본 데이터 반환 유지
 
-        else:
-            scene_copy["audio_file_path"] = None
-            scene_copy["actual_audio_duration_seconds"] = scene_copy.get("duration_seconds", 0)
-            print(f"  Scene {scene_num}: 내레이션이 없어 음성 생성을 건너<0xEB><0x9B><0x84>니다.")
+    if not begin_audio_generation(audio_folder):
+        return scenario_data
+
+    total_audio_duration = 0
+    scene_copies, synthesis_jobs = prepare_scene_copies(scenario_data, product_name)
+
+    # 씬별 합성을 병렬로 요청. 파일명은 씬 번호로 정해지므로 완료 순서와 무관하게 씬 순서가 유지됨
+    audio_results_by_index = {}
+    timepoints_by_index = {}
+    if synthesis_jobs and TTS_SYNTHESIS_MODE == "ssml_whole":
+        whole_results = synthesize_whole_narration(synthesis_jobs, audio_folder)
+        if whole_results is not None:
+            audio_results_by_index = {idx: (path, duration) for idx, (path, duration, _) in whole_results.items()}
+            timepoints_by_index = {idx: timepoints for idx, (_, _, timepoints) in whole_results.items()}
+    if synthesis_jobs and not audio_results_by_index:
+        max_workers = max(1, min(TTS_MAX_CONCURRENCY, len(synthesis_jobs)))
+        print(f"  씬 {len(synthesis_jobs)}개 음성 합성 요청 (동시 {max_workers}개)")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            audio_results = executor.map(
+                carry_context(lambda job: synthesize_scene_audio(job[1], job[2], job[3], audio_folder)), synthesis_jobs)
+            audio_results_by_index = {job[0]: result for job, result in zip(synthesis_jobs, audio_results)}
 
-        updated_scenario_data.append(scene_copy)
+    for scene_idx, scene_copy in enumerate(scene_copies):
+        audio_path, audio_duration = audio_results_by_index.get(scene_idx, (None, None))
+        total_audio_duration += apply_audio_result(scene_copy, audio_path, audio_duration,
+                                                   timepoints_by_index.get(scene_idx))
 
     if total_audio_duration > 0:
-        print(f"음성 클립 생성 완료. 생성된 총 오디오 길이 (MoviePy 측정 기준): {total_audio_duration:.2f} 초")
+        print(f"음성 클립 생성 완료. 생성된 총 오디오 길이 (오디오 헤더 기준): {total_audio_duration:.2f} 초")
     else:
         print("생성된 음성 클립이 없거나 길이를 측정할 수 없었습니다.")
 
-    return updated_scenario_data
\ No newline at end of file
+    return scene_copies
@@ -1,64 +1,311 @@
 import os
+import json
 import time
+import argparse
+import contextlib
+import traceback
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import config # config 모듈 import
 from config import initialize_project_folders # config에서 함수 직접 import
-from core.data_collector import setup_image_collection, collect_product_details, download_images_from_urls
-from core.image_processor import extract_texts_from_images_in_folder
+from core.data_collector import (setup_image_collection, collect_product_details, download_images_from_urls,
+                                 shutdown_browser_pool)
+from core.image_processor import extract_texts_from_images_in_folder, StreamingOCR, OCR_PROMPT_VERSION
+from core.image_proxy import generate_image_proxies
 from core.scenario_generator import generate_initial_narration, generate_scene_by_scene_script # 수정
 from core.voice_generator import generate_audio_clips_from_scenario
 from core.video_editor import create_video_from_scenario
+from core.scene_pipeline import ScenePipeline
+from core.gemini_gateway import reset_gemini_stats, print_gemini_stats
+from core.image_upload_registry import release_image_uploads
+from core.image_store import release_image_store
+from utils.file_utils import save_text_to_file, file_sha256
+from utils.workspace_utils import create_job_workspace, make_job_id
+from utils.job_manifest import JobManifest, PIPELINE_STAGES, fingerprint
+from utils.logging_utils import (span, open_span, close_span, enter_span, current_span, reset_trace,
+                                 export_jsonl, export_chrome_trace, print_trace_summary)
 
-def run_ai_shorts_generator(target_url):
+def _stage_mode(stage_name, from_stage=None, only_stage=None):
+    """"auto": 입력이 같으면 기록된 결과 재사용 / "run": 강제 실행 / "reuse": 기록된 결과만 사용 / "skip": 실행 안 함"""
+    stage_idx = PIPELINE_STAGES.index(stage_name)
+    if only_stage:
+        only_idx = PIPELINE_STAGES.index(only_stage)
+        return "run" if stage_idx == only_idx else ("reuse" if stage_idx < only_idx else "skip")
+    if from_stage and stage_idx >= PIPELINE_STAGES.index(from_stage):
+        return "run"
+    return "auto"
+
+def _run_stage(manifest, stage_name, mode, input_parts, run_func, stage_span=None):
+    """단계 하나를 실행하거나 manifest에 기록된 결과를 재사용한다.
+    run_func()는 (outputs, 출력 파일 목록)을 반환하고, 실패하면 outputs가 None이다.
+    단계마다 "stage.<이름>" span을 남기고, 끝날 때마다 작업 폴더의 trace 파일을 갱신한다.
+    stage_span을 주면 새로 열지 않고 (앞 단계에서 미리 연) 그 span을 이어 쓰다가 닫는다."""
+    inputs_fingerprint = fingerprint(*input_parts)
+    stage_context = (enter_span(stage_span) if stage_span is not None
+                     else span(f"stage.{stage_name}", reset_peak_rss=True, mode=mode))
+    try:
+        with stage_context as stage_span:
+            if mode in ("auto", "reuse"):
+                outputs = manifest.completed_outputs(stage_name, inputs_fingerprint if mode == "auto" else None)
+                if outputs is not None:
+                    print(f"  ⏭️  [{stage_name}] 이전 실행 결과 재사용 (manifest.json)")
+                    stage_span.set(reused=True)
+                    return outputs
+                if mode == "reuse":
+                    print(f"  [{stage_name}] 재사용할 완료 기록이 없습니다. 먼저 이 단계를 실행하세요.")
+                    return None
+            manifest.mark_running(stage_name, inputs_fingerprint)
+            try:
+                outputs, files = run_func()
+            except Exception as e:
+                manifest.mark_failed(stage_name, f"{type(e).__name__}: {e}")
+                raise
+            if outputs is None:
+                manifest.mark_failed(stage_name, "no output")
+                return None
+            manifest.mark_completed(stage_name, outputs, files)
+            return outputs
+    finally:
+        _export_trace(os.path.dirname(manifest.path))
+
+def _export_trace(job_root):
+    if config.TRACE_EXPORT_ENABLED:
+        export_jsonl(os.path.join(job_root, "trace.jsonl"))
+        export_chrome_trace(os.path.join(job_root, "trace.chrome.json"))
+
+def _finish_only_stage(only_stage, start_time):
+    print(f"\n--only-stage {only_stage} 실행 완료. 이후 단계는 실행하지 않습니다. (총 {time.time() - start_time:.2f} 초)")
+    return None
+
+def _image_fingerprints(image_paths):
+    return [file_sha256(path) for path in image_paths if os.path.exists(path)]
+
+def run_ai_shorts_generator(target_url, job_id=None, from_stage=None, only_stage=None):
+    try:
+        return _generate_shorts(target_url, job_id, from_stage, only_stage)
+    finally:
+        release_image_uploads() # 작업 중 업로드한 이미지는 성공/실패와 관계없이 정리
+        release_image_store()
+
+def _generate_shorts(target_url, job_id, from_stage, only_stage):
     start_time = time.time()
     print("🚀 AI 쇼츠 영상 자동 생성 시작 🚀")
     initialize_project_folders()
+    reset_trace()
+    reset_gemini_stats()
+    workspace = create_job_workspace(target_url, job_id)
+    manifest = JobManifest(workspace)
+    print(f"작업 폴더: {workspace['root']} (job_id: {workspace['job_id']})")
+    modes = {stage: _stage_mode(stage, from_stage, only_stage) for stage in PIPELINE_STAGES}
+    # 대본 이후 단계는 씬 단위 작업 그래프로 겹쳐 실행 (ffmpeg 엔진에서 렌더까지 진행할 때만)
+    use_scene_graph = (config.PIPELINE_SCHEDULER == "graph" and config.VIDEO_RENDER_ENGINE == "ffmpeg"
+                       and modes["render"] != "skip")
+    streaming_ocr = None # 수집 단계가 실제로 실행되면 다운로드가 끝난 이미지부터 바로 OCR
 
     print("\n--- [Step 1] 데이터 수집 시작 ---")
-    setup_image_collection()
-    product_data = collect_product_details(target_url)
-    if not product_data or not product_data.get("name") or product_data.get("name") == "정보 없음": # 상품명 확인
-        print("상품 정보를 제대로 수집하지 못했습니다. 프로세스를 중단합니다.")
-        return
+    def _collect():
+        nonlocal streaming_ocr
+        setup_image_collection(workspace["images_raw"])
+        product_data = collect_product_details(target_url)
+        if not product_data or not product_data.get("name") or product_data.get("name") == "정보 없음": # 상품명 확인
+            print("상품 정보를 제대로 수집하지 못했습니다. 프로세스를 중단합니다.")
+            return None, []
+        print(f"수집된 상품명: {product_data['name']}")
+        if config.PIPELINE_SCHEDULER == "graph" and modes["ocr"] in ("auto", "run"):
+            streaming_ocr = StreamingOCR(workspace["extracted_texts"])
+        product_data["downloaded_image_paths"] = download_images_from_urls(
+            product_data.get("image_urls", []), target_url, workspace["images_raw"],
+            on_image_ready=streaming_ocr.submit if streaming_ocr else None
+        )
+        generate_image_proxies(product_data["downloaded_image_paths"]) # 이후 모든 Gemini 호출은 프록시 사용
+        return product_data, product_data["downloaded_image_paths"]
+    product_data = _run_stage(manifest, "collect", modes["collect"], [target_url], _collect)
+    if not product_data:
+        return None
     product_name = product_data["name"]
-    print(f"수집된 상품명: {product_name}")
-    product_data["downloaded_image_paths"] = download_images_from_urls(
-        product_data.get("image_urls", []), target_url
-    )
+    downloaded_image_paths = product_data.get("downloaded_image_paths", [])
+    image_fingerprints = _image_fingerprints(downloaded_image_paths)
+    if modes["ocr"] == "skip":
+        return _finish_only_stage(only_stage, start_time)
 
     print("\n--- [Step 2] 이미지 내 OCR 텍스트 추출 시작 ---")
-    all_ocr_texts = extract_texts_from_images_in_folder(config.IMAGES_RAW_FOLDER) # config 사용
-    if not all_ocr_texts:
-        print("이미지에서 OCR 텍스트를 추출하지 못했습니다. 나레이션 품질에 영향이 있을 수 있습니다.")
+    def _ocr():
+        if streaming_ocr:
+            texts = streaming_ocr.finish()
+        else:
+            texts = extract_texts_from_images_in_folder(workspace["images_raw"], workspace["extracted_texts"])
+        if not texts:
+            print("이미지에서 OCR 텍스트를 추출하지 못했습니다. 나레이션 품질에 영향이 있을 수 있습니다.")
+        return texts or [], []
+    all_ocr_texts = _run_stage(manifest, "ocr", modes["ocr"],
+                               [image_fingerprints, config.GEMINI_VISION_MODEL_NAME, OCR_PROMPT_VERSION], _ocr)
+    if all_ocr_texts is None:
+        return None
+    if modes["narration"] == "skip":
+        return _finish_only_stage(only_stage, start_time)
 
     print("\n--- [Step 3.1] 초기 전체 나레이션 생성 시작 ---")
-    initial_narration = generate_initial_narration(product_name, all_ocr_texts)
+    def _narration():
+        narration = generate_initial_narration(product_name, all_ocr_texts, workspace["extracted_texts"])
+        if not narration:
+            print("초기 전체 나레이션을 생성하지 못했습니다. 프로세스를 중단합니다.")
+        return narration, []
+    initial_narration = _run_stage(manifest, "narration", modes["narration"],
+                                   [product_name, all_ocr_texts, config.GEMINI_TEXT_MODEL_NAME], _narration)
     if not initial_narration:
-        print("초기 전체 나레이션을 생성하지 못했습니다. 프로세스를 중단합니다.")
-        return
+        return None
+    if modes["scene_script"] == "skip":
+        return _finish_only_stage(only_stage, start_time)
 
     print("\n--- [Step 3.2] 씬별 JSON 스크립트 생성 시작 ---")
-    scene_script_data = generate_scene_by_scene_script(product_name, initial_narration)
+    def _scene_script():
+        script = generate_scene_by_scene_script(product_name, initial_narration, workspace["extracted_texts"])
+        if not script:
+            print("씬별 JSON 스크립트를 생성하지 못했습니다. 프로세스를 중단합니다.")
+        return script, []
+    scene_script_data = _run_stage(manifest, "scene_script", modes["scene_script"],
+                                   [product_name, initial_narration, config.GEMINI_TEXT_MODEL_NAME], _scene_script)
     if not scene_script_data:
-        print("씬별 JSON 스크립트를 생성하지 못했습니다. 프로세스를 중단합니다.")
-        return
+        return None
+    if modes["tts"] == "skip":
+        return _finish_only_stage(only_stage, start_time)
 
     print("\n--- [Step 4] 음성 클립 생성 시작 ---")
-    scenario_data_with_audio = generate_audio_clips_from_scenario(scene_script_data, product_name)
-    if not scenario_data_with_audio: # 오류가 나도 원본 scene_script_data를 사용하도록 voice_generator에서 처리
-        print("음성 클립 생성에 일부 문제가 있었을 수 있습니다. 원본 시나리오 데이터로 진행합니다.")
-        scenario_data_with_audio = scene_script_data 
+    scene_pipeline = None
+    render_span = None
+    def _new_scene_pipeline(scenario_data, synthesize_audio, render_span=None):
+        return ScenePipeline(scenario_data, product_name, downloaded_image_paths, synthesize_audio,
+                             workspace["audio_clips"], workspace["videos"], workspace["images_raw"],
+                             render_span).start()
+    def _tts():
+        nonlocal scene_pipeline, render_span
+        if use_scene_graph: # 음성이 끝나는 대로 이미지 선택/세그먼트 인코딩이 이어서 진행됨
+            # 렌더 쪽 작업은 음성 단계와 겹쳐 실행되므로 stage.render를 (stage.tts와 같은 부모 아래에) 미리 열어
+            # 그 아래에 기록하고, 렌더 단계에서 이 span을 이어 쓴다
+            render_span = open_span("stage.render", parent=current_span().parent, mode=modes["render"])
+            scene_pipeline = _new_scene_pipeline(scene_script_data, synthesize_audio=True, render_span=render_span)
+            scenario = scene_pipeline.scenario_with_audio()
+        else:
+            scenario = generate_audio_clips_from_scenario(scene_script_data, product_name, workspace["audio_clips"])
+        if not scenario: # 오류가 나도 원본 scene_script_data를 사용하도록 voice_generator에서 처리
+            print("음성 클립 생성에 일부 문제가 있었을 수 있습니다. 원본 시나리오 데이터로 진행합니다.")
+            scenario = scene_script_data
+        return scenario, [scene.get("audio_file_path") for scene in scenario]
+    scenario_data_with_audio = _run_stage(
+        manifest, "tts", modes["tts"],
+        [scene_script_data, config.TTS_LANGUAGE_CODE, config.TTS_VOICE_NAME_NEURAL, config.TTS_SPEAKING_RATE,
+         config.TTS_SYNTHESIS_MODE, config.TTS_SSML_MARK_GRANULARITY], _tts)
+    if not scenario_data_with_audio:
+        if scene_pipeline: scene_pipeline.discard()
+        if render_span: close_span(render_span)
+        return None
+    if modes["render"] == "skip":
+        return _finish_only_stage(only_stage, start_time)
 
     print("\n--- [Step 5] 영상 조합 시작 ---")
-    final_video_path = create_video_from_scenario(
-        scenario_data_with_audio,
-        product_name,
-        product_data.get("downloaded_image_paths", []) # downloaded_image_paths가 없을 수도 있으므로 .get 사용
-    )
+    def _render():
+        nonlocal scene_pipeline
+        if use_scene_graph:
+            if scene_pipeline is None: # 음성 단계 결과를 재사용한 경우: 이미지 선택/인코딩만 그래프로
+                scene_pipeline = _new_scene_pipeline(scenario_data_with_audio, synthesize_audio=False)
+            video_path = scene_pipeline.finish_video()
+            scene_pipeline = None
+            return video_path, [video_path]
+        video_path = create_video_from_scenario(
+            scenario_data_with_audio,
+            product_name,
+            downloaded_image_paths,
+            workspace["videos"],
+            workspace["images_raw"]
+        )
+        return video_path, [video_path]
+    final_video_path = _run_stage(
+        manifest, "render", modes["render"],
+        [scenario_data_with_audio, image_fingerprints, config.VIDEO_RENDER_ENGINE, config.VIDEO_RESOLUTION,
+         config.VIDEO_FPS, config.SUBTITLE_RENDERER, config.SUBTITLE_FONT_SIZE, config.IMAGE_SELECTION_MODE,
+         config.IMAGE_RECOMMENDER_BACKEND], _render, stage_span=render_span)
+    if scene_pipeline: # 렌더 단계 결과를 재사용했으면 진행 중인 작업만 정리 (세그먼트는 캐시에 남음)
+        scene_pipeline.discard()
 
     if final_video_path: print(f"\n🎉 모든 작업 완료! 생성된 영상: {final_video_path}")
     else: print("\n😥 영상 생성에 실패했습니다.")
+    print_trace_summary()
+    print_gemini_stats()
     end_time = time.time()
     print(f"총 실행 시간: {end_time - start_time:.2f} 초")
+    return final_video_path
+
+def _init_batch_worker():
+    # 워커 프로세스에서는 atexit이 실행되지 않으므로 브라우저 풀 정리를 Finalize로 등록
+    multiprocessing.util.Finalize(None, shutdown_browser_pool, exitpriority=10)
+
+def _run_batch_job(target_url, from_stage=None, only_stage=None):
+    """워커 프로세스에서 상품 하나를 처리하고 결과 요약 dict를 반환한다. 로그는 작업 폴더의 run.log에 남긴다."""
+    job_id = make_job_id(target_url)
+    log_path = os.path.join(create_job_workspace(target_url, job_id)["root"], "run.log")
+    started_at = time.time()
+    result = {"target_url": target_url, "job_id": job_id, "log_path": log_path}
+    with open(log_path, "w", encoding="utf-8") as log_file, \
+         contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+        try:
+            video_path = run_ai_shorts_generator(target_url, job_id, from_stage, only_stage)
+            result["status"] = "success" if video_path else "failed"
+            result["video_path"] = video_path
+        except Exception as e:
+            traceback.print_exc()
+            result["status"] = "failed"
+            result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed_seconds"] = round(time.time() - started_at, 2)
+    return result
+
+def read_target_urls(batch_file_path):
+    """한 줄에 URL 하나. 빈 줄과 #으로 시작하는 줄은 무시한다."""
+    with open(batch_file_path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
+def run_batch(target_urls, max_workers=config.BATCH_MAX_WORKERS, from_stage=None, only_stage=None):
+    # 같은 URL은 같은 작업 폴더를 쓰므로 중복 제거 (순서 유지)
+    target_urls = list(dict.fromkeys(target_urls))
+    if not target_urls:
+        print("처리할 상품 URL이 없습니다.")
+        return None
+    initialize_project_folders()
+    max_workers = max(1, min(max_workers, len(target_urls)))
+    print(f"🚀 배치 실행 시작: 상품 {len(target_urls)}개, 워커 {max_workers}개")
+    batch_started_at = time.time()
+    job_results = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker) as executor:
+        future_to_url = {executor.submit(_run_batch_job, url, from_stage, only_stage): url for url in target_urls}
+        for future in as_completed(future_to_url):
+            url = future_to_url[future]
+            try:
+                job_result = future.result()
+            except Exception as e: # 워커 프로세스 자체가 죽은 경우
+                job_result = {"target_url": url, "job_id": make_job_id(url), "status": "failed",
+                              "error": f"{type(e).__name__}: {e}"}
+            job_results.append(job_result)
+            status_icon = "✅" if job_result["status"] == "success" else "❌"
+            print(f"  {status_icon} [{len(job_results)}/{len(target_urls)}] {url} "
+                  f"({job_result.get('elapsed_seconds', 0):.1f} 초)")
+
+    job_results.sort(key=lambda r: target_urls.index(r["target_url"]))
+    succeeded = [r for r in job_results if r["status"] == "success"]
+    elapsed = time.time() - batch_started_at
+    summary = {
+        "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(batch_started_at)),
+        "max_workers": max_workers,
+        "total": len(job_results),
+        "succeeded": len(succeeded),
+        "failed": len(job_results) - len(succeeded),
+        "elapsed_seconds": round(elapsed, 2),
+        "jobs": job_results,
+    }
+    summary_path = os.path.join(
+        config.BATCH_SUMMARY_FOLDER,
+        f"batch_{time.strftime('%Y%m%d_%H%M%S', time.localtime(batch_started_at))}.json")
+    save_text_to_file(json.dumps(summary, indent=2, ensure_ascii=False), summary_path)
+    print(f"배치 완료: 성공 {summary['succeeded']}개 / 실패 {summary['failed']}개, 총 {elapsed:.2f} 초")
+    return summary_path
 
 if __name__ == "__main__":
     # target_product_url = "https://prod.danawa.com/info/?pcode=41499608&cate=10253217"
@@ -83,4 +330,23 @@ if __name__ == "__main__":
     #     print(f"webdriver-manager 실행 중 오류: {e_wdm}. ChromeDriver 수동 설정 필요.")
 
 
-    run_ai_shorts_generator(target_product_url)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="상품 상세 페이지로 AI 쇼츠 영상을 생성합니다.")
+    parser.add_argument("url", nargs="*", help="상품 URL (여러 개면 배치로 처리)")
+    parser.add_argument("--batch-file", help="한 줄에 URL 하나씩 적힌 파일")
+    parser.add_argument("--workers", type=int, default=config.BATCH_MAX_WORKERS,
+                        help=f"배치 실행 시 동시 처리 상품 수 (기본값: {config.BATCH_MAX_WORKERS})")
+    stage_group = parser.add_mutually_exclusive_group()
+    stage_group.add_argument("--from-stage", choices=PIPELINE_STAGES,
+                             help="이 단계부터 다시 실행 (이전 단계는 입력이 같으면 기록된 결과 재사용)")
+    stage_group.add_argument("--only-stage", choices=PIPELINE_STAGES,
+                             help="이 단계만 다시 실행 (이전 단계 결과는 manifest.json에서 읽음)")
+    args = parser.parse_args()
+
+    target_urls = list(args.url)
+    if args.batch_file:
+        target_urls.extend(read_target_urls(args.batch_file))
+    if len(target_urls) > 1 or args.batch_file:
+        run_batch(target_urls, args.workers, args.from_stage, args.only_stage)
+    else:
+        run_ai_shorts_generator(target_urls[0] if target_urls else target_product_url,
+                                from_stage=args.from_stage, only_stage=args.only_stage)
\ No newline at end of file
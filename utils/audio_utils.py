@@ -0,0 +1,148 @@
+import io
+import os
+import wave
+import struct
+
+# MP3 프레임 헤더 / WAV 헤더만 읽어서 재생 길이를 계산한다. (ffmpeg 서브프로세스를 띄우지 않음)
+
+_MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG 1
+    2: (22050, 24000, 16000),  # MPEG 2
+    0: (11025, 12000, 8000),   # MPEG 2.5
+}
+# kbps, 인덱스 1~14 (0=free, 15=bad)
+_BITRATES_V1 = {
+    3: (32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),  # Layer I
+    2: (32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),     # Layer II
+    1: (32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),      # Layer III
+}
+_BITRATES_V2 = {
+    3: (32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    2: (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    1: (8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+def _parse_frame_header(data, offset):
+    """offset 위치의 MPEG 오디오 프레임 헤더를 해석한다.
+    반환값: (프레임 길이(bytes), 프레임당 샘플 수, 샘플레이트, 버전 비트, 채널 모드) 또는 None"""
+    if offset + 4 > len(data):
+        return None
+    header = struct.unpack(">I", data[offset:offset + 4])[0]
+    if (header >> 21) & 0x7FF != 0x7FF:
+        return None
+    version = (header >> 19) & 0x3
+    layer = (header >> 17) & 0x3
+    bitrate_index = (header >> 12) & 0xF
+    sample_rate_index = (header >> 10) & 0x3
+    padding = (header >> 9) & 0x1
+    channel_mode = (header >> 6) & 0x3
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    sample_rate = _MPEG_SAMPLE_RATES[version][sample_rate_index]
+    bitrate = (_BITRATES_V1 if version == 3 else _BITRATES_V2)[layer][bitrate_index - 1] * 1000
+    if layer == 3:  # Layer I
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if (layer == 2 or version == 3) else 576
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+    return frame_length, samples_per_frame, sample_rate, version, channel_mode
+
+def _id3v2_size(data):
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = 0
+        for byte in data[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+def _xing_frame_count(data, offset, version, channel_mode):
+    """첫 프레임의 Xing/Info 헤더에 적힌 전체 프레임 수를 반환한다. 없으면 None."""
+    mono = channel_mode == 3
+    if version == 3:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    tag_offset = offset + 4 + side_info
+    tag = data[tag_offset:tag_offset + 4]
+    if tag not in (b"Xing", b"Info") or len(data) < tag_offset + 12:
+        return None
+    flags = struct.unpack(">I", data[tag_offset + 4:tag_offset + 8])[0]
+    if not flags & 0x1:
+        return None
+    return struct.unpack(">I", data[tag_offset + 8:tag_offset + 12])[0]
+
+def mp3_duration_from_bytes(data):
+    """MP3 데이터의 재생 길이(초)를 반환한다. 프레임을 찾지 못하면 None."""
+    offset = _id3v2_size(data)
+    # 태그 뒤에 쓰레기 바이트가 있을 수 있으므로 첫 프레임 동기 신호를 찾는다
+    first = None
+    while offset + 4 <= len(data):
+        first = _parse_frame_header(data, offset)
+        if first:
+            next_offset = offset + first[0]
+            if next_offset >= len(data) or _parse_frame_header(data, next_offset):
+                break
+        first = None
+        offset += 1
+    if first is None:
+        return None
+
+    frame_length, samples_per_frame, sample_rate, version, channel_mode = first
+    xing_frames = _xing_frame_count(data, offset, version, channel_mode)
+    if xing_frames is not None:
+        return xing_frames * samples_per_frame / sample_rate
+
+    total_samples = 0
+    while True:
+        frame = _parse_frame_header(data, offset)
+        if frame is None:
+            break
+        total_samples += frame[1]
+        offset += frame[0]
+    return total_samples / sample_rate
+
+def mp3_duration_seconds(file_path):
+    """MP3 파일의 재생 길이(초)를 헤더만으로 계산한다. 해석할 수 없으면 None."""
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, "rb") as f:
+        return mp3_duration_from_bytes(f.read())
+
+def wav_duration_seconds(file_path):
+    """WAV 파일의 재생 길이(초)를 헤더만으로 계산한다. 해석할 수 없으면 None."""
+    try:
+        with wave.open(file_path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (OSError, EOFError, wave.Error):
+        return None
+
+def audio_duration_seconds(file_path):
+    """확장자에 따라 MP3/WAV 헤더를 읽어 재생 길이(초)를 반환한다."""
+    if file_path.lower().endswith(".wav"):
+        return wav_duration_seconds(file_path)
+    return mp3_duration_seconds(file_path)
+
+def split_wav_bytes(wav_bytes, boundaries_seconds):
+    """WAV 데이터를 [(시작 초, 끝 초 또는 None), ...] 구간별 WAV 데이터로 자른다.
+    끝이 None이면 파일 끝까지. 반환값: [(WAV bytes, 길이(초)), ...]"""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+        params = wav.getparams()
+        frames = wav.readframes(params.nframes)
+    frame_size = params.sampwidth * params.nchannels
+    total_frames = len(frames) // frame_size
+    segments = []
+    for start_seconds, end_seconds in boundaries_seconds:
+        start_frame = min(total_frames, max(0, round(start_seconds * params.framerate)))
+        end_frame = total_frames if end_seconds is None else min(total_frames, round(end_seconds * params.framerate))
+        end_frame = max(start_frame, end_frame)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as out:
+            out.setnchannels(params.nchannels)
+            out.setsampwidth(params.sampwidth)
+            out.setframerate(params.framerate)
+            out.writeframes(frames[start_frame * frame_size:end_frame * frame_size])
+        segments.append((buffer.getvalue(), (end_frame - start_frame) / params.framerate))
+    return segments
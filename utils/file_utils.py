@@ -1,5 +1,14 @@
 import os
+import time
 import shutil
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
 
 def clear_folder_contents(folder_path):
     if not os.path.exists(folder_path):
@@ -28,4 +37,38 @@ def save_text_to_file(text_content, file_path):
             f.write(text_content)
         print(f"텍스트를 파일로 저장했습니다: {file_path}")
     except Exception as e:
-        print(f"텍스트 파일 저장 중 오류 발생 ({file_path}): {e}")
\ No newline at end of file
+        print(f"텍스트 파일 저장 중 오류 발생 ({file_path}): {e}")
+
+def file_sha256(file_path):
+    """파일 내용의 sha256 (1MB 단위로 읽어 메모리 사용을 제한)."""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+@contextmanager
+def interprocess_lock(lock_path):
+    """lock_path 파일로 프로세스 간 배타 잠금을 건다 (배치 워커 여러 개가 같은 파일을 읽고-병합-교체할 때).
+    POSIX는 fcntl.flock, Windows는 msvcrt.locking을 쓴다. 같은 프로세스의 스레드끼리는 따로 잠가야 한다."""
+    ensure_folder_exists(os.path.dirname(lock_path))
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            return
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_REVALIDATE_AFTER_SECONDS
+from utils.file_utils import ensure_folder_exists, interprocess_lock
+
+# 콘텐츠 해시(sha256)로 주소가 정해지는 블롭 저장소.
+# index.json 은 URL -> {sha256, ext, etag, last_modified, checked_at, size} 매핑을 보관한다.
+_INDEX_FILE_NAME = "index.json"
+_INDEX_LOCK_FILE_NAME = "index.json.lock" # 배치 워커 프로세스 간 인덱스 병합-저장 잠금
+_BLOBS_DIR_NAME = "blobs"
+
+_index_lock = threading.Lock()
+_index = None
+_dirty_urls = set()
+_url_locks = {}
+
+def _index_path():
+    return os.path.join(IMAGE_CACHE_DIR, _INDEX_FILE_NAME)
+
+def _read_index_file():
+    try:
+        with open(_index_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"이미지 캐시 인덱스 읽기 실패, 빈 인덱스로 시작합니다: {e}")
+        return {}
+
+def _load_index():
+    global _index
+    if _index is None:
+        _index = _read_index_file()
+    return _index
+
+def url_lock(url):
+    """같은 URL을 여러 스레드가 동시에 받아오지 않도록 URL별 잠금을 반환한다."""
+    with _index_lock:
+        if url not in _url_locks:
+            _url_locks[url] = threading.Lock()
+        return _url_locks[url]
+
+def blob_path(sha256_hex, ext):
+    return os.path.join(IMAGE_CACHE_DIR, _BLOBS_DIR_NAME, sha256_hex[:2], f"{sha256_hex}{ext}")
+
+def get_entry(url):
+    """URL에 대한 캐시 항목을 반환한다. 블롭 파일이 사라졌으면 None."""
+    with _index_lock:
+        entry = _load_index().get(url)
+    if entry and os.path.exists(blob_path(entry["sha256"], entry["ext"])):
+        return dict(entry)
+    return None
+
+def is_fresh(entry):
+    return (time.time() - entry.get("checked_at", 0)) < IMAGE_CACHE_REVALIDATE_AFTER_SECONDS
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"): headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"): headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+def mark_revalidated(url):
+    with _index_lock:
+        entry = _load_index().get(url)
+        if entry:
+            entry["checked_at"] = time.time()
+            _dirty_urls.add(url)
+
+def store_stream(url, chunks, ext, etag=None, last_modified=None):
+    """청크 이터레이터를 해시하면서 저장하고 캐시 항목을 반환한다.
+    같은 내용의 블롭이 이미 있으면 새로 쓰지 않는다."""
+    tmp_dir = os.path.join(IMAGE_CACHE_DIR, "tmp")
+    ensure_folder_exists(tmp_dir)
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=ext)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                if not chunk: continue
+                hasher.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha256_hex = hasher.hexdigest()
+        final_path = blob_path(sha256_hex, ext)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+        else:
+            ensure_folder_exists(os.path.dirname(final_path))
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, final_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    entry = {"sha256": sha256_hex, "ext": ext, "etag": etag, "last_modified": last_modified,
+             "checked_at": time.time(), "size": size}
+    with _index_lock:
+        _load_index()[url] = entry
+        _dirty_urls.add(url)
+    return dict(entry)
+
+def link_blob_to(entry, dest_path):
+    """캐시 블롭을 작업 폴더로 하드링크한다. 하드링크가 불가능하면 복사한다."""
+    src_path = blob_path(entry["sha256"], entry["ext"])
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(src_path, dest_path)
+    except OSError:
+        shutil.copy2(src_path, dest_path)
+    return dest_path
+
+def save_index():
+    """변경된 항목만 디스크의 최신 인덱스에 병합하여 원자적으로 저장한다.
+    읽기-병합-교체 동안 파일 잠금을 잡아, 동시에 저장하는 다른 워커 프로세스의 항목을 덮어쓰지 않는다."""
+    with _index_lock:
+        if not _dirty_urls:
+            return
+        ensure_folder_exists(IMAGE_CACHE_DIR)
+        with interprocess_lock(os.path.join(IMAGE_CACHE_DIR, _INDEX_LOCK_FILE_NAME)):
+            on_disk = _read_index_file()
+            for url in _dirty_urls:
+                on_disk[url] = _index[url]
+            fd, tmp_path = tempfile.mkstemp(dir=IMAGE_CACHE_DIR, suffix=".json")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(on_disk, f, ensure_ascii=False)
+            os.replace(tmp_path, _index_path())
+        _index.update(on_disk)
+        _dirty_urls.clear()
@@ -0,0 +1,77 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from utils.file_utils import ensure_folder_exists
+
+# 작업 폴더의 manifest.json 에 단계별 입력 지문 / 출력 / 상태를 기록한다.
+# 다시 실행할 때 입력 지문이 같고 출력 파일이 남아 있는 완료 단계는 건너뛴다.
+PIPELINE_STAGES = ("collect", "ocr", "narration", "scene_script", "tts", "render")
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+def fingerprint(*parts):
+    """JSON으로 직렬화 가능한 값들의 sha256 지문."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class JobManifest:
+    """작업 하나의 단계 기록. 단계마다 {"status", "inputs_fingerprint", "outputs", "files", 시각 정보}를 보관한다."""
+
+    def __init__(self, workspace):
+        self.path = os.path.join(workspace["root"], MANIFEST_FILE_NAME)
+        self.data = {"version": MANIFEST_VERSION, "job_id": workspace["job_id"],
+                     "target_url": workspace["target_url"], "stages": {}}
+        self._started = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    loaded = json.load(f)
+                if loaded.get("version") == MANIFEST_VERSION:
+                    self.data["stages"] = loaded.get("stages", {})
+            except (OSError, ValueError) as e:
+                print(f"manifest.json을 읽지 못해 새로 시작합니다: {e}")
+
+    def save(self):
+        ensure_folder_exists(os.path.dirname(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stage(self, stage_name):
+        return self.data["stages"].get(stage_name)
+
+    def completed_outputs(self, stage_name, inputs_fingerprint=None):
+        """완료된 단계의 출력을 반환한다. inputs_fingerprint를 주면 지문이 같을 때만.
+        기록된 출력 파일이 하나라도 없어졌으면 None."""
+        record = self.stage(stage_name)
+        if not record or record.get("status") != "completed":
+            return None
+        if inputs_fingerprint is not None and record.get("inputs_fingerprint") != inputs_fingerprint:
+            return None
+        if not all(os.path.exists(path) for path in record.get("files", [])):
+            return None
+        return record.get("outputs")
+
+    def mark_running(self, stage_name, inputs_fingerprint):
+        self.data["stages"][stage_name] = {"status": "running", "inputs_fingerprint": inputs_fingerprint,
+                                           "started_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+        self._started[stage_name] = time.monotonic()
+        self.save()
+
+    def _finish(self, stage_name, status, **fields):
+        record = self.data["stages"].setdefault(stage_name, {})
+        started = self._started.pop(stage_name, None)
+        record.update(status=status, finished_at=time.strftime("%Y-%m-%d %H:%M:%S"), **fields)
+        if started is not None:
+            record["elapsed_seconds"] = round(time.monotonic() - started, 2)
+        self.save()
+
+    def mark_completed(self, stage_name, outputs, files=()):
+        self._finish(stage_name, "completed", outputs=outputs, files=[path for path in files if path])
+
+    def mark_failed(self, stage_name, error):
+        self._finish(stage_name, "failed", error=error)
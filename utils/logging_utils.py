@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from utils.file_utils import ensure_folder_exists
+
+# 단계 -> 이미지별 OCR -> API 호출처럼 중첩되는 시간 구간(span)과 카운터를 기록한다.
+# span은 contextvars로 부모를 찾으므로, 스레드 풀에 넘기는 함수는 carry_context()로 감싸야 부모 span 아래에 기록된다.
+# 카운터(전송 바이트, API 호출/재시도, 캐시 적중 등)는 전체 합계와 함께 열려 있는 모든 상위 span에도 더해진다.
+# 기록은 JSON lines / Chrome trace-event 파일(chrome://tracing, Perfetto)로 내보낸다.
+
+_lock = threading.Lock()
+_span_ids = itertools.count(1)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_finished_spans = []
+_counters = {}
+_trace_started_at = time.perf_counter()
+
+class Span:
+    __slots__ = ("span_id", "name", "parent", "attrs", "counters", "thread_id", "thread_name",
+                 "started_at", "duration", "peak_rss_kb")
+
+    def __init__(self, name, parent, attrs):
+        self.span_id = next(_span_ids)
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.counters = {}
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.started_at = time.perf_counter()
+        self.duration = None
+        self.peak_rss_kb = None
+
+    def set(self, **attrs):
+        """span에 속성을 덧붙인다 (예: 결과 크기, 캐시 적중 여부)."""
+        self.attrs.update(attrs)
+
+    def to_dict(self):
+        return {"type": "span", "name": self.name, "span_id": self.span_id,
+                "parent_id": self.parent.span_id if self.parent else None,
+                "start_seconds": round(self.started_at - _trace_started_at, 6),
+                "duration_seconds": round(self.duration, 6) if self.duration is not None else None,
+                "thread_id": self.thread_id, "thread_name": self.thread_name,
+                "attrs": self.attrs, "counters": self.counters, "peak_rss_kb": self.peak_rss_kb}
+
+def peak_rss_kb():
+    """프로세스 최대 상주 메모리(KB). /proc의 VmHWM을 우선 사용하고, 없으면 getrusage. 측정할 수 없으면 None."""
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak // 1024 if sys.platform == "darwin" else peak # macOS는 bytes 단위
+    except (ImportError, OSError):
+        return None
+
+def _reset_peak_rss():
+    # 리눅스에서만 가능: VmHWM을 현재 RSS로 되돌려 단계별 최대값을 잴 수 있게 한다. 실패하면 프로세스 전체 최대값이 된다.
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def open_span(name, parent=None, reset_peak_rss=False, **attrs):
+    """with 블록에 묶이지 않는 span을 연다. 시작과 끝이 서로 다른 곳에 있는 구간용
+    (예: 음성 단계 중에 시작되는 렌더 작업을 렌더 단계로 집계). enter_span()으로 현재 span으로 삼고, close_span()으로 닫는다."""
+    if reset_peak_rss:
+        _reset_peak_rss()
+    return Span(name, parent, attrs)
+
+def close_span(current):
+    """span을 닫아 기록한다. 이미 닫힌 span이면 아무 일도 하지 않는다."""
+    with _lock:
+        if current.duration is not None:
+            return
+        current.duration = time.perf_counter() - current.started_at
+    current.peak_rss_kb = peak_rss_kb()
+    with _lock:
+        _finished_spans.append(current)
+
+@contextmanager
+def enter_span(current, close=True):
+    """이미 연 span을 with 블록 동안 현재 span으로 삼는다. close=True면 블록이 끝날 때 닫는다."""
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        if close:
+            close_span(current)
+
+@contextmanager
+def span(name, reset_peak_rss=False, **attrs):
+    """with span("ocr.image", file=...) as s: ... 형태로 구간을 기록한다.
+    reset_peak_rss=True면 (파이프라인 단계처럼) 이 구간 동안의 최대 메모리를 따로 잰다."""
+    with enter_span(open_span(name, _current_span.get(), reset_peak_rss, **attrs)) as current:
+        yield current
+
+def current_span():
+    return _current_span.get()
+
+def increment(counter_name, value=1):
+    """카운터를 올린다. 전체 합계와 현재 span 및 그 상위 span 모두에 더해진다."""
+    if not value:
+        return
+    with _lock:
+        _counters[counter_name] = _counters.get(counter_name, 0) + value
+        ancestor = _current_span.get()
+        while ancestor is not None:
+            ancestor.counters[counter_name] = ancestor.counters.get(counter_name, 0) + value
+            ancestor = ancestor.parent
+
+def carry_context(func):
+    """현재 span 컨텍스트를 유지한 채 다른 스레드에서 func를 실행하도록 감싼다 (executor.submit/map 용)."""
+    context = contextvars.copy_context()
+    def _run_in_context(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs) # 같은 Context는 여러 스레드에서 동시에 들어갈 수 없으므로 복사
+    return _run_in_context
+
+def reset_trace():
+    """기록을 비운다. 작업(상품) 하나를 시작할 때 호출한다."""
+    global _trace_started_at
+    with _lock:
+        _finished_spans.clear()
+        _counters.clear()
+        _trace_started_at = time.perf_counter()
+
+def get_counters():
+    with _lock:
+        return dict(_counters)
+
+def get_finished_spans():
+    with _lock:
+        return [s.to_dict() for s in sorted(_finished_spans, key=lambda s: s.started_at)]
+
+def spans_outside(records, span_name, ancestor_name):
+    """span 기록(get_finished_spans/trace.jsonl의 dict) 중 이름이 span_name인데 상위에 ancestor_name span이
+    없는 것들을 반환한다 (예: 세그먼트 인코딩이 stage.render로 집계되는지 확인)."""
+    by_id = {record["span_id"]: record for record in records if record.get("type", "span") == "span"}
+    outside = []
+    for record in by_id.values():
+        if record["name"] != span_name:
+            continue
+        parent = by_id.get(record["parent_id"])
+        while parent is not None and parent["name"] != ancestor_name:
+            parent = by_id.get(parent["parent_id"])
+        if parent is None:
+            outside.append(record)
+    return outside
+
+def export_jsonl(output_path):
+    """span 하나당 한 줄, 마지막 줄은 전체 카운터."""
+    ensure_folder_exists(os.path.dirname(output_path))
+    with open(output_path, "w", encoding="utf-8") as f:
+        for record in get_finished_spans():
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        f.write(json.dumps({"type": "counters", "counters": get_counters(), "peak_rss_kb": peak_rss_kb()},
+                           ensure_ascii=False) + "\n")
+    return output_path
+
+def export_chrome_trace(output_path):
+    """Chrome trace-event 형식(JSON)으로 내보낸다. chrome://tracing 또는 ui.perfetto.dev에서 열 수 있다."""
+    pid = os.getpid()
+    events, thread_names = [], {}
+    for record in get_finished_spans():
+        thread_names[record["thread_id"]] = record["thread_name"]
+        args = dict(record["attrs"], **record["counters"])
+        if record["peak_rss_kb"] is not None:
+            args["peak_rss_kb"] = record["peak_rss_kb"]
+        events.append({"name": record["name"], "cat": record["name"].split(".")[0], "ph": "X",
+                       "ts": round(record["start_seconds"] * 1e6), "dur": round((record["duration_seconds"] or 0) * 1e6),
+                       "pid": pid, "tid": record["thread_id"], "args": args})
+    for thread_id, thread_name in thread_names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id, "args": {"name": thread_name}})
+    ensure_folder_exists(os.path.dirname(output_path))
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"counters": get_counters()}},
+                  f, ensure_ascii=False, default=str)
+    return output_path
+
+def print_trace_summary(span_prefix="stage."):
+    """최상위 단계 span별 소요 시간 / 최대 메모리 / 카운터를 출력한다."""
+    stage_spans = [s for s in get_finished_spans() if s["name"].startswith(span_prefix)]
+    if not stage_spans:
+        return
+    print("\n--- 단계별 소요 시간 ---")
+    for record in stage_spans:
+        rss = f", 최대 메모리 {record['peak_rss_kb'] / 1024:.0f} MB" if record["peak_rss_kb"] else ""
+        counters = ", ".join(f"{k}={v}" for k, v in sorted(record["counters"].items()) if "." not in k) # 세부 항목은 trace 파일에서
+        print(f"  {record['name'][len(span_prefix):]:<13} {record['duration_seconds']:8.2f} 초{rss}"
+              f"{' | ' + counters if counters else ''}")
@@ -0,0 +1,77 @@
+import time
+import random
+import threading
+
+from utils.logging_utils import increment
+
+# google.api_core.exceptions 의 클래스명 기준으로 재시도 대상 오류를 판별한다.
+# (google 패키지를 여기서 import 하지 않기 위해 이름으로 비교)
+_RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "GatewayTimeout", "BadGateway", "Aborted", "RetryError",
+    "ConnectionError", "Timeout", "TimeoutError", "ReadTimeout", "ConnectTimeout",
+}
+
+class TokenBucket:
+    """분당 허용 횟수(rate_per_minute)로 채워지는 토큰 버킷. 스레드 안전하다."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def acquire(self, tokens=1):
+        """토큰이 모일 때까지 대기한 뒤 차감한다. 대기한 시간(초)을 반환한다."""
+        if self.rate_per_second <= 0:
+            return 0.0
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                sleep_for = (tokens - self._tokens) / self.rate_per_second
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+    def consume(self, tokens):
+        """기다리지 않고 차감한다 (사후 정산용). 잔량이 음수가 되면 이후 acquire가 그만큼 더 기다린다."""
+        if self.rate_per_second <= 0 or not tokens:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= tokens
+
+def is_retryable_api_error(error):
+    if type(error).__name__ in _RETRYABLE_ERROR_NAMES:
+        return True
+    message = str(error)
+    return "429" in message or "quota" in message.lower() or "503" in message
+
+def call_with_retry(func, max_attempts, base_delay, max_delay, on_retry=None):
+    """func()를 호출하고, 재시도 대상 오류면 지수 백오프(+지터) 후 다시 시도한다.
+    on_retry(attempt, error, delay)는 재시도 직전에 호출된다. 시도/재시도 횟수는 api_calls/api_retries 카운터에 기록된다."""
+    attempt = 1
+    while True:
+        increment("api_calls")
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= max_attempts or not is_retryable_api_error(e):
+                raise
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+            delay = delay * (0.5 + random.random() / 2)
+            increment("api_retries")
+            if on_retry:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
+            attempt += 1
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from utils.file_utils import ensure_folder_exists
+from utils.logging_utils import increment
+
+class SQLiteCache:
+    """SQLite 파일 하나에 저장되는 키-값 캐시.
+    값은 bytes, 부가 정보(meta)는 JSON으로 저장하며, 전체 크기가 max_bytes를 넘으면
+    가장 오래 사용되지 않은 항목부터 지운다. 여러 스레드/프로세스에서 함께 써도 된다."""
+
+    def __init__(self, db_path, max_bytes):
+        ensure_folder_exists(os.path.dirname(db_path))
+        self.db_path = db_path
+        self.name = os.path.splitext(os.path.basename(db_path))[0] # 카운터 이름용 (예: "ocr_cache")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, meta TEXT,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+
+    def get(self, key):
+        """(value, meta) 튜플 또는 None을 반환한다."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, meta FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.hits += 1
+        outcome = "cache_hits" if row is not None else "cache_misses"
+        increment(outcome)
+        increment(f"{outcome}.{self.name}")
+        if row is None:
+            return None
+        value, meta = row
+        return bytes(value), (json.loads(meta) if meta else {})
+
+    def put(self, key, value, meta=None):
+        size = len(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, meta, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), json.dumps(meta, ensure_ascii=False) if meta else None,
+                 size, time.time()))
+            self._evict_locked()
+
+    def get_json(self, key):
+        cached = self.get(key)
+        return json.loads(cached[0].decode("utf-8")) if cached else None
+
+    def put_json(self, key, obj):
+        self.put(key, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def _evict_locked(self):
+        total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY last_access ASC").fetchall():
+            if total_bytes <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total_bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": entries, "bytes": total_bytes}
@@ -0,0 +1,144 @@
+import time
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.logging_utils import span, enter_span, carry_context
+
+# 의존 관계가 있는 작업들을 스레드 풀에서 실행하는 작은 스케줄러.
+# 선행 작업이 모두 끝난 작업은 바로 시작되고, resource 별 동시 실행 수를 제한할 수 있다.
+# (예: "tts" 요청 4개, "encode" ffmpeg 8개를 동시에 돌리면서 서로 기다리지 않게)
+
+class DependencyFailedError(Exception):
+    """선행 작업이 실패해서 실행하지 않은 작업의 결과."""
+
+class TaskGraph:
+    def __init__(self, max_workers, resource_limits=None):
+        self.max_workers = max(1, max_workers)
+        self.resource_limits = dict(resource_limits or {})
+        self._tasks = {}
+        self._order = []
+        self._lock = threading.Lock()
+        self._running_by_resource = {}
+        self._ready = [] # 자원 한도 때문에 대기 중인 작업 이름 (추가 순서 유지)
+        self._executor = None
+        self._started = False
+
+    def add(self, name, func, deps=(), resource=None, parent_span=None):
+        """func(dep_results)는 {선행 작업 이름: 결과} dict를 받는다. 작업의 Future를 반환한다.
+        parent_span을 주면 작업 span이 start()를 부른 쪽 span 대신 그 span 아래에 기록된다."""
+        if self._started:
+            raise RuntimeError("TaskGraph가 시작된 뒤에는 작업을 추가할 수 없습니다.")
+        if name in self._tasks:
+            raise ValueError(f"중복된 작업 이름: {name}")
+        missing = [dep for dep in deps if dep not in self._tasks]
+        if missing:
+            raise ValueError(f"'{name}'의 선행 작업이 먼저 추가되어야 합니다: {missing}")
+        task = {"name": name, "func": func, "deps": list(deps), "resource": resource, "parent_span": parent_span,
+                "future": Future(), "waiting": len(deps), "dependents": [],
+                "queued_at": None, "started_at": None, "finished_at": None}
+        for dep in deps:
+            self._tasks[dep]["dependents"].append(name)
+        self._tasks[name] = task
+        self._order.append(name)
+        return task["future"]
+
+    def start(self):
+        """작업 실행을 시작하고 바로 반환한다. 결과는 result()/wait()로 받는다."""
+        self._started = True
+        self._started_at = time.perf_counter()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._run_in_context = carry_context(self._run_task) # 작업 span이 start()를 부른 쪽 span 아래에 기록되도록
+        with self._lock:
+            for name in self._order:
+                if self._tasks[name]["waiting"] == 0:
+                    self._enqueue_locked(name)
+            self._dispatch_locked()
+        return self
+
+    def _enqueue_locked(self, name):
+        self._tasks[name]["queued_at"] = time.perf_counter()
+        self._ready.append(name)
+
+    def _dispatch_locked(self):
+        still_waiting = []
+        for name in self._ready:
+            resource = self._tasks[name]["resource"]
+            limit = self.resource_limits.get(resource)
+            running = self._running_by_resource.get(resource, 0)
+            if limit is not None and running >= limit:
+                still_waiting.append(name)
+                continue
+            self._running_by_resource[resource] = running + 1
+            self._executor.submit(self._run_in_context, name)
+        self._ready = still_waiting
+
+    def _run_task(self, name):
+        task = self._tasks[name]
+        task["started_at"] = time.perf_counter()
+        try:
+            dep_results = {dep: self._tasks[dep]["future"].result() for dep in task["deps"]}
+            parent = task["parent_span"]
+            with enter_span(parent, close=False) if parent is not None else nullcontext(), \
+                    span(f"task.{name}", resource=task["resource"]):
+                result = task["func"](dep_results)
+        except BaseException as e:
+            task["finished_at"] = time.perf_counter()
+            self._complete(name, error=e)
+        else:
+            task["finished_at"] = time.perf_counter()
+            self._complete(name, result=result)
+
+    def _complete(self, name, result=None, error=None):
+        task = self._tasks[name]
+        with self._lock:
+            if task["started_at"] is not None:
+                self._running_by_resource[task["resource"]] -= 1
+            if error is None:
+                task["future"].set_result(result)
+            else:
+                task["future"].set_exception(error)
+            newly_ready, failed_dependents = [], []
+            for dependent in task["dependents"]:
+                dependent_task = self._tasks[dependent]
+                if dependent_task["future"].done():
+                    continue
+                if error is not None:
+                    failed_dependents.append(dependent)
+                    continue
+                dependent_task["waiting"] -= 1
+                if dependent_task["waiting"] == 0:
+                    newly_ready.append(dependent)
+            for dependent in newly_ready:
+                self._enqueue_locked(dependent)
+            self._dispatch_locked()
+        for dependent in failed_dependents: # 실패는 후속 작업으로 전파 (실행하지 않음)
+            self._complete(dependent, error=DependencyFailedError(f"선행 작업 '{name}' 실패: {error}"))
+
+    def result(self, name, timeout=None):
+        """작업이 끝날 때까지 기다렸다가 결과를 반환한다 (실패했으면 그 예외를 다시 발생)."""
+        return self._tasks[name]["future"].result(timeout)
+
+    def wait(self):
+        """모든 작업이 끝날 때까지 기다리고 풀을 정리한다. 실패한 작업의 {이름: 예외}를 반환한다."""
+        errors = {}
+        for name in self._order:
+            error = self._tasks[name]["future"].exception()
+            if error is not None:
+                errors[name] = error
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        return errors
+
+    def timings(self):
+        """작업별 (대기, 실행) 시간과 전체 경과 시간 (초)."""
+        per_task = {}
+        for name in self._order:
+            task = self._tasks[name]
+            if task["started_at"] is None or task["finished_at"] is None:
+                continue
+            per_task[name] = {"queued_seconds": round(task["started_at"] - (task["queued_at"] or task["started_at"]), 3),
+                              "run_seconds": round(task["finished_at"] - task["started_at"], 3),
+                              "finished_at_seconds": round(task["finished_at"] - self._started_at, 3)}
+        finished = [t["finished_at_seconds"] for t in per_task.values()]
+        return {"tasks": per_task, "elapsed_seconds": max(finished) if finished else 0.0}
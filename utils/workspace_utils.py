@@ -0,0 +1,27 @@
+import os
+import hashlib
+
+from config import JOBS_DIR
+from utils.file_utils import ensure_folder_exists
+
+def make_job_id(target_url):
+    """같은 상품 URL은 항상 같은 작업 ID(= 같은 작업 폴더)를 갖는다."""
+    return hashlib.sha1(target_url.encode("utf-8")).hexdigest()[:12]
+
+def create_job_workspace(target_url, job_id=None):
+    """작업별로 독립된 폴더 묶음을 만들고 경로 dict를 반환한다.
+    구조는 전역 output 폴더와 같다: images_raw, extracted_texts, audio_clips, videos."""
+    job_id = job_id or make_job_id(target_url)
+    root = os.path.join(JOBS_DIR, job_id)
+    workspace = {
+        "job_id": job_id,
+        "target_url": target_url,
+        "root": root,
+        "images_raw": os.path.join(root, "images_raw"),
+        "extracted_texts": os.path.join(root, "extracted_texts"),
+        "audio_clips": os.path.join(root, "audio_clips"),
+        "videos": os.path.join(root, "videos"),
+    }
+    for key in ("images_raw", "extracted_texts", "audio_clips", "videos"):
+        ensure_folder_exists(workspace[key])
+    return workspace